@@ -0,0 +1,163 @@
+"""
+Measure throughput of the compiled job-relevance classifier against the
+original regex loop. tests/test_classifier.py checks on the same corpus that
+both give the same answers.
+
+    python -m bench.bench_classifier --corpus-size 1000 --repeat 1
+"""
+import re
+import time
+import random
+import argparse
+import contextlib
+import io
+
+from .common import use_fake_environment
+
+def legacy_is_possibly_job_related(email_subject: str, email_text: str) -> bool:
+    """The original per-call regex loop, kept as the reference implementation"""
+    text = (email_subject + " " + email_text).lower()
+
+    exclude_patterns = [
+        r"github\.com/.*/issues/\d+",
+        r"lease\s+agreement",
+        r"rental\s+application",
+        r"apartment\s+lease",
+        r"password\s+reset",
+        r"payment\s+confirmation",
+        r"job\s+alert\s+digest",
+        r"similar\s+jobs\s+for\s+you",
+        r"weekly\s+job\s+matches",
+        r"new\s+jobs\s+in\s+your\s+area"
+    ]
+
+    if any(re.search(pattern, text, re.IGNORECASE) for pattern in exclude_patterns):
+        return False
+
+    application_patterns = [
+        (r"thank.*for.*apply(ing|ication)", "application confirmation"),
+        (r"application.*received|received.*application", "application received"),
+        (r"interview.*schedule|schedule.*interview", "interview invitation"),
+        (r"next.*steps.*application|application.*next.*steps", "next steps"),
+        (r"offer.*letter|job\s+offer", "offer"),
+        (r"unfortunately.*not.*moving.*forward|regret.*inform", "rejection"),
+        (r"coding.*assessment|technical.*challenge", "assessment"),
+        (r"background.*check|employment.*verification", "background check"),
+        (r"application.*status|status.*update", "status update"),
+        (r"moved.*forward|advance.*next.*round", "advancing"),
+        (r"welcome.*team", "offer acceptance"),
+        (r"internship", "internship"),
+    ]
+
+    for pattern, category in application_patterns:
+        if re.search(pattern, text, re.IGNORECASE):
+            return True
+
+    if ("application" in text or "applied" in text) and \
+       not any(word in text for word in ["lease", "rental", "credit", "loan"]) and \
+       any(word in text for word in ["position", "role", "opportunity", "candidacy", "hiring"]):
+        return True
+
+    return False
+
+SUBJECTS = [
+    "Thank you for applying to Stripe",
+    "Thanks for your application",
+    "Your application was received",
+    "We received your application for Software Engineer",
+    "Interview schedule for next week",
+    "Please schedule your interview",
+    "Next steps in your application",
+    "Your job offer from Acme",
+    "Offer letter attached",
+    "Update on your candidacy",
+    "Unfortunately we are not moving forward",
+    "We regret to inform you",
+    "Coding assessment invitation",
+    "Your technical challenge",
+    "Background check authorization",
+    "Employment verification request",
+    "Application status update",
+    "You've moved forward to the next round",
+    "Welcome to the team!",
+    "Summer 2025 Internship",
+    "Your lease agreement is ready",
+    "Rental application approved",
+    "Password reset request",
+    "Payment confirmation #1234",
+    "Job alert digest: 25 new roles",
+    "Similar jobs for you",
+    "Weekly job matches",
+    "New jobs in your area",
+    "Re: [org/repo] Fix flaky test (#42)",
+    "Your order has shipped",
+    "Lunch on Friday?",
+    "Newsletter: October edition",
+    "Credit card application received",
+    "Loan application status",
+    "You applied for the Data Analyst position",
+    "Hiring update",
+    "",
+]
+
+BODIES = [
+    "",
+    "Hi there,\nThank you for applying. We will review your application and get back to you.",
+    "We'd like to schedule an interview with you for the Backend Engineer role.",
+    "Unfortunately, we will not be moving forward with your candidacy at this time.",
+    "Please complete the coding assessment within 5 days.",
+    "See https://github.com/org/repo/issues/123 for details.",
+    "Your apartment lease renewal is attached.",
+    "Thanks for applying\nfor the role.\nApplying takes time.",
+    "We are hiring! Check out this opportunity, no application needed.",
+    "Your loan application for the position of homeowner was approved.",
+    "THANK YOU FOR APPLYING TO OUR INTERNSHIP PROGRAM",
+    "Click here to unsubscribe. Privacy policy. All rights reserved.",
+]
+
+def build_corpus(size: int, seed: int = 7) -> list:
+    """Every subject/body pair plus random long HTML-derived bodies"""
+    corpus = [(subject, body) for subject in SUBJECTS for body in BODIES]
+
+    rng = random.Random(seed)
+    filler_words = ("thank", "for", "the", "team", "application", "status", "we", "next", "and",
+                    "offer", "interview", "view", "in", "browser", "unsubscribe", "role")
+    while len(corpus) < size:
+        lines = [
+            " ".join(rng.choice(filler_words) for _ in range(rng.randint(20, 400)))
+            for _ in range(rng.randint(1, 30))
+        ]
+        corpus.append((rng.choice(SUBJECTS), "\n".join(lines)))
+    return corpus
+
+def measure(function, corpus: list, repeat: int) -> float:
+    """Return emails per second, calling with subject only and then subject plus body like get_emails"""
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for subject, body in corpus:
+            function(subject, "")
+            function(subject, body)
+    return len(corpus) * repeat / (time.perf_counter() - started)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--corpus-size", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=1)
+    args = parser.parse_args()
+
+    use_fake_environment()
+    from src.gmail_client import is_possibly_job_related
+
+    corpus = build_corpus(args.corpus_size)
+
+    # Silence the per-match prints so they don't dominate the measurement
+    with contextlib.redirect_stdout(io.StringIO()):
+        legacy_rate = measure(legacy_is_possibly_job_related, corpus, args.repeat)
+        compiled_rate = measure(is_possibly_job_related, corpus, args.repeat)
+
+    print(f"corpus={len(corpus)}")
+    print(f"legacy:   {legacy_rate:,.0f} emails/s")
+    print(f"compiled: {compiled_rate:,.0f} emails/s ({compiled_rate / legacy_rate:.1f}x)")
+
+if __name__ == "__main__":
+    main()
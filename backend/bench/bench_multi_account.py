@@ -0,0 +1,139 @@
+"""
+Load test the scan scheduler with many fake mailboxes scanning at once.
+A few large mailboxes run alongside many small ones, and the report shows
+how long the small ones take to finish, which is what fair scheduling is for.
+
+    python -m bench.bench_multi_account --accounts 50 --large-accounts 2 --rpm 600
+    python -m bench.bench_multi_account --accounts 50 --large-accounts 2 --rpm 600 --unfair
+"""
+import io
+import os
+import sys
+import time
+import asyncio
+import argparse
+import statistics
+import tracemalloc
+import contextlib
+
+from .common import use_fake_environment
+from .fake_llm_server import FakeLLMHandler, start_server
+from .fakes import Recorder, FakeSupabase, FakeGmailService, synthetic_mailbox
+
+START_DATE = "2024-01-01"
+END_DATE = "2024-07-01"
+
+async def run_load_test(args, services: dict) -> dict:
+    from src import scan_jobs
+    from src.pipeline import RateLimiter
+    from src.scheduler import ScanScheduler
+
+    class UnfairScheduler(ScanScheduler):
+        """Every account shares the Groq limiter first come, first served"""
+        def limiter_for(self, account: str):
+            return self.fair_limiter.limiter
+
+    scheduler_class = UnfairScheduler if args.unfair else ScanScheduler
+    scheduler = scheduler_class(
+        max_concurrent=args.max_concurrent,
+        limiter=RateLimiter(requests_per_minute=args.rpm, tokens_per_minute=args.tpm),
+        gmail_quota_per_second=args.gmail_quota,
+    )
+
+    scan_jobs.get_service = lambda token: services[token]
+    worker = scan_jobs.ScanWorker(scheduler)
+    await worker.start()
+
+    started = time.perf_counter()
+    jobs = {}
+    for token in services:
+        job = await worker.submit(token, START_DATE, END_DATE)
+        jobs[job.id] = token
+
+    finished_at = {}
+    peak_running = 0
+    while len(finished_at) < len(jobs):
+        await asyncio.sleep(0.05)
+        peak_running = max(peak_running, len(scheduler.running))
+        for job_id in jobs:
+            job = worker.jobs[job_id]
+            if job_id not in finished_at and job.status in scan_jobs.FINISHED_STATUSES:
+                finished_at[job_id] = time.perf_counter() - started
+
+    await worker.stop()
+    return {
+        "elapsed": time.perf_counter() - started,
+        "finished_at": {jobs[job_id]: seconds for job_id, seconds in finished_at.items()},
+        "statuses": [worker.jobs[job_id].status for job_id in jobs],
+        "processed": sum(worker.jobs[job_id].processed for job_id in jobs),
+        "peak_running": peak_running,
+    }
+
+def _summary(values: list) -> str:
+    if not values:
+        return "-"
+    ordered = sorted(values)
+    p99 = ordered[min(len(ordered) - 1, int(round(0.99 * (len(ordered) - 1))))]
+    return f"p50 {statistics.median(ordered):.1f}s  p99 {p99:.1f}s  max {ordered[-1]:.1f}s"
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--accounts", type=int, default=50)
+    parser.add_argument("--large-accounts", type=int, default=2)
+    parser.add_argument("--emails", type=int, default=200, help="Messages per small mailbox")
+    parser.add_argument("--large-emails", type=int, default=5000, help="Messages per large mailbox")
+    parser.add_argument("--max-concurrent", type=int, default=8, help="Scans running at once")
+    parser.add_argument("--rpm", type=int, default=600, help="Shared Groq requests per minute")
+    parser.add_argument("--tpm", type=int, default=10**7, help="Shared Groq tokens per minute")
+    parser.add_argument("--gmail-quota", type=int, default=250, help="Gmail quota units per second per account")
+    parser.add_argument("--gmail-latency", type=float, default=0.05)
+    parser.add_argument("--llm-latency", type=float, default=0.2)
+    parser.add_argument("--db-latency", type=float, default=0.005)
+    parser.add_argument("--unfair", action="store_true", help="Share the Groq limiter without round-robin")
+    parser.add_argument("--verbose", action="store_true", help="Show the pipeline's own output")
+    args = parser.parse_args()
+
+    os.environ["LLM_CACHE_DISABLED"] = "true"
+    server = start_server(latency=args.llm_latency)
+    os.environ["GROQ_BASE_URL"] = f"http://127.0.0.1:{server.server_port}"
+    use_fake_environment()
+
+    from src import clients
+    from src.storage import SupabaseStorage
+
+    recorder = Recorder()
+    clients.set_supabase(FakeSupabase(recorder, latency=args.db_latency))
+    clients.set_storage(SupabaseStorage())
+
+    services = {}
+    for index in range(args.accounts):
+        size = args.large_emails if index < args.large_accounts else args.emails
+        messages = synthetic_mailbox(size, seed=index, id_prefix=f"acct{index:03d}-")
+        services[f"token-{index}"] = FakeGmailService(
+            messages, recorder, latency=args.gmail_latency, email_address=f"user{index}@example.com"
+        )
+    large_tokens = {f"token-{index}" for index in range(args.large_accounts)}
+    total_messages = sum(len(service.mailbox) for service in services.values())
+
+    tracemalloc.start()
+    output = sys.stdout if args.verbose else io.StringIO()
+    with contextlib.redirect_stdout(output):
+        result = asyncio.run(run_load_test(args, services))
+    peak_memory = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    server.shutdown()
+
+    small = [seconds for token, seconds in result["finished_at"].items() if token not in large_tokens]
+    large = [seconds for token, seconds in result["finished_at"].items() if token in large_tokens]
+
+    print(f"{'unfair' if args.unfair else 'fair'} scheduling, {args.accounts} accounts, "
+          f"{total_messages} messages, max {args.max_concurrent} concurrent scans")
+    print(f"elapsed {result['elapsed']:.1f}s, {total_messages / result['elapsed']:.0f} emails/s, "
+          f"{result['processed']} parsed, {FakeLLMHandler.calls} LLM calls")
+    print(f"small mailboxes finished: {_summary(small)}")
+    print(f"large mailboxes finished: {_summary(large)}")
+    print(f"peak concurrent scans {result['peak_running']}, peak traced memory {peak_memory / 2**20:.1f} MB")
+    print(f"job statuses: { {status: result['statuses'].count(status) for status in set(result['statuses'])} }")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""
+Benchmark the concurrent AI parsing pipeline against the fake LLM server.
+
+    python -m bench.bench_parse_pipeline --emails 200 --latency 0.5 --workers 1 4 8 --batch-sizes 1 8
+"""
+import os
+import time
+import asyncio
+import argparse
+
+from .common import use_fake_environment
+from .fake_llm_server import FakeLLMHandler, start_server
+
+def synthetic_emails(count: int) -> list:
+    return [
+        {
+            "body": f"Company: Company {i % 50}\nThank you for applying to the Software Engineer role.\nWe received your application #{i}.",
+            "date": "2024-01-15",
+            "subject": "Thank you for applying",
+            "msg_id": f"msg-{i}",
+        }
+        for i in range(count)
+    ]
+
+async def run(emails: list, workers: int, batch_max_emails: int) -> float:
+    from src.pipeline import RateLimiter, parse_emails
+
+    async def source():
+        for email in emails:
+            yield email
+
+    # Effectively unlimited so the benchmark measures concurrency, not the quota
+    limiter = RateLimiter(requests_per_minute=10**6, tokens_per_minute=10**9)
+
+    started = time.perf_counter()
+    count = 0
+    async for _ in parse_emails(source(), workers=workers, limiter=limiter, batch_max_emails=batch_max_emails):
+        count += 1
+    return time.perf_counter() - started
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--emails", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.5)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 4, 8])
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 8], help="Max emails per prompt")
+    parser.add_argument("--cache", action="store_true", help="Keep the LLM result cache enabled")
+    args = parser.parse_args()
+
+    if not args.cache:
+        os.environ["LLM_CACHE_DISABLED"] = "true"
+    # Every synthetic email should reach the fake LLM
+    os.environ["LOCAL_CLASSIFIER_DISABLED"] = "true"
+    os.environ["NEAR_DUP_DISABLED"] = "true"
+
+    server = start_server(latency=args.latency, error_rate=args.error_rate)
+    os.environ["GROQ_BASE_URL"] = f"http://127.0.0.1:{server.server_port}"
+    use_fake_environment()
+
+    emails = synthetic_emails(args.emails)
+    for batch_size in args.batch_sizes:
+        for workers in args.workers:
+            FakeLLMHandler.calls = 0
+            elapsed = asyncio.run(run(emails, workers, batch_size))
+            print(f"batch={batch_size:<3} workers={workers:<3} emails={len(emails)} llm_calls={FakeLLMHandler.calls} "
+                  f"elapsed={elapsed:.2f}s rate={len(emails) / elapsed:.1f} emails/s")
+
+    server.shutdown()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,244 @@
+"""
+Replay a mailbox through the full scan pipeline (get_emails, parsing,
+insert_jobs) against local fakes of Gmail, Groq and Supabase, and report
+throughput, per-stage latency, API call counts and peak memory.
+
+    python -m bench.bench_scan --emails 10000 --llm-latency 0.3 --output before.json
+    python -m bench.bench_scan --emails 10000 --llm-latency 0.3 --compare before.json
+
+--mailbox replays recorded messages instead, one Gmail "full" format
+message per line. Results are JSON tagged with the git commit, so runs can
+be compared across commits.
+"""
+import io
+import os
+import sys
+import json
+import shutil
+import time
+import asyncio
+import argparse
+import resource
+import tempfile
+import subprocess
+import tracemalloc
+import contextlib
+from functools import wraps
+from datetime import datetime
+
+from .common import use_fake_environment
+from .fake_llm_server import FakeLLMHandler, start_server
+from .fakes import Recorder, FakeSupabase, FakeGmailService, synthetic_mailbox, load_mailbox
+
+START_DATE = "2024-01-01"
+END_DATE = "2024-07-01"
+
+# Lower is better for everything except emails_per_sec
+HIGHER_IS_BETTER = {"emails_per_sec"}
+
+def _percentile(values: list, fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+def _git_commit() -> str:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], capture_output=True, text=True).stdout.strip()
+        return f"{commit}-dirty" if dirty else commit
+    except Exception:
+        return "unknown"
+
+def _timed(recorder: Recorder, stage: str, function):
+    """Wrap a sync or async function so each call's duration is recorded"""
+    if asyncio.iscoroutinefunction(function):
+        @wraps(function)
+        async def timed_async(*args, **kwargs):
+            with recorder.time(stage):
+                return await function(*args, **kwargs)
+        return timed_async
+
+    @wraps(function)
+    def timed(*args, **kwargs):
+        with recorder.time(stage):
+            return function(*args, **kwargs)
+    return timed
+
+def install_fakes(recorder: Recorder, db: FakeSupabase, storage: str = "supabase", directory: str = None) -> None:
+    """Point the backend modules at the fake database, or a local SQLite file, and time each stage"""
+    from src import clients, gmail_client, pipeline
+    from src.storage import SupabaseStorage, SQLiteStorage
+
+    clients.set_supabase(db)
+    if storage == "sqlite":
+        clients.set_storage(SQLiteStorage(os.path.join(directory, "bench.sqlite3")))
+    else:
+        clients.set_storage(SupabaseStorage())
+
+    gmail_client._execute_batch = _timed(recorder, "gmail_batch", gmail_client._execute_batch)
+    gmail_client.filter_unprocessed = _timed(recorder, "filter_processed", gmail_client.filter_unprocessed)
+    gmail_client.extract_body = _timed(recorder, "extract_body", gmail_client.extract_body)
+    pipeline.try_local_parse = _timed(recorder, "local_parse", pipeline.try_local_parse)
+    pipeline.ai_parse_email = _timed(recorder, "llm_parse", pipeline.ai_parse_email)
+    pipeline.ai_parse_emails_batch = _timed(recorder, "llm_parse_batch", pipeline.ai_parse_emails_batch)
+    pipeline.insert_jobs = _timed(recorder, "insert_jobs", pipeline.insert_jobs)
+
+async def run_scan(service: FakeGmailService) -> dict:
+    from src.gmail_client import new_fetch_stats
+    from src.pipeline import scan_mailbox
+
+    stats = new_fetch_stats()
+    result = await scan_mailbox(service, START_DATE, END_DATE, stats=stats)
+    return {**result, "fetch_stats": stats}
+
+def run_benchmark(args) -> dict:
+    # Set before the backend is imported, since these are read at import time
+    if not args.cache:
+        os.environ["LLM_CACHE_DISABLED"] = "true"
+    if args.no_local_classifier:
+        os.environ["LOCAL_CLASSIFIER_DISABLED"] = "true"
+    if args.no_dedup:
+        os.environ["NEAR_DUP_DISABLED"] = "true"
+    os.environ["GROQ_REQUESTS_PER_MINUTE"] = str(args.rpm)
+    os.environ["GROQ_TOKENS_PER_MINUTE"] = str(args.tpm)
+
+    server = start_server(latency=args.llm_latency, error_rate=args.llm_error_rate)
+    os.environ["GROQ_BASE_URL"] = f"http://127.0.0.1:{server.server_port}"
+    use_fake_environment()
+
+    messages = load_mailbox(args.mailbox) if args.mailbox else synthetic_mailbox(
+        args.emails, job_ratio=args.job_ratio, templated_ratio=args.templated_ratio, seed=args.seed
+    )
+
+    recorder = Recorder()
+    db = FakeSupabase(recorder, latency=args.db_latency, error_rate=args.db_error_rate)
+    service = FakeGmailService(messages, recorder, latency=args.gmail_latency, error_rate=args.gmail_error_rate)
+    directory = tempfile.mkdtemp()
+    install_fakes(recorder, db, args.storage, directory)
+
+    if args.trace_memory:
+        tracemalloc.start()
+
+    # The pipeline prints a line per email, which would dominate the timings
+    output = sys.stdout if args.verbose else io.StringIO()
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(output):
+        result = asyncio.run(run_scan(service))
+    elapsed = time.perf_counter() - started
+
+    peak_memory = None
+    if args.trace_memory:
+        peak_memory = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    server.shutdown()
+    from src.clients import close_clients
+    close_clients()
+    shutil.rmtree(directory, ignore_errors=True)
+
+    calls = dict(sorted(recorder.calls.items()))
+    calls["llm.completions"] = FakeLLMHandler.calls
+
+    return {
+        "commit": _git_commit(),
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "config": {key: value for key, value in vars(args).items() if key not in ("output", "compare", "verbose")},
+        "messages": len(messages),
+        "processed": result["processed"],
+        "job_related": result["job_related"],
+        "elapsed_sec": round(elapsed, 3),
+        "emails_per_sec": round(len(messages) / elapsed, 1),
+        "stages": {
+            stage: {
+                "count": len(values),
+                "p50_ms": round(_percentile(values, 0.5) * 1000, 3),
+                "p99_ms": round(_percentile(values, 0.99) * 1000, 3),
+                "total_sec": round(sum(values), 3),
+            }
+            for stage, values in sorted(recorder.latencies.items())
+        },
+        "calls": calls,
+        "fetch_stats": result["fetch_stats"],
+        "peak_traced_mb": round(peak_memory / 2**20, 1) if peak_memory is not None else None,
+        "max_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+
+def _flatten(report: dict) -> dict:
+    """Comparable numbers from a report, keyed like "stages.llm_parse.p99_ms" """
+    values = {
+        "emails_per_sec": report["emails_per_sec"],
+        "elapsed_sec": report["elapsed_sec"],
+        "peak_traced_mb": report.get("peak_traced_mb"),
+        "max_rss_mb": report.get("max_rss_mb"),
+    }
+    for stage, numbers in report["stages"].items():
+        for name in ("p50_ms", "p99_ms", "total_sec"):
+            values[f"stages.{stage}.{name}"] = numbers[name]
+    for name, count in report["calls"].items():
+        values[f"calls.{name}"] = count
+    return {key: value for key, value in values.items() if value is not None}
+
+def print_report(report: dict) -> None:
+    print(f"commit {report['commit']}: {report['messages']} messages in {report['elapsed_sec']}s "
+          f"({report['emails_per_sec']} emails/s), {report['processed']} parsed, {report['job_related']} job related")
+    print(f"peak traced memory {report['peak_traced_mb']} MB, max RSS {report['max_rss_mb']} MB")
+    print(f"\n{'stage':<18} {'count':>7} {'p50 ms':>10} {'p99 ms':>10} {'total s':>9}")
+    for stage, numbers in report["stages"].items():
+        print(f"{stage:<18} {numbers['count']:>7} {numbers['p50_ms']:>10.2f} {numbers['p99_ms']:>10.2f} {numbers['total_sec']:>9.2f}")
+    print("\ncalls:")
+    for name, count in report["calls"].items():
+        print(f"  {name:<40} {count:>7}")
+
+def print_comparison(baseline: dict, report: dict) -> None:
+    before = _flatten(baseline)
+    after = _flatten(report)
+    print(f"\n{'metric':<40} {baseline['commit']:>12} {report['commit']:>12} {'change':>9}")
+    for key in sorted(set(before) | set(after)):
+        old, new = before.get(key), after.get(key)
+        if old is None or new is None:
+            print(f"{key:<40} {str(old):>12} {str(new):>12}")
+            continue
+        change = (new - old) / old * 100 if old else 0.0
+        better = (change > 0) == (key in HIGHER_IS_BETTER) or change == 0
+        print(f"{key:<40} {old:>12} {new:>12} {change:>+8.1f}% {'' if better else '(worse)'}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--emails", type=int, default=10000, help="Size of the synthetic mailbox")
+    parser.add_argument("--mailbox", help="Replay recorded messages from this JSONL file instead")
+    parser.add_argument("--job-ratio", type=float, default=0.3)
+    parser.add_argument("--templated-ratio", type=float, default=0.5, help="Job emails the local classifier knows")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--gmail-latency", type=float, default=0.05, help="Seconds per Gmail call or batch")
+    parser.add_argument("--gmail-error-rate", type=float, default=0.0, help="Fraction of messages rate limited")
+    parser.add_argument("--llm-latency", type=float, default=0.2, help="Seconds per completion")
+    parser.add_argument("--llm-error-rate", type=float, default=0.0, help="Fraction of completions answered with 429")
+    parser.add_argument("--db-latency", type=float, default=0.01, help="Seconds per Supabase query")
+    parser.add_argument("--db-error-rate", type=float, default=0.0)
+    parser.add_argument("--storage", choices=["supabase", "sqlite"], default="supabase",
+                        help="Fake Supabase with --db-latency, or a real SQLite file in a temporary directory")
+    parser.add_argument("--rpm", type=int, default=10**6, help="Groq requests per minute for the limiter")
+    parser.add_argument("--tpm", type=int, default=10**9, help="Groq tokens per minute for the limiter")
+    parser.add_argument("--cache", action="store_true", help="Keep the LLM result cache enabled")
+    parser.add_argument("--no-local-classifier", action="store_true", help="Send every email to the LLM")
+    parser.add_argument("--no-dedup", action="store_true", help="Parse near-duplicate emails separately")
+    parser.add_argument("--trace-memory", action=argparse.BooleanOptionalAction, default=True,
+                        help="Track peak Python memory with tracemalloc, which slows the run")
+    parser.add_argument("--output", help="Write the JSON report to this file")
+    parser.add_argument("--compare", help="Compare against a JSON report from an earlier run")
+    parser.add_argument("--verbose", action="store_true", help="Show the pipeline's own output")
+    args = parser.parse_args()
+
+    report = run_benchmark(args)
+    print_report(report)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nWrote {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            print_comparison(json.load(f), report)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""
+Measure app import time and the cost of building a Gmail service per request.
+
+    python -m bench.bench_startup --runs 5
+
+Import time is measured in fresh interpreters with -X importtime, and the
+slowest top-level imports are listed. Gmail service construction compares
+building from the discovery document on every call, as get_service used
+to, with the cached document get_service uses now.
+"""
+import os
+import sys
+import time
+import argparse
+import statistics
+import subprocess
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def measure_import(module: str, env: dict) -> tuple:
+    """Import a module in a new interpreter, returning (total seconds, {package: seconds})"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=BACKEND_DIR, env=env, capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+
+    total = 0
+    packages = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        cumulative = cumulative.strip()
+        name = name.rstrip()[1:]
+        if not cumulative.isdigit():
+            continue
+        # Lines for nested imports are indented under their package
+        if not name.startswith(" "):
+            packages[name] = packages.get(name, 0) + int(cumulative) / 1e6
+        if name == module:
+            total = int(cumulative) / 1e6
+    return total, packages
+
+def bench_imports(runs: int, with_env: bool) -> None:
+    env = dict(os.environ)
+    if with_env:
+        env.setdefault("SUPABASE_URL", "http://127.0.0.1:54321")
+        env.setdefault("SUPABASE_KEY", "bench.placeholder.key")
+        env.setdefault("GROQ_API_KEY", "fake-key")
+    else:
+        for name in ("SUPABASE_URL", "SUPABASE_KEY", "GROQ_API_KEY"):
+            env.pop(name, None)
+
+    label = "with credentials" if with_env else "without credentials"
+    try:
+        samples = [measure_import("main", env) for _ in range(runs)]
+    except RuntimeError as e:
+        print(f"import main {label}: failed ({e})")
+        return
+
+    totals = [total for total, _ in samples]
+    print(f"import main {label}: median {statistics.median(totals) * 1000:.0f} ms over {runs} runs")
+
+    slowest = sorted(samples[-1][1].items(), key=lambda item: item[1], reverse=True)[:8]
+    for name, seconds in slowest:
+        print(f"    {name:<40} {seconds * 1000:>8.1f} ms")
+
+def bench_gmail_service(runs: int) -> None:
+    try:
+        from google.oauth2.credentials import Credentials
+        from googleapiclient.discovery import build
+    except ImportError as e:
+        print(f"Skipping Gmail service benchmark: {str(e)}")
+        return
+
+    sys.path.insert(0, BACKEND_DIR)
+    from src.clients import build_gmail_service, get_gmail_discovery_document
+
+    def per_call_build(token: str):
+        creds = Credentials(token, scopes=["https://www.googleapis.com/auth/gmail.readonly"])
+        return build("gmail", "v1", credentials=creds)
+
+    started = time.perf_counter()
+    get_gmail_discovery_document()
+    print(f"\nLoad Gmail discovery document once: {(time.perf_counter() - started) * 1000:.1f} ms")
+
+    for label, function in (("build() per call", per_call_build), ("cached document", build_gmail_service)):
+        samples = []
+        for _ in range(runs):
+            started = time.perf_counter()
+            function("bench-token")
+            samples.append(time.perf_counter() - started)
+        print(f"Gmail service, {label:<18} median {statistics.median(samples) * 1000:.2f} ms over {runs} calls")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5, help="Interpreters to start per import measurement")
+    parser.add_argument("--service-runs", type=int, default=50, help="Gmail services to build per variant")
+    args = parser.parse_args()
+
+    bench_imports(args.runs, with_env=True)
+    bench_imports(args.runs, with_env=False)
+    bench_gmail_service(args.service_runs)
+
+if __name__ == "__main__":
+    main()
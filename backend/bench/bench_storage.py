@@ -0,0 +1,139 @@
+"""
+Run the same storage workload against Supabase (the local fake, with
+simulated network latency) and the embedded SQLite backend, report how long
+each step takes, and check both backends return the same rows.
+
+    python -m bench.bench_storage --jobs 2000 --db-latency 0.02
+"""
+import io
+import os
+import time
+import random
+import argparse
+import tempfile
+import contextlib
+from datetime import date, timedelta
+
+from .common import use_fake_environment
+from .fakes import Recorder, FakeSupabase
+
+STAGES = ["applied", "assessment", "interview", "offer", "rejected"]
+COMPANIES = [f"Company {index}" for index in range(300)]
+
+def parsed_jobs(count: int, seed: int = 0) -> list:
+    """Parse results as insert_jobs receives them, with some repeated updates"""
+    rng = random.Random(seed)
+    jobs = []
+    for index in range(count):
+        company = rng.choice(COMPANIES)
+        stage = rng.choice(STAGES)
+        jobs.append({
+            "company": company,
+            "position": rng.choice(["Software Engineer", "Data Analyst", None]),
+            "stage": stage,
+            "description": f"{company} moved you to {stage}",
+            "application_date": (date(2024, 1, 1) + timedelta(days=rng.randrange(180))).isoformat(),
+            "msg_id": f"msg{index:07d}",
+        })
+    return jobs
+
+def run_workload(storage, args) -> tuple:
+    """Returns ({step: seconds}, results to compare between backends)"""
+    from src import clients, gmail_client
+    from src.db import insert_jobs
+    from src.read_cache import read_cache
+
+    clients.set_storage(storage)
+    read_cache.invalidate()
+
+    timings = {}
+    results = {}
+
+    @contextlib.contextmanager
+    def step(name: str):
+        started = time.perf_counter()
+        yield
+        timings[name] = time.perf_counter() - started
+
+    jobs = parsed_jobs(args.jobs, args.seed)
+    with step("insert_jobs"):
+        written = sum(insert_jobs(jobs[i:i + args.batch]) for i in range(0, len(jobs), args.batch))
+    results["updates_written"] = written
+
+    msg_ids = [f"msg{index:07d}" for index in range(args.processed)]
+    with step("mark_processed"):
+        buffer = gmail_client.ProcessedEmailBuffer(storage)
+        for i in range(0, len(msg_ids), args.page_size):
+            for msg_id in msg_ids[i:i + args.page_size:2]:
+                buffer.add(msg_id)
+            buffer.flush()
+
+    with step("filter_unprocessed"):
+        unprocessed = []
+        for i in range(0, len(msg_ids), args.page_size):
+            unprocessed += gmail_client.filter_unprocessed(storage, msg_ids[i:i + args.page_size])
+    results["unprocessed"] = len(unprocessed)
+
+    with step("list_jobs_pages"):
+        pages, after = [], None
+        while True:
+            rows = storage.list_jobs(limit=args.page_size, after=after)
+            pages += [(row["company"], row["current_status"], row["first_applied"]) for row in rows]
+            if len(rows) < args.page_size:
+                break
+            after = [rows[-1]["first_applied"], rows[-1]["id"]]
+    results["jobs"] = pages
+
+    job_ids = [row["id"] for row in storage.list_jobs("id, company")][:50]
+    with step("list_updates_50_jobs"):
+        updates = [
+            [(row["stage"], row["received_at"]) for row in storage.list_updates(job_id)]
+            for job_id in job_ids
+        ]
+    results["updates"] = updates
+
+    with step("delete_10_jobs"):
+        for job_id in job_ids[:10]:
+            storage.delete_job(job_id)
+    results["jobs_after_delete"] = len(storage.list_jobs("id"))
+
+    return timings, results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--jobs", type=int, default=2000, help="Parsed job emails to insert")
+    parser.add_argument("--batch", type=int, default=25, help="Emails per insert_jobs call, as in the pipeline")
+    parser.add_argument("--processed", type=int, default=10000, help="Email IDs to mark and check as processed")
+    parser.add_argument("--page-size", type=int, default=50)
+    parser.add_argument("--db-latency", type=float, default=0.02, help="Seconds per simulated Supabase query")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    use_fake_environment()
+    from src import clients
+    from src.storage import SupabaseStorage, SQLiteStorage
+
+    clients.set_supabase(FakeSupabase(Recorder(), latency=args.db_latency))
+    with tempfile.TemporaryDirectory() as directory:
+        backends = {
+            "supabase": SupabaseStorage(),
+            "sqlite": SQLiteStorage(os.path.join(directory, "bench.sqlite3")),
+        }
+
+        timings, results = {}, {}
+        for name, storage in backends.items():
+            # insert_jobs prints a line per batch
+            with contextlib.redirect_stdout(io.StringIO()):
+                timings[name], results[name] = run_workload(storage, args)
+            storage.close()
+
+    print(f"{'step':<24} {'supabase s':>12} {'sqlite s':>10} {'speedup':>9}")
+    for step in timings["supabase"]:
+        remote, local = timings["supabase"][step], timings["sqlite"][step]
+        print(f"{step:<24} {remote:>12.3f} {local:>10.3f} {remote / local if local else 0:>8.1f}x")
+
+    mismatched = [key for key in results["supabase"] if results["supabase"][key] != results["sqlite"][key]]
+    print(f"\nresults match: {'yes' if not mismatched else 'no, differs in ' + ', '.join(mismatched)}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,10 @@
+import os
+
+def use_fake_environment() -> None:
+    """
+    Point the backend at placeholder credentials so modules that create
+    clients at import time can be loaded without a real .env.
+    """
+    os.environ.setdefault("SUPABASE_URL", "http://127.0.0.1:54321")
+    os.environ.setdefault("SUPABASE_KEY", "bench.placeholder.key")
+    os.environ.setdefault("GROQ_API_KEY", "fake-key")
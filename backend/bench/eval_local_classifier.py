@@ -0,0 +1,75 @@
+"""
+Measure how often the local classifier agrees with the LLM on a labeled
+fixture set, and how many emails it would keep away from the LLM.
+
+    python -m bench.eval_local_classifier --thresholds 0.7,0.8,0.85,0.9
+
+Fixtures are a JSON list of emails (subject, sender, body, date) with the
+LLM's result under "label". Add real emails from a scan to keep it honest.
+"""
+import os
+import json
+import argparse
+
+from src.local_classifier import local_parse_email
+
+DEFAULT_FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures", "labeled_emails.json")
+
+def _agrees(result: dict, label: dict) -> bool:
+    if not label.get("job_related"):
+        return False
+    return result["company"].lower() == (label.get("company") or "").lower() \
+        and result["stage"] == label.get("stage")
+
+def evaluate(emails: list, threshold: float) -> dict:
+    handled = 0
+    agreed = 0
+    disagreements = []
+
+    for email in emails:
+        result, confidence = local_parse_email(email)
+        if result is None or confidence < threshold:
+            continue
+
+        handled += 1
+        if _agrees(result, email["label"]):
+            agreed += 1
+        else:
+            disagreements.append({
+                "subject": email["subject"],
+                "confidence": round(confidence, 3),
+                "local": {"company": result["company"], "stage": result["stage"]},
+                "llm": email["label"],
+            })
+
+    return {
+        "threshold": threshold,
+        "emails": len(emails),
+        "handled_locally": handled,
+        "coverage": round(handled / len(emails), 3) if emails else 0.0,
+        "agreement": round(agreed / handled, 3) if handled else None,
+        "disagreements": disagreements,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--fixtures", default=DEFAULT_FIXTURES)
+    parser.add_argument("--thresholds", default="0.7,0.8,0.85,0.9,0.95")
+    parser.add_argument("--verbose", action="store_true", help="Show each disagreement")
+    args = parser.parse_args()
+
+    with open(args.fixtures) as f:
+        emails = json.load(f)
+
+    print(f"{'threshold':>9}  {'coverage':>8}  {'agreement':>9}  handled")
+    for threshold in (float(value) for value in args.thresholds.split(",")):
+        report = evaluate(emails, threshold)
+        agreement = "-" if report["agreement"] is None else f"{report['agreement']:.1%}"
+        print(f"{threshold:>9.2f}  {report['coverage']:>8.1%}  {agreement:>9}  "
+              f"{report['handled_locally']}/{report['emails']}")
+        if args.verbose:
+            for disagreement in report["disagreements"]:
+                print(f"    {disagreement}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""
+Local stand-in for the Groq chat completions API, used for benchmarks.
+
+Run on its own with:
+    python -m bench.fake_llm_server --port 8100 --latency 0.5
+and point the backend at it with GROQ_BASE_URL=http://127.0.0.1:8100
+"""
+import re
+import json
+import time
+import random
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+STAGES = ["Application Received", "Interview Scheduled", "Assessment", "Offer", "Rejection"]
+
+def fake_result(email_text: str, received_date: str) -> dict:
+    """Build a deterministic parse result from a synthetic email"""
+    company = re.search(r"Company:\s*(.+)", email_text)
+    if not company:
+        return {"job_related": False}
+
+    return {
+        "job_related": True,
+        "company": company.group(1).strip(),
+        "position": "Software Engineer",
+        "application_date": received_date,
+        "stage": STAGES[len(email_text) % len(STAGES)],
+        "description": email_text.strip().splitlines()[-1][:100],
+    }
+
+def fake_completion(prompt: str) -> str:
+    """Answer a single-email or batched parse prompt"""
+    if "JSON array" in prompt:
+        sections = re.findall(
+            r"Email \[(\d+)\] received on: (\S+)\n(.*?)--- end of email", prompt, re.DOTALL
+        )
+        return json.dumps([
+            {"index": int(index), **fake_result(email_text, date)} for index, date, email_text in sections
+        ])
+
+    date = re.search(r"Email received on: (\S+)", prompt)
+    email_text = prompt.split("Email text:", 1)[-1]
+    return json.dumps(fake_result(email_text, date.group(1) if date else ""))
+
+class FakeLLMHandler(BaseHTTPRequestHandler):
+    latency = 0.0
+    error_rate = 0.0
+    calls = 0
+    lock = threading.Lock()
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        body = json.loads(self.rfile.read(length) or b"{}")
+
+        with self.lock:
+            FakeLLMHandler.calls += 1
+
+        time.sleep(self.latency)
+
+        if random.random() < self.error_rate:
+            self._send(429, {"error": {"message": "Rate limit reached", "type": "tokens"}}, {"retry-after": "1"})
+            return
+
+        prompt = body["messages"][-1]["content"]
+        content = fake_completion(prompt)
+        self._send(200, {
+            "id": "chatcmpl-fake",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": "stop",
+            }],
+            "usage": {
+                "prompt_tokens": len(prompt) // 4,
+                "completion_tokens": len(content) // 4,
+                "total_tokens": (len(prompt) + len(content)) // 4,
+            },
+        })
+
+    def _send(self, status: int, payload: dict, headers: dict = None):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+def start_server(port: int = 0, latency: float = 0.0, error_rate: float = 0.0) -> ThreadingHTTPServer:
+    """Start the fake server in a background thread"""
+    FakeLLMHandler.latency = latency
+    FakeLLMHandler.error_rate = error_rate
+    server = ThreadingHTTPServer(("127.0.0.1", port), FakeLLMHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--latency", type=float, default=0.5, help="Seconds per completion")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of calls answered with 429")
+    args = parser.parse_args()
+
+    FakeLLMHandler.latency = args.latency
+    FakeLLMHandler.error_rate = args.error_rate
+    print(f"Fake LLM server listening on http://127.0.0.1:{args.port}")
+    ThreadingHTTPServer(("127.0.0.1", args.port), FakeLLMHandler).serve_forever()
@@ -0,0 +1,514 @@
+"""
+In-process stand-ins for the Gmail API and Supabase, used by the scan
+benchmark and the tests. Both add configurable latency and error rates and
+count calls.
+"""
+import re
+import json
+import time
+import random
+import threading
+import itertools
+from base64 import urlsafe_b64encode
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+class Recorder:
+    """Thread-safe call counts and per-stage latencies"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = Counter()
+        self.latencies = {}
+
+    def count(self, name: str, amount: int = 1) -> None:
+        with self.lock:
+            self.calls[name] += amount
+
+    def record(self, stage: str, seconds: float) -> None:
+        with self.lock:
+            self.latencies.setdefault(stage, []).append(seconds)
+
+    @contextmanager
+    def time(self, stage: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, time.perf_counter() - started)
+
+def _fail(error_rate: float) -> bool:
+    return error_rate > 0 and random.random() < error_rate
+
+# --- Supabase ---
+
+FILTER_OPERATORS = {
+    "eq": lambda a, b: a == b,
+    "lt": lambda a, b: a < b,
+    "lte": lambda a, b: a <= b,
+    "gt": lambda a, b: a > b,
+    "gte": lambda a, b: a >= b,
+}
+
+def _split_filters(filters: str) -> list:
+    """Split a PostgREST filter list on the commas outside parentheses and quotes"""
+    parts, depth, current = [], 0, ""
+    quoted = escaped = False
+    for char in filters:
+        if escaped:
+            escaped = False
+        elif quoted:
+            escaped = char == "\\"
+            quoted = char != '"'
+        elif char == '"':
+            quoted = True
+        elif char == "," and depth == 0:
+            parts.append(current)
+            current = ""
+            continue
+        else:
+            depth += {"(": 1, ")": -1}.get(char, 0)
+        current += char
+    return parts + [current]
+
+def _unquote(value: str) -> str:
+    """A filter value without its double quotes and backslash escapes"""
+    if len(value) < 2 or not value.startswith('"') or not value.endswith('"'):
+        return value
+    return re.sub(r"\\(.)", r"\1", value[1:-1])
+
+def _parse_filter(text: str):
+    """A row predicate for one PostgREST filter, e.g. "id.lt.5" or "and(a.eq.1,id.lt.5)" """
+    for group, combine in (("and(", all), ("or(", any)):
+        if text.startswith(group):
+            conditions = [_parse_filter(part) for part in _split_filters(text[len(group):-1])]
+            return lambda row: combine(condition(row) for condition in conditions)
+
+    column, operator, value = text.split(".", 2)
+    compare = FILTER_OPERATORS[operator]
+    value = _unquote(value)
+
+    def condition(row):
+        current = row.get(column)
+        # Filter values arrive as text, so compare in the column's own type
+        return current is not None and compare(current, type(current)(value))
+    return condition
+
+def _parse_order(text: str) -> list:
+    """(column, desc) pairs for a PostgREST order, e.g. "first_applied.desc,id.desc" """
+    ordering = []
+    for part in _split_filters(text):
+        column, *modifiers = part.split(".")
+        ordering.append((column, "desc" in modifiers))
+    return ordering
+
+# Column pointing at the parent row, for embedded selects like "*, job_updates(*)"
+FOREIGN_KEYS = {"job_updates": "job_id"}
+
+def _sort_rows(rows: list, ordering: list) -> list:
+    for column, desc in reversed(ordering):
+        rows.sort(key=lambda row: (row.get(column) is None, row.get(column)), reverse=desc)
+    return rows
+
+class FakeParams:
+    """Query string parameters, added to like httpx.QueryParams"""
+
+    def __init__(self, items: list = None):
+        self.items = items or []
+
+    def add(self, key: str, value) -> "FakeParams":
+        return FakeParams(self.items + [(key, str(value))])
+
+    def get_list(self, key: str) -> list:
+        return [value for name, value in self.items if name == key]
+
+class FakeResponse:
+    def __init__(self, data: list):
+        self.data = data
+
+class FakeQuery:
+    """The subset of the PostgREST query builder the backend uses"""
+
+    def __init__(self, db: "FakeSupabase", table: str):
+        self.db = db
+        self.table_name = table
+        self.operation = "select"
+        self.rows = None
+        self.filters = []
+        self.ordering = []
+        self.row_limit = None
+        self.ignore_duplicates = False
+        self.params = FakeParams()
+        self.columns = "*"
+        self.embedded = {}  # Embedded table -> its ordering and limit
+
+    def select(self, columns: str = "*", **kwargs):
+        self.operation = "select"
+        self.columns = columns
+        return self
+
+    def insert(self, rows):
+        self.operation = "insert"
+        self.rows = rows if isinstance(rows, list) else [rows]
+        return self
+
+    def upsert(self, rows, ignore_duplicates: bool = False, **kwargs):
+        self.operation = "upsert"
+        self.rows = rows if isinstance(rows, list) else [rows]
+        self.ignore_duplicates = ignore_duplicates
+        return self
+
+    def delete(self):
+        self.operation = "delete"
+        return self
+
+    def eq(self, column: str, value):
+        self.filters.append(lambda row: str(row.get(column)) == str(value))
+        return self
+
+    def neq(self, column: str, value):
+        self.filters.append(lambda row: str(row.get(column)) != str(value))
+        return self
+
+    def in_(self, column: str, values: list):
+        values = {str(value) for value in values}
+        self.filters.append(lambda row: str(row.get(column)) in values)
+        return self
+
+    def gte(self, column: str, value):
+        self.filters.append(lambda row: row.get(column) is not None and row.get(column) >= value)
+        return self
+
+    def lte(self, column: str, value):
+        self.filters.append(lambda row: row.get(column) is not None and row.get(column) <= value)
+        return self
+
+    def gt(self, column: str, value):
+        self.filters.append(lambda row: row.get(column) is not None and row.get(column) > value)
+        return self
+
+    def lt(self, column: str, value):
+        self.filters.append(lambda row: row.get(column) is not None and row.get(column) < value)
+        return self
+
+    def _embedded(self, table: str) -> dict:
+        return self.embedded.setdefault(table, {"ordering": [], "limit": None})
+
+    def order(self, column: str, desc: bool = False, foreign_table: str = None, **kwargs):
+        ordering = self._embedded(foreign_table)["ordering"] if foreign_table else self.ordering
+        ordering.append((column, desc))
+        return self
+
+    def limit(self, count: int, foreign_table: str = None, **kwargs):
+        if foreign_table:
+            self._embedded(foreign_table)["limit"] = count
+        else:
+            self.row_limit = count
+        return self
+
+    def execute(self) -> FakeResponse:
+        self.db.recorder.count(f"supabase.{self.table_name}.{self.operation}")
+        time.sleep(self.db.latency)
+        if _fail(self.db.error_rate):
+            raise Exception(f"Fake Supabase error on {self.table_name}")
+
+        with self.db.lock:
+            table = self.db.tables.setdefault(self.table_name, {})
+
+            # Filters and ordering set on the query string directly
+            filters = self.filters + [_parse_filter(f"or{value}") for value in self.params.get_list("or")]
+            ordering = self.ordering + [
+                order for value in self.params.get_list("order") for order in _parse_order(value)
+            ]
+
+            if self.operation == "select":
+                rows = _sort_rows([dict(row) for row in table.values() if all(f(row) for f in filters)], ordering)
+                # Like PostgREST, never return more than max_rows in one response
+                row_limit = self.db.max_rows if self.row_limit is None else min(self.row_limit, self.db.max_rows)
+                rows = rows[:row_limit]
+
+                selected = [column.strip() for column in _split_filters(self.columns) if "(" not in column]
+                if "*" not in selected:
+                    rows = [{column: row.get(column) for column in selected} for row in rows]
+                for name in re.findall(r"(\w+)\(\*\)", self.columns):
+                    embedded = self._embedded(name)
+                    children = self.db.tables.get(name, {}).values()
+                    for row in rows:
+                        related = [dict(child) for child in children if child[FOREIGN_KEYS[name]] == row["id"]]
+                        row[name] = _sort_rows(related, embedded["ordering"])[:embedded["limit"]]
+                return FakeResponse(rows)
+
+            if self.operation == "delete":
+                deleted = [key for key, row in table.items() if all(f(row) for f in filters)]
+                return FakeResponse([table.pop(key) for key in deleted])
+
+            written = []
+            for row in self.rows:
+                row = dict(row)
+                key = str(row.get("id") or row.get("account") or "")
+                if not key:
+                    row["id"] = next(self.db.ids)
+                    key = str(row["id"])
+                elif key in table:
+                    if self.operation == "insert":
+                        raise Exception(f"Duplicate key {key} in {self.table_name}")
+                    if self.ignore_duplicates:
+                        continue
+                    row = {**table[key], **row}
+                table[key] = row
+                written.append(dict(row))
+            return FakeResponse(written)
+
+class FakeSupabase:
+    def __init__(self, recorder: Recorder, latency: float = 0.0, error_rate: float = 0.0, max_rows: int = 1000):
+        self.recorder = recorder
+        self.latency = latency
+        self.error_rate = error_rate
+        self.max_rows = max_rows
+        self.tables = {}
+        self.ids = itertools.count(1)
+        self.lock = threading.Lock()
+
+    def table(self, name: str) -> FakeQuery:
+        return FakeQuery(self, name)
+
+# --- Gmail ---
+
+class FakeRequest:
+    def __init__(self, run):
+        self.run = run
+
+    def execute(self, **kwargs):
+        return self.run()
+
+class FakeBatch:
+    def __init__(self, service: "FakeGmailService", callback):
+        self.service = service
+        self.callback = callback
+        self.requests = []
+
+    def add(self, request: FakeRequest, request_id: str = None):
+        self.requests.append((request, request_id))
+
+    def execute(self, http=None):
+        # Imported here so the fakes module loads without the Google client libraries
+        import httplib2
+        from googleapiclient.errors import HttpError
+
+        self.service.recorder.count("gmail.batch")
+        self.service.recorder.count("gmail.messages.get", len(self.requests))
+        time.sleep(self.service.latency)
+
+        for request, request_id in self.requests:
+            status = self.service.next_failure(request_id)
+            if status is None and _fail(self.service.error_rate):
+                status = 429
+            if status is not None:
+                response = httplib2.Response({"status": status})
+                self.callback(request_id, None, HttpError(response, b"rateLimitExceeded" if status == 429 else b"error"))
+                continue
+            try:
+                self.callback(request_id, request.run(), None)
+            except Exception as e:
+                self.callback(request_id, None, e)
+
+class FakeGmailService:
+    """
+    A mailbox held in memory, answering the Gmail API calls get_emails makes.
+    Messages are in the API's "full" format. failures maps message IDs to the
+    HTTP statuses their next batched gets answer with, one per attempt.
+    Every message added, oldest first, moves the history ID on by one. History
+    before history_kept_from has expired and answers 404.
+    """
+
+    def __init__(self, messages: list, recorder: Recorder, latency: float = 0.0, error_rate: float = 0.0,
+                 email_address: str = "bench@example.com", failures: dict = None, history_kept_from: int = 0):
+        self.mailbox = []
+        self.by_id = {}
+        self.added = []  # (history ID, message ID) for every message added
+        self.recorder = recorder
+        self.latency = latency
+        self.error_rate = error_rate
+        self.email_address = email_address
+        self.failures = {msg_id: list(statuses) for msg_id, statuses in (failures or {}).items()}
+        self.history_kept_from = history_kept_from
+        self._history = _FakeHistory(self)
+        self.deliver(messages)
+
+    @property
+    def history_id(self) -> int:
+        return len(self.added)
+
+    def deliver(self, messages: list) -> None:
+        """Add messages to the mailbox, as if they had just arrived"""
+        for msg in sorted(messages, key=lambda msg: int(msg["internalDate"])):
+            self.by_id[msg["id"]] = msg
+            self.added.append((self.history_id + 1, msg["id"]))
+        self.mailbox = sorted(self.by_id.values(), key=lambda msg: int(msg["internalDate"]), reverse=True)
+
+    def next_failure(self, msg_id: str):
+        statuses = self.failures.get(msg_id)
+        return statuses.pop(0) if statuses else None
+
+    def users(self):
+        return self
+
+    def messages(self):
+        return self
+
+    def history(self):
+        return self._history
+
+    def new_batch_http_request(self, callback=None):
+        return FakeBatch(self, callback)
+
+    def getProfile(self, userId: str = "me"):
+        def run():
+            self.recorder.count("gmail.profile")
+            return {"emailAddress": self.email_address, "historyId": str(self.history_id)}
+        return FakeRequest(run)
+
+    # Unannotated below since "list" is shadowed in the class body
+    def list(self, userId="me", q="", maxResults=100, pageToken=None, **kwargs):
+        def run():
+            self.recorder.count("gmail.messages.list")
+            time.sleep(self.latency)
+            matching = [msg for msg in self.mailbox if _matches_query(msg, q)]
+            start = int(pageToken or 0)
+            page = matching[start:start + maxResults]
+            response = {"messages": [{"id": msg["id"], "threadId": msg["threadId"]} for msg in page]}
+            if start + maxResults < len(matching):
+                response["nextPageToken"] = str(start + maxResults)
+            return response
+        return FakeRequest(run)
+
+    def get(self, userId="me", id=None, format="full", metadataHeaders=None, **kwargs):
+        def run():
+            msg = self.by_id[id]
+            if format != "metadata":
+                return msg
+            wanted = {name.lower() for name in metadataHeaders or []}
+            headers = [header for header in msg["payload"]["headers"] if header["name"].lower() in wanted]
+            return {**msg, "payload": {"headers": headers}}
+        return FakeRequest(run)
+
+class _FakeHistory:
+    """users().history() of a FakeGmailService, with one record per added message"""
+
+    def __init__(self, service: FakeGmailService):
+        self.service = service
+
+    def list(self, userId="me", startHistoryId=None, maxResults=100, pageToken=None, **kwargs):
+        def run():
+            self.service.recorder.count("gmail.history.list")
+            time.sleep(self.service.latency)
+            start = int(startHistoryId)
+            if start < self.service.history_kept_from:
+                # Gmail returns 404 for history IDs it no longer has
+                import httplib2
+                from googleapiclient.errors import HttpError
+                raise HttpError(httplib2.Response({"status": 404}), b"historyId not found")
+
+            records = [
+                {"id": str(history_id), "messagesAdded": [{"message": {"id": msg_id}}]}
+                for history_id, msg_id in self.service.added if history_id > start
+            ]
+            offset = int(pageToken or 0)
+            response = {"history": records[offset:offset + maxResults], "historyId": str(self.service.history_id)}
+            if offset + maxResults < len(records):
+                response["nextPageToken"] = str(offset + maxResults)
+            return response
+        return FakeRequest(run)
+
+_query_date_regex = re.compile(r"(after|before):(\d{4}/\d{2}/\d{2})")
+
+def _matches_query(msg: dict, query: str) -> bool:
+    """Apply the after:/before: dates of a Gmail search query"""
+    timestamp = int(msg["internalDate"]) / 1000
+    for operator, value in _query_date_regex.findall(query or ""):
+        boundary = datetime.strptime(value, "%Y/%m/%d").timestamp()
+        if operator == "after" and timestamp < boundary:
+            return False
+        if operator == "before" and timestamp >= boundary:
+            return False
+    return True
+
+# --- Mailboxes ---
+
+TEMPLATED_JOB_EMAILS = [
+    ("Thank you for applying to {company}", "{company} Recruiting <no-reply@greenhouse.io>",
+     "Hi Sam,\n\nThank you for applying to {company}. We have received your application for the {position} role "
+     "and our team will review your application.\n\nBest,\n{company} Recruiting"),
+    ("Update on your application", "{company} <no-reply@hire.lever.co>",
+     "Hi Sam,\n\nThank you for your interest in {company}. Unfortunately, we have decided to move forward with "
+     "other candidates. We will not be moving forward with your application at this time."),
+]
+
+FREEFORM_JOB_EMAILS = [
+    ("Next steps for your application", "Alex <alex@{domain}>",
+     "Company: {company}\nHi Sam, the team enjoyed your application for {position}. Could we schedule an interview "
+     "next week to talk through your background?\n\nOn Mon, Jan 1, 2024 at 9:00 AM Sam wrote:\n> Thanks!"),
+    ("Coding assessment", "{company} Talent <talent@{domain}>",
+     "Company: {company}\nThanks for your application. Please complete the coding assessment within 5 days. "
+     "Track your progress at https://{domain}/candidate?utm_source=email&id=123456"),
+]
+
+OTHER_EMAILS = [
+    ("Your weekly newsletter", "News <news@example.com>", "Here are this week's top stories."),
+    ("Receipt for your order", "Shop <orders@shop.example.com>", "Thanks for your purchase. Your order has shipped."),
+    ("Team offsite photos", "Friend <friend@gmail.com>", "Photos from the weekend are in the shared album."),
+]
+
+COMPANIES = ["Acme", "Globex", "Initech", "Umbrella", "Hooli", "Stark Industries", "Wayne Enterprises", "Vandelay"]
+POSITIONS = ["Software Engineer", "Data Analyst", "Backend Engineer", "Product Manager"]
+
+def _encode(text: str) -> str:
+    return urlsafe_b64encode(text.encode("utf-8")).decode("ascii")
+
+def make_message(msg_id: str, subject: str, sender: str, body: str, sent_at: datetime, thread_id: str = None) -> dict:
+    """Build a message in the Gmail API's "full" format"""
+    return {
+        "id": msg_id,
+        "threadId": thread_id or msg_id,
+        "internalDate": str(int(sent_at.timestamp() * 1000)),
+        "payload": {
+            "mimeType": "text/plain",
+            "headers": [
+                {"name": "Subject", "value": subject},
+                {"name": "From", "value": sender},
+                {"name": "Message-ID", "value": f"<{msg_id}@bench.example.com>"},
+            ],
+            "body": {"data": _encode(body)},
+        },
+    }
+
+def synthetic_mailbox(count: int, job_ratio: float = 0.3, templated_ratio: float = 0.5,
+                      start: datetime = datetime(2024, 1, 1), days: int = 180, seed: int = 0,
+                      id_prefix: str = "msg") -> list:
+    """
+    Generate a mailbox where job_ratio of the messages are job emails and
+    templated_ratio of those follow ATS templates the local classifier knows.
+    """
+    rng = random.Random(seed)
+    messages = []
+    for index in range(count):
+        company = rng.choice(COMPANIES)
+        fields = {
+            "company": company,
+            "domain": company.lower().replace(" ", "") + ".com",
+            "position": rng.choice(POSITIONS),
+        }
+        if rng.random() < job_ratio:
+            templates = TEMPLATED_JOB_EMAILS if rng.random() < templated_ratio else FREEFORM_JOB_EMAILS
+        else:
+            templates = OTHER_EMAILS
+        subject, sender, body = (part.format(**fields) for part in rng.choice(templates))
+        sent_at = start + timedelta(seconds=rng.randrange(days * 86400))
+        messages.append(make_message(f"{id_prefix}{index:07d}", subject, sender, f"{body}\n\nReference #{index}", sent_at))
+    return messages
+
+def load_mailbox(path: str) -> list:
+    """Load recorded messages, one Gmail "full" format message per line"""
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
@@ -1,8 +1,19 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from src.routes import router
+from src.scan_jobs import scan_worker
+from src.clients import close_clients
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Background scans run in this process. API clients are created on first use.
+    await scan_worker.start()
+    yield
+    await scan_worker.stop()
+    close_clients()
+
+app = FastAPI(lifespan=lifespan)
 
 # Allow frontend to access
 app.add_middleware(
@@ -11,6 +22,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "X-Next-Cursor"],
 )
 
 # Register routes
@@ -1,44 +1,95 @@
 import os
 import json
 import re
-from groq import Groq
-from dotenv import load_dotenv
+from functools import lru_cache
 
-load_dotenv()
+from .llm_cache import get_llm_cache, make_cache_key
+from .preprocess import count_tokens, prepare_email_text
+from .clients import get_groq
+from . import metrics
 
-client = Groq(api_key=os.getenv("GROQ_API_KEY"))
 MODEL_NAME = "llama-3.3-70b-versatile"
+PROMPT_VERSION = "1"  # Bump when the prompt changes so cached results are not reused
+MAX_EMAIL_TOKENS = int(os.getenv("MAX_EMAIL_TOKENS", "4000"))
+MAX_COMPLETION_TOKENS = 500
+PROMPT_OVERHEAD_TOKENS = 300  # Fixed instructions around the email text
 
-def truncate_to_token_limit(text: str, max_tokens: int = 4000) -> str:
+# Batch mode packs several emails into one prompt
+BATCH_MAX_EMAILS = int(os.getenv("PARSE_BATCH_MAX_EMAILS", "8"))
+BATCH_TOKEN_BUDGET = int(os.getenv("PARSE_BATCH_TOKEN_BUDGET", "6000"))  # Email tokens per prompt
+BATCH_COMPLETION_TOKENS_PER_EMAIL = 150
+
+def is_rate_limit_error(error: Exception) -> bool:
+    """
+    Whether Groq rejected a request for its rate limit. Matched by name and
+    status instead of importing groq, which adds about 0.2s to app startup.
+    """
+    return type(error).__name__ == "RateLimitError" or getattr(error, "status_code", None) == 429
+
+@lru_cache(maxsize=256)
+def truncate_to_token_limit(text: str, max_tokens: int = MAX_EMAIL_TOKENS) -> str:
+    """
+    Strip boilerplate and keep the most relevant sentences so the email fits
+    in max_tokens real tokens. Cached since the same email is prepared for
+    the cache key, the rate limiter and the prompt.
+    """
+    prepared, report = prepare_email_text(text, max_tokens)
+    metrics.inc("tokens", report["original_tokens"] - report["final_tokens"], kind="saved_by_preprocessing")
+
+    if report["final_tokens"] < report["original_tokens"]:
+        print(f"Preprocessed email from {report['original_tokens']} to {report['final_tokens']} tokens: {report}")
+
+    return prepared
+
+def estimate_email_tokens(email_text: str) -> int:
+    """
+    Count the tokens an email takes up in a prompt after truncation.
+    """
+    return count_tokens(truncate_to_token_limit(email_text))
+
+def estimate_request_tokens(email_text: str) -> int:
+    """
+    Estimate the tokens one ai_parse_email call counts against the rate limit.
+    """
+    return estimate_email_tokens(email_text) + PROMPT_OVERHEAD_TOKENS + MAX_COMPLETION_TOKENS
+
+def estimate_batch_request_tokens(email_tokens: list) -> int:
     """
-    Intelligently truncate text to stay within Groq's token limit.
+    Estimate the tokens one ai_parse_emails_batch call counts against the rate limit.
     """
-    # Approximate character limit (4 chars per token)
-    char_limit = max_tokens * 4
-    
-    if len(text) <= char_limit:
-        return text
-
-    # Split text into chunks
-    chunks = text.split("\n")
-    
-    # Keep important parts
-    header = "\n".join(chunks[:3])  # First 3 lines
-    footer = "\n".join(chunks[-3:])  # Last 3 lines
-    
-    # Extract email body
-    body = "\n".join(chunks[3:-3])
-    body = body[:char_limit - len(header) - len(footer)]
-    
-    truncated_text = f"{header}\n{body}\n{footer}"
-    print(f"Truncated email from {len(text)} to {len(truncated_text)} characters")
-    
-    return truncated_text
-
-def ai_parse_email(email_text: str, received_date: str) -> dict:
+    return sum(email_tokens) + PROMPT_OVERHEAD_TOKENS + BATCH_COMPLETION_TOKENS_PER_EMAIL * len(email_tokens)
+
+def _record_usage(chat_completion) -> None:
+    """Count the tokens Groq reports for a completion"""
+    usage = getattr(chat_completion, "usage", None)
+    if usage is not None:
+        metrics.inc("tokens", getattr(usage, "prompt_tokens", 0) or 0, kind="prompt")
+        metrics.inc("tokens", getattr(usage, "completion_tokens", 0) or 0, kind="completion")
+
+def get_cached_parse(email_text: str, received_date: str):
+    """
+    Look up a previous parse result for the same email text and date.
+    """
+    cache = get_llm_cache()
+    if cache is None:
+        return None
+
+    key = make_cache_key(truncate_to_token_limit(email_text), received_date, MODEL_NAME, PROMPT_VERSION)
+    return cache.get(key)
+
+def ai_parse_email(email_text: str, received_date: str, use_cache: bool = True, lookup_cache: bool = True) -> dict:
     try:
         # Truncate email text before processing
         truncated_text = truncate_to_token_limit(email_text)
+
+        # Reuse the result for an identical email instead of calling the model
+        cache = get_llm_cache() if use_cache else None
+        if cache is not None:
+            cache_key = make_cache_key(truncated_text, received_date, MODEL_NAME, PROMPT_VERSION)
+            cached = cache.get(cache_key) if lookup_cache else None
+            if cached is not None:
+                print(f"Cached result: {cached}")
+                return cached
         
         prompt = f"""
         Analyze this email and return ONLY a JSON object with no additional text or formatting.
@@ -62,15 +113,18 @@ def ai_parse_email(email_text: str, received_date: str) -> dict:
         {truncated_text}
         """
 
-        chat_completion = client.chat.completions.create(
-            model=MODEL_NAME,
-            messages=[{
-                "role": "user", 
-                "content": prompt.strip()
-            }],
-            temperature=0.1,
-            max_tokens=500
-        )
+        metrics.inc("api_calls", service="groq", call="parse")
+        with metrics.span("llm_parse"):
+            chat_completion = get_groq().chat.completions.create(
+                model=MODEL_NAME,
+                messages=[{
+                    "role": "user", 
+                    "content": prompt.strip()
+                }],
+                temperature=0.1,
+                max_tokens=MAX_COMPLETION_TOKENS
+            )
+        _record_usage(chat_completion)
 
         response_text = chat_completion.choices[0].message.content.strip()
         
@@ -81,9 +135,118 @@ def ai_parse_email(email_text: str, received_date: str) -> dict:
             
         result = json.loads(json_str.group())
         print(f"Parsed result: {result}")
+
+        if cache is not None:
+            cache.put(cache_key, result)
         return result
 
     except Exception as e:
+        if is_rate_limit_error(e):
+            # Let the caller back off and retry
+            metrics.inc("api_errors", service="groq", call="parse", reason="rate_limit")
+            raise
+
+        metrics.inc("api_errors", service="groq", call="parse", reason="error")
         print(f"Error in AI parsing: {str(e)}")
         print(f"Raw response: {response_text if 'response_text' in locals() else 'No response'}")
-        return {"job_related": False}
\ No newline at end of file
+        return {"job_related": False}
+
+def _is_valid_result(result) -> bool:
+    """Check that a batch element has the fields insert_job needs"""
+    if not isinstance(result, dict) or not isinstance(result.get("job_related"), bool):
+        return False
+    if result["job_related"]:
+        return bool(result.get("company")) and bool(result.get("stage"))
+    return True
+
+def ai_parse_emails_batch(emails: list, use_cache: bool = True) -> list:
+    """
+    Parse several (email_text, received_date) pairs with one prompt.
+    Returns one result per email, with None for elements the model got wrong
+    so the caller can fall back to ai_parse_email for them.
+    """
+    try:
+        truncated = [(truncate_to_token_limit(text), date) for text, date in emails]
+
+        email_sections = "\n\n".join(
+            f"Email [{index}] received on: {date}\n{text}\n--- end of email [{index}] ---"
+            for index, (text, date) in enumerate(truncated)
+        )
+
+        prompt = f"""
+        Analyze each of the {len(emails)} emails below and return ONLY a JSON array with no additional text or formatting.
+        The array must contain exactly {len(emails)} objects, one per email, in the same order.
+
+        Rules:
+        1. Use EXACTLY this format for an email that is not job related:
+        {{"index": <email index>, "job_related": false}}
+
+        2. Use EXACTLY this format for an email that is job related:
+        {{
+            "index": <email index>,
+            "job_related": true,
+            "company": "<company name>",
+            "position": "<job title>",
+            "application_date": "<the date that email was received on>",
+            "stage": "<one of: Application Received, Screen, Interview Scheduled, Technical Interview, Assessment, Offer, Rejection, Follow-up>",
+            "description": "<brief summary>"
+        }}
+
+        {email_sections}
+        """
+
+        metrics.inc("api_calls", service="groq", call="parse_batch")
+        with metrics.span("llm_parse_batch"):
+            chat_completion = get_groq().chat.completions.create(
+                model=MODEL_NAME,
+                messages=[{
+                    "role": "user",
+                    "content": prompt.strip()
+                }],
+                temperature=0.1,
+                max_tokens=BATCH_COMPLETION_TOKENS_PER_EMAIL * len(emails) + MAX_COMPLETION_TOKENS
+            )
+        _record_usage(chat_completion)
+
+        response_text = chat_completion.choices[0].message.content.strip()
+
+        # Clean the response to ensure a valid JSON array
+        json_str = re.search(r'\[.*\]', response_text, re.DOTALL)
+        if not json_str:
+            print(f"Batch response had no JSON array: {response_text[:200]}")
+            return [None] * len(emails)
+
+        parsed = json.loads(json_str.group())
+        by_index = {
+            item["index"]: item for item in parsed
+            if isinstance(item, dict) and isinstance(item.get("index"), int)
+        }
+
+    except Exception as e:
+        if is_rate_limit_error(e):
+            # Let the caller back off and retry
+            metrics.inc("api_errors", service="groq", call="parse_batch", reason="rate_limit")
+            raise
+
+        metrics.inc("api_errors", service="groq", call="parse_batch", reason="error")
+        print(f"Error in batch AI parsing: {str(e)}")
+        return [None] * len(emails)
+
+    cache = get_llm_cache() if use_cache else None
+    results = []
+    for index, (text, date) in enumerate(truncated):
+        result = by_index.get(index)
+        if not _is_valid_result(result):
+            results.append(None)
+            continue
+
+        result = {key: value for key, value in result.items() if key != "index"}
+        if result["job_related"]:
+            result["application_date"] = date
+
+        if cache is not None:
+            cache.put(make_cache_key(text, date, MODEL_NAME, PROMPT_VERSION), result)
+        results.append(result)
+
+    print(f"Parsed batch of {len(emails)} emails, {results.count(None)} need a retry")
+    return results
@@ -0,0 +1,136 @@
+import os
+import json
+import threading
+from typing import TYPE_CHECKING
+from dotenv import load_dotenv
+
+if TYPE_CHECKING:
+    from supabase import Client
+    from .storage import Storage
+
+load_dotenv()
+
+# The Gmail discovery document is written here the first time it has to be downloaded
+GMAIL_DISCOVERY_PATH = os.getenv(
+    "GMAIL_DISCOVERY_PATH", os.path.join(os.path.dirname(os.path.dirname(__file__)), ".gmail_discovery.json")
+)
+GMAIL_DISCOVERY_URL = "https://gmail.googleapis.com/$discovery/rest?version=v1"
+GMAIL_SCOPES = ["https://www.googleapis.com/auth/gmail.readonly"]
+
+# Clients are created on first use, so importing the app needs no credentials
+# and doesn't pay for the Supabase and Google client libraries up front
+_lock = threading.Lock()
+_supabase = None
+_groq = None
+_storage = None
+_gmail_discovery_document = None
+
+def get_supabase() -> "Client":
+    global _supabase
+    if _supabase is None:
+        with _lock:
+            if _supabase is None:
+                from supabase import create_client
+                _supabase = create_client(os.getenv("SUPABASE_URL"), os.getenv("SUPABASE_KEY"))
+    return _supabase
+
+def get_storage() -> "Storage":
+    """The storage backend picked by STORAGE_BACKEND, Supabase unless set to sqlite"""
+    global _storage
+    if _storage is None:
+        with _lock:
+            if _storage is None:
+                from .storage import create_storage
+                _storage = create_storage()
+    return _storage
+
+def get_groq():
+    """
+    The shared Groq client. Retries on rate limits are handled by the parse
+    scheduler in pipeline.py. GROQ_BASE_URL can point the client at a local
+    fake server for benchmarks.
+    """
+    global _groq
+    if _groq is None:
+        with _lock:
+            if _groq is None:
+                from groq import Groq
+                _groq = Groq(api_key=os.getenv("GROQ_API_KEY"), max_retries=0)
+    return _groq
+
+def set_supabase(client) -> None:
+    """Use a different database client, e.g. a fake in benchmarks"""
+    global _supabase
+    _supabase = client
+
+def set_storage(storage) -> None:
+    global _storage
+    _storage = storage
+
+def set_groq(client) -> None:
+    global _groq
+    _groq = client
+
+def close_clients() -> None:
+    """Close pooled connections on shutdown"""
+    global _supabase, _groq, _storage
+    with _lock:
+        if _groq is not None:
+            try:
+                _groq.close()
+            except Exception as e:
+                print(f"Error closing Groq client: {str(e)}")
+        if _storage is not None:
+            try:
+                _storage.close()
+            except Exception as e:
+                print(f"Error closing storage: {str(e)}")
+        _supabase = None
+        _groq = None
+        _storage = None
+
+def _load_gmail_discovery_document() -> dict:
+    """
+    Read the Gmail API description from the local cache file, then from the
+    copy bundled with google-api-python-client, downloading it only if both
+    are missing.
+    """
+    if os.path.exists(GMAIL_DISCOVERY_PATH):
+        try:
+            with open(GMAIL_DISCOVERY_PATH) as f:
+                return json.load(f)
+        except Exception as e:
+            print(f"Error reading cached Gmail discovery document: {str(e)}")
+
+    from googleapiclient.discovery_cache import get_static_doc
+    document = get_static_doc("gmail", "v1")
+    if document:
+        return json.loads(document)
+
+    import httplib2
+    response, content = httplib2.Http().request(GMAIL_DISCOVERY_URL)
+    if response.status != 200:
+        raise Exception(f"Error downloading Gmail discovery document: HTTP {response.status}")
+
+    try:
+        with open(GMAIL_DISCOVERY_PATH, "wb") as f:
+            f.write(content)
+    except Exception as e:
+        print(f"Error caching Gmail discovery document: {str(e)}")
+    return json.loads(content)
+
+def get_gmail_discovery_document() -> dict:
+    global _gmail_discovery_document
+    if _gmail_discovery_document is None:
+        with _lock:
+            if _gmail_discovery_document is None:
+                _gmail_discovery_document = _load_gmail_discovery_document()
+    return _gmail_discovery_document
+
+def build_gmail_service(token: str):
+    """Create a Gmail API service for a user's token from the cached discovery document"""
+    from google.oauth2.credentials import Credentials
+    from googleapiclient.discovery import build_from_document
+
+    creds = Credentials(token, scopes=GMAIL_SCOPES)
+    return build_from_document(get_gmail_discovery_document(), credentials=creds)
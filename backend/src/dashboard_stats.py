@@ -0,0 +1,129 @@
+import threading
+from functools import partial
+from collections import Counter
+from datetime import datetime, timedelta
+
+from .storage import read_all
+
+def _week_start(value: str) -> str:
+    """Monday of the week a date or timestamp falls in"""
+    day = datetime.fromisoformat(value[:10]).date()
+    return (day - timedelta(days=day.weekday())).isoformat()
+
+def _stage_path(updates: dict) -> list:
+    """A job's stages in the order they were received, with repeats collapsed"""
+    path = []
+    for _, stage in sorted(updates.values(), key=lambda update: update[0]):
+        if not path or path[-1] != stage:
+            path.append(stage)
+    return path
+
+def _bump(counter: Counter, key, amount: int) -> None:
+    """Add to a counter, dropping keys that reach zero"""
+    counter[key] += amount
+    if counter[key] <= 0:
+        del counter[key]
+
+class DashboardStats:
+    """
+    Dashboard aggregates, built from the database on first use and then
+    kept current by insert_jobs and delete_job instead of rescanning.
+    Rows are tracked by ID, so recording a row twice doesn't count it twice.
+    IDs are compared as strings since route parameters arrive as strings.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.loaded = False
+        self.jobs = {}  # job_id -> (current_status, week of first_applied)
+        self.updates = {}  # job_id -> {update_id: (received_at, stage)}
+        self.status_counts = Counter()
+        self.weekly_applications = Counter()
+        self.stage_reach = Counter()  # Jobs that reached each stage
+        self.transitions = Counter()  # "from -> to" stage changes
+
+    def ensure_loaded(self, storage) -> None:
+        with self.lock:
+            if self.loaded:
+                return
+
+            jobs = read_all(partial(storage.list_jobs, "id, current_status, first_applied"), "first_applied")
+            updates = read_all(partial(storage.list_updates, columns="id, job_id, stage, received_at"), "received_at")
+
+            for job in jobs:
+                self._set_job(job["id"], job["current_status"], job["first_applied"])
+            for update in updates:
+                self._add_update(update["job_id"], update["id"], update["stage"], update["received_at"])
+
+            self.loaded = True
+            print(f"Loaded dashboard stats for {len(self.jobs)} jobs")
+
+    def record_job(self, job_id, current_status: str, first_applied: str) -> None:
+        with self.lock:
+            if self.loaded:
+                self._set_job(job_id, current_status, first_applied)
+
+    def record_update(self, job_id, update_id, stage: str, received_at: str) -> None:
+        with self.lock:
+            if self.loaded:
+                self._add_update(job_id, update_id, stage, received_at)
+
+    def remove_job(self, job_id) -> None:
+        job_id = str(job_id)
+        with self.lock:
+            if not self.loaded:
+                return
+            self._forget_job(job_id)
+            self._forget_path(job_id)
+            self.updates.pop(job_id, None)
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            return {
+                "total_applications": len(self.jobs),
+                "status_counts": dict(self.status_counts),
+                "weekly_applications": dict(sorted(self.weekly_applications.items())),
+                "stage_reach": dict(self.stage_reach),
+                "transitions": dict(self.transitions),
+            }
+
+    def _set_job(self, job_id, current_status: str, first_applied: str) -> None:
+        job_id = str(job_id)
+        self._forget_job(job_id)
+        week = _week_start(first_applied) if first_applied else None
+        self.jobs[job_id] = (current_status, week)
+        self.status_counts[current_status] += 1
+        if week:
+            self.weekly_applications[week] += 1
+
+    def _forget_job(self, job_id) -> None:
+        previous = self.jobs.pop(job_id, None)
+        if previous is None:
+            return
+        current_status, week = previous
+        _bump(self.status_counts, current_status, -1)
+        if week:
+            _bump(self.weekly_applications, week, -1)
+
+    def _add_update(self, job_id, update_id, stage: str, received_at: str) -> None:
+        job_id, update_id = str(job_id), str(update_id)
+        updates = self.updates.setdefault(job_id, {})
+        if update_id in updates:
+            return
+
+        # Updates can arrive out of date order, so recount this job's path
+        self._forget_path(job_id)
+        updates[update_id] = (received_at, stage)
+        self._count_path(job_id, 1)
+
+    def _forget_path(self, job_id) -> None:
+        self._count_path(job_id, -1)
+
+    def _count_path(self, job_id, sign: int) -> None:
+        path = _stage_path(self.updates.get(job_id, {}))
+        for stage in set(path):
+            _bump(self.stage_reach, stage, sign)
+        for from_stage, to_stage in zip(path, path[1:]):
+            _bump(self.transitions, f"{from_stage} -> {to_stage}", sign)
+
+dashboard_stats = DashboardStats()
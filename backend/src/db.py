@@ -1,104 +1,250 @@
-import os
-import datetime
-
-from supabase import create_client, Client
-from dotenv import load_dotenv
-from datetime import datetime
-
-load_dotenv()
-
-SUPABASE_URL = os.getenv("SUPABASE_URL")
-SUPABASE_KEY = os.getenv("SUPABASE_KEY")
-
-supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
-
-def insert_job(data: dict):
-    company = data.get("company")
-    position = data.get("position")
-    application_date_str = data.get("application_date")
-    stage = data.get("stage")
-    description = data.get("description")
-
-    if not company or not application_date_str:
-        print("Missing company or application date.")
-        return
-
-    # Parse date string to datetime
-    application_date = datetime.strptime(application_date_str, "%Y-%m-%d")
-
-    # Step 1: Check if job already exists
-    existing = supabase.table("job_applications").select("*").eq("company", company).execute()
-    
-    if existing.data:
-        # Job exists
-        job = existing.data[0]
-        job_id = job["id"]
-        
-        # Parse existing dates
-        first_applied = datetime.strptime(job["first_applied"], "%Y-%m-%d")
-        latest_update_at = datetime.fromisoformat(job["latest_update_at"])
-
-        # Step 2: Check for duplicate updates within a time window
-        time_window = datetime.timedelta(hours=24)  # Configurable time window
-        existing_updates = supabase.table("job_updates") \
-            .select("*") \
-            .eq("job_id", job_id) \
-            .eq("stage", stage) \
-            .execute()
-
-        # Check for similar updates within time window
-        for update in existing_updates.data:
-            update_date = datetime.fromisoformat(update["received_at"])
-            if abs(update_date - application_date) <= time_window:
-                if update["description"] == description:
-                    print(f"Similar update exists for {company} within {time_window}")
-                    return
-
-        # Compare and update application dates
-        if application_date < first_applied:
-            # Found an earlier application date
-            print(f"Found an earlier application date for {company}")
-            new_first_applied = application_date
+from datetime import datetime, timedelta
+
+from .clients import get_storage
+from .read_cache import read_cache
+from .dashboard_stats import dashboard_stats
+from . import metrics
+
+# Updates with the same stage and description this close together are duplicates
+DUPLICATE_UPDATE_WINDOW = timedelta(hours=24)
+
+def _parse_timestamp(value: str) -> datetime:
+    """Parse a stored timestamp, dropping any timezone so it compares with email dates"""
+    return datetime.fromisoformat(value).replace(tzinfo=None)
+
+def _parse_entries(jobs: list) -> list:
+    """Validate parsed emails and convert their application dates"""
+    entries = []
+    for data in jobs:
+        company = data.get("company")
+        application_date_str = data.get("application_date")
+
+        if not company or not application_date_str:
+            print("Missing company or application date.")
+            continue
+
+        try:
+            # Parse date string to datetime
+            application_date = datetime.strptime(application_date_str, "%Y-%m-%d")
+        except ValueError:
+            print(f"Invalid application date for {company}: {application_date_str}")
+            continue
+
+        entries.append({
+            "company": company,
+            "position": data.get("position"),
+            "stage": data.get("stage"),
+            "description": data.get("description"),
+            "application_date": application_date,
+            "msg_id": data.get("msg_id"),
+        })
+    return entries
+
+@metrics.span("db_write")
+def insert_jobs(jobs: list) -> int:
+    """
+    Record a batch of parsed job emails. Existing applications and recent
+    updates for every company in the batch are fetched, merged in memory and
+    written back with batched inserts and updates, all in one transaction,
+    so the number of round trips doesn't grow with the batch.
+    Entries are applied in order, with the same results as calling
+    insert_job for each one.
+    Returns the number of updates inserted.
+    """
+    entries = _parse_entries(jobs)
+    if not entries:
+        return 0
+
+    storage = get_storage()
+    written = False
+    try:
+        # Read and write in one transaction, so a batch running at the same time
+        # can't insert the same new company between our reads and our writes
+        with storage.transaction():
+            applications, new_updates = _merge_batch(storage, entries)
+
+            new_applications = [application for application in applications.values() if application["is_new"]]
+            changed_applications = [
+                application for application in applications.values()
+                if application["changed"] and not application["is_new"]
+            ]
+            written = bool(new_applications or changed_applications or new_updates)
+            _write_batch(storage, applications, new_applications, changed_applications, new_updates)
+    finally:
+        # Reads cached before this batch are stale, even if a write failed part way
+        if written:
+            read_cache.invalidate()
+
+    return len(new_updates)
+
+def _merge_batch(storage, entries: list) -> tuple:
+    """
+    Merge parsed entries into the stored applications of their companies.
+    Returns ({company: application}, [(application, new update)]).
+    """
+    companies = list(dict.fromkeys(entry["company"] for entry in entries))
+
+    # Step 1: Prefetch existing applications for every company in the batch
+    metrics.inc("api_calls", service=storage.name, call="job_applications.select")
+    existing = storage.get_applications(companies)
+
+    applications = {}
+    for job in existing:
+        if job["company"] in applications:
+            continue
+        applications[job["company"]] = {
+            "company": job["company"],
+            "row": job,
+            "is_new": False,
+            "first_applied": datetime.strptime(job["first_applied"], "%Y-%m-%d"),
+            "latest_update_at": _parse_timestamp(job["latest_update_at"]),
+            "current_status": job["current_status"],
+            "position": job["position"],
+            "changed": False,
+            "updates": [],
+        }
+
+    # Step 2: Prefetch updates that could be duplicates of anything in the batch
+    existing_ids = {application["row"]["id"]: application for application in applications.values()}
+    if existing_ids:
+        dates = [entry["application_date"] for entry in entries]
+        stages = list(dict.fromkeys(entry["stage"] for entry in entries))
+        # A missing stage only matches other missing stages, which SQL IN can't express
+        if None in stages:
+            stages = None
+        metrics.inc("api_calls", service=storage.name, call="job_updates.select")
+        existing_updates = storage.get_updates_between(
+            list(existing_ids),
+            stages,
+            (min(dates) - DUPLICATE_UPDATE_WINDOW).isoformat(),
+            (max(dates) + DUPLICATE_UPDATE_WINDOW).isoformat()
+        )
+
+        for update in existing_updates:
+            existing_ids[update["job_id"]]["updates"].append({
+                "stage": update["stage"],
+                "description": update["description"],
+                "received_at": _parse_timestamp(update["received_at"]),
+            })
+
+    # Step 3: Merge the batch in memory
+    new_updates = []
+    for entry in entries:
+        company = entry["company"]
+        stage = entry["stage"]
+        application_date = entry["application_date"]
+        application = applications.get(company)
+
+        if application:
+            # Check for similar updates within time window
+            duplicate = any(
+                update["stage"] == stage
+                and update["description"] == entry["description"]
+                and abs(update["received_at"] - application_date) <= DUPLICATE_UPDATE_WINDOW
+                for update in application["updates"]
+            )
+            if duplicate:
+                print(f"Similar update exists for {company} within {DUPLICATE_UPDATE_WINDOW}")
+                continue
+
+            if application_date < application["first_applied"]:
+                # Found an earlier application date
+                print(f"Found an earlier application date for {company}")
+                application["first_applied"] = application_date
+
+            if application_date > application["latest_update_at"]:
+                print(f"Updating latest interaction date for {company}")
+                application["latest_update_at"] = application_date
+
+            application["current_status"] = stage
+            application["position"] = entry["position"] or application["position"]  # Keep existing position if new one is None
+            application["changed"] = True
         else:
-            new_first_applied = first_applied
+            application = applications[company] = {
+                "company": company,
+                "row": None,
+                "is_new": True,
+                "first_applied": application_date,
+                "latest_update_at": application_date,
+                "current_status": stage,
+                "position": entry["position"],
+                "email_id": entry["msg_id"],
+                "changed": True,
+                "updates": [],
+            }
+
+        update = {
+            "stage": stage,
+            "description": entry["description"],
+            "received_at": application_date,
+        }
+        application["updates"].append(update)
+        new_updates.append((application, update))
+
+    return applications, new_updates
+
+def _write_batch(storage, applications: dict, new_applications: list, changed_applications: list,
+                 new_updates: list) -> None:
+    """Write a merged batch, filling in the ids of new applications"""
+    if new_applications:
+        metrics.inc("api_calls", service=storage.name, call="job_applications.insert")
+        inserted = storage.insert_applications([
+            {
+                "company": application["company"],
+                "position": application["position"],
+                "first_applied": application["first_applied"].date().isoformat(),
+                "latest_update_at": application["latest_update_at"].isoformat(),
+                "current_status": application["current_status"],
+                "email_id": application["email_id"]
+            }
+            for application in new_applications
+        ])
+
+        for row in inserted:
+            applications[row["company"]]["row"] = row
+        metrics.inc("rows_written", len(new_applications), table="job_applications")
+        print(f"Inserted {len(new_applications)} new job applications")
+
+    if changed_applications:
+        metrics.inc("api_calls", service=storage.name, call="job_applications.upsert")
+        storage.update_applications([
+            {
+                **application["row"],
+                "first_applied": application["first_applied"].date().isoformat(),
+                "latest_update_at": application["latest_update_at"].isoformat(),
+                "current_status": application["current_status"],
+                "position": application["position"]
+            }
+            for application in changed_applications
+        ])
+        metrics.inc("rows_written", len(changed_applications), table="job_applications")
+        print(f"Updated {len(changed_applications)} job applications")
+
+    for application in new_applications + changed_applications:
+        dashboard_stats.record_job(
+            application["row"]["id"],
+            application["current_status"],
+            application["first_applied"].date().isoformat()
+        )
+
+    if new_updates:
+        metrics.inc("api_calls", service=storage.name, call="job_updates.insert")
+        inserted = storage.insert_updates([
+            {
+                "job_id": application["row"]["id"],
+                "company": application["company"],
+                "stage": update["stage"],
+                "description": update["description"],
+                "received_at": update["received_at"].isoformat()
+            }
+            for application, update in new_updates
+        ])
+        metrics.inc("rows_written", len(new_updates), table="job_updates")
+        print(f"Inserted {len(new_updates)} job updates")
+
+        for row in inserted:
+            dashboard_stats.record_update(row["job_id"], row["id"], row["stage"], row["received_at"])
 
-        # Update latest interaction date if newer
-        if application_date > latest_update_at:
-            print(f"Updating latest interaction date for {company}")
-            new_latest_update_at = application_date
-        else:
-            new_latest_update_at = latest_update_at
-
-        # Update job application
-        supabase.table("job_applications").update({
-            "first_applied": new_first_applied.date().isoformat(),
-            "latest_update_at": new_latest_update_at.isoformat(),
-            "current_status": stage,
-            "position": position or job["position"]  # Keep existing position if new one is None
-        }).eq("id", job_id).execute()
-
-        print(f"Updated job application for {company}")
-    else:
-        # Insert new job
-        response = supabase.table("job_applications").insert({
-            "company": company,
-            "position": position,
-            "first_applied": application_date.date().isoformat(),
-            "latest_update_at": application_date.isoformat(),
-            "current_status": stage,
-            "email_id": data.get("msg_id")  # Add this line
-        }).execute()
-
-        job_id = response.data[0]["id"]
-        print(f"Inserted new job application for {company}")
-
-    # Step 3: Insert job update if it doesn't exist
-    supabase.table("job_updates").insert({
-        "job_id": job_id,
-        "company": company,
-        "stage": stage,
-        "description": description,
-        "received_at": application_date.isoformat()
-    }).execute()
-
-    print(f"Inserted job update for {company} ({stage}) on {application_date_str}")
+def insert_job(data: dict):
+    """Record a single parsed job email"""
+    insert_jobs([data])
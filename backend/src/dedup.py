@@ -0,0 +1,145 @@
+import os
+import re
+import hashlib
+
+from .preprocess import strip_quoted_replies, strip_signature, strip_footers
+from .local_classifier import ATS_SENDER_DOMAINS, SHARED_DOMAINS, detect_ats, extract_company
+
+NEAR_DUP_DISABLED = os.getenv("NEAR_DUP_DISABLED", "false").lower() == "true"
+# Bits out of SIMHASH_BITS two emails from the same sender can differ by and still be one email
+NEAR_DUP_MAX_DISTANCE = int(os.getenv("NEAR_DUP_MAX_DISTANCE", "4"))
+# Looser limit for emails in the same Gmail thread, e.g. a reminder and the invite it repeats
+NEAR_DUP_THREAD_MAX_DISTANCE = int(os.getenv("NEAR_DUP_THREAD_MAX_DISTANCE", "10"))
+
+SIMHASH_BITS = 64
+SHINGLE_WORDS = 3
+
+_url_regex = re.compile(r"https?://\S+")
+_number_regex = re.compile(r"\d+")
+_word_regex = re.compile(r"[a-z#]+")
+_address_regex = re.compile(r"<([^>]+)>")
+_no_reply_regex = re.compile(r"^(?:no-?reply|do-?not-?reply|notifications?)\b", re.IGNORECASE)
+
+def normalize_body(text: str) -> list:
+    """
+    Words of an email body with quoted replies, signatures, footers, links
+    and numbers removed, so re-sends and reminders compare as equal
+    """
+    text = strip_footers(strip_signature(strip_quoted_replies(text)))
+    text = _url_regex.sub(" ", text.lower())
+    text = _number_regex.sub("#", text)
+    return _word_regex.findall(text)
+
+def simhash(words: list) -> int:
+    """SimHash of the word shingles, where similar texts differ in few bits"""
+    shingles = [" ".join(words[i:i + SHINGLE_WORDS]) for i in range(max(1, len(words) - SHINGLE_WORDS + 1))]
+    # Every shingle's hash as a row of bits, most significant first. Counting
+    # a column with a stepped slice keeps the per-bit work out of Python loops.
+    bits = "".join(
+        format(int.from_bytes(hashlib.blake2b(shingle.encode(), digest_size=SIMHASH_BITS // 8).digest(), "big"),
+               f"0{SIMHASH_BITS}b")
+        for shingle in shingles
+    )
+
+    fingerprint = 0
+    for column in range(SIMHASH_BITS):
+        # A bit is set when more shingles have it set than not
+        if bits[column::SIMHASH_BITS].count("1") * 2 > len(shingles):
+            fingerprint |= 1 << (SIMHASH_BITS - 1 - column)
+    return fingerprint
+
+def hamming_distance(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+def _sender_address(sender: str) -> str:
+    match = _address_regex.search(sender or "")
+    return (match.group(1) if match else sender or "").strip().lower()
+
+def _is_shared_sender(address: str) -> bool:
+    """
+    Whether the address sends the same templates for many companies, like an
+    ATS, a job board or a no-reply mailbox
+    """
+    local, _, domain = address.rpartition("@")
+    if _no_reply_regex.match(local):
+        return True
+    parts = domain.split(".")
+    parents = {".".join(parts[index:]) for index in range(len(parts) - 1)}
+    return bool(parents & (SHARED_DOMAINS | set(ATS_SENDER_DOMAINS)))
+
+def _entity(email: dict):
+    """The company an email is about, lowercased, or None if it names none"""
+    subject, sender, body = email.get("subject") or "", email.get("sender") or "", email["body"]
+    company, _ = extract_company(subject, sender, body, detect_ats(sender, body))
+    return company.lower() if company else None
+
+def _bands(count: int) -> list:
+    """Split the fingerprint into count (shift, mask) bands of near equal width"""
+    count = max(1, min(count, SIMHASH_BITS))
+    edges = [SIMHASH_BITS * i // count for i in range(count + 1)]
+    return [(start, (1 << (end - start)) - 1) for start, end in zip(edges, edges[1:])]
+
+def reuse_result(result: dict, email: dict) -> dict:
+    """A representative's parse result, dated for one of its duplicates"""
+    reused = dict(result)
+    if reused.get("job_related"):
+        reused["application_date"] = email["date"]
+    return reused
+
+class NearDuplicateIndex:
+    """
+    Clusters near-identical emails so only one per cluster is parsed.
+    Emails from the same sender about the same company match when their
+    SimHashes are within max_distance bits, found through LSH bands: with
+    max_distance + 1 bands, any two fingerprints that close agree exactly on
+    at least one band. Emails in the same thread are compared directly with
+    thread_max_distance. An ATS template differs by only a few bits between
+    companies, so emails from shared senders that name no company, or with
+    no sender at all, are never clustered.
+    """
+
+    def __init__(self, max_distance: int = NEAR_DUP_MAX_DISTANCE,
+                 thread_max_distance: int = NEAR_DUP_THREAD_MAX_DISTANCE):
+        self.max_distance = max_distance
+        self.thread_max_distance = thread_max_distance
+        self.bands = _bands(max_distance + 1)
+        self.buckets = {}  # (sender, company, band, value) -> [(fingerprint, msg_id)]
+        self.threads = {}  # thread_id -> [(fingerprint, company, msg_id)]
+        self.msg_ids = set()
+
+    def representative(self, email: dict):
+        """
+        The msg_id of an earlier email this one duplicates, or None after
+        adding this email as the representative of a new cluster
+        """
+        msg_id = email["msg_id"]
+        # CC'd and re-delivered copies keep the original Message-ID
+        if msg_id in self.msg_ids:
+            return msg_id
+
+        fingerprint = simhash(normalize_body(email["body"]))
+        sender = _sender_address(email.get("sender"))
+        company = _entity(email)
+        thread_id = email.get("thread_id")
+
+        if thread_id:
+            for other, other_company, other_id in self.threads.get(thread_id, []):
+                if other_company == company and hamming_distance(fingerprint, other) <= self.thread_max_distance:
+                    return other_id
+
+        keys = []
+        if sender and (company or not _is_shared_sender(sender)):
+            keys = [
+                (sender, company, index, fingerprint >> shift & mask) for index, (shift, mask) in enumerate(self.bands)
+            ]
+        for key in keys:
+            for other, other_id in self.buckets.get(key, []):
+                if hamming_distance(fingerprint, other) <= self.max_distance:
+                    return other_id
+
+        self.msg_ids.add(msg_id)
+        for key in keys:
+            self.buckets.setdefault(key, []).append((fingerprint, msg_id))
+        if thread_id:
+            self.threads.setdefault(thread_id, []).append((fingerprint, company, msg_id))
+        return None
@@ -1,139 +1,559 @@
 import os
 import re
+import random
+import asyncio
+import threading
 from datetime import datetime
+from collections import OrderedDict
 from base64 import urlsafe_b64decode
-from google.oauth2.credentials import Credentials
-from googleapiclient.discovery import build
-from bs4 import BeautifulSoup
-from supabase import Client
-from .db import supabase
+from typing import TYPE_CHECKING
+from googleapiclient.errors import HttpError
+import html2text
+from .clients import build_gmail_service, get_storage
+from .ai_parser import MAX_EMAIL_TOKENS
+from . import metrics
+
+# Gmail accepts up to 100 calls per batch, but recommends 50 to avoid rate limiting
+GMAIL_BATCH_SIZE = int(os.getenv("GMAIL_BATCH_SIZE", "50"))
+GMAIL_BATCH_CONCURRENCY = int(os.getenv("GMAIL_BATCH_CONCURRENCY", "4"))
+GMAIL_MAX_RETRIES = 5
+GMAIL_BACKOFF_BASE = 1.0  # Seconds, doubled on every retry
+GMAIL_BACKOFF_MAX = 32.0
+
+# Remember processed message IDs in this process, so repeat scans over the
+# same range skip the database. Off by default: the cache only forgets IDs
+# when processed state is cleared through the API, so restart the server
+# after clearing processed_emails in the database directly.
+PROCESSED_CACHE_ENABLED = os.getenv("PROCESSED_CACHE_ENABLED", "false").lower() == "true"
+PROCESSED_CACHE_MAX_ENTRIES = int(os.getenv("PROCESSED_CACHE_MAX_ENTRIES", "10000"))
+
+# Never hold more body text than the LLM will see after truncation
+MAX_BODY_CHARS = MAX_EMAIL_TOKENS * 4
+HTML_BYTES_PER_TEXT_CHAR = 8  # Allowance for markup when capping HTML before conversion
+
+# Gmail quota units per call, charged against the account's quota bucket when one is given
+GMAIL_QUOTA_UNITS = {"messages.get": 5, "messages.list": 5, "history.list": 2, "getProfile": 1}
+
+# Headers needed to prefilter an email before downloading its body
+METADATA_HEADERS = ["Subject", "Message-ID", "From"]
+
+if TYPE_CHECKING:
+    from .storage import Storage
 
 def get_service(token: str):
     """Create Gmail API service instance"""
-    creds = Credentials(token, scopes=["https://www.googleapis.com/auth/gmail.readonly"])
-    return build("gmail", "v1", credentials=creds)
+    return build_gmail_service(token)
+
+def new_fetch_stats() -> dict:
+    """Counters for how many messages and bytes each fetch phase handles"""
+    return {
+        "listed": 0,
+        "already_processed": 0,
+        "metadata_fetched": 0,
+        "metadata_bytes": 0,
+        "metadata_dropped": 0,
+        "full_fetched": 0,
+        "full_bytes": 0,
+        "body_dropped": 0,
+        "yielded": 0,
+    }
+
+def _payload_size(part: dict) -> int:
+    """Encoded body data and header bytes of a MIME part, counted without serializing it"""
+    size = len(part.get("body", {}).get("data", ""))
+    size += sum(len(header["name"]) + len(header["value"]) for header in part.get("headers", []))
+    return size + sum(_payload_size(child) for child in part.get("parts", []))
+
+def _record_fetch(stats: dict, phase: str, messages: dict) -> None:
+    """Add fetched message counts, and payload sizes when metrics are on, to the stats"""
+    stats[f"{phase}_fetched"] += len(messages)
+    if not metrics.METRICS_ENABLED:
+        return
+    size = sum(_payload_size(msg.get("payload", {})) for msg in messages.values())
+    stats[f"{phase}_bytes"] += size
+    metrics.inc("bytes", size, source="gmail", phase=phase)
+
+def _get_header(msg: dict, name: str):
+    """Get a header value from a message payload, case-insensitively"""
+    headers = msg.get("payload", {}).get("headers", [])
+    return next((h["value"] for h in headers if h["name"].lower() == name), None)
+
+def _decode_data(data: str, max_bytes: int) -> str:
+    """Decode at most max_bytes of base64url part data"""
+    encoded_limit = (max_bytes + 2) // 3 * 4
+    data = data[:encoded_limit]
+    data += "=" * (-len(data) % 4)
+    return urlsafe_b64decode(data).decode("utf-8", "ignore")
+
+def _is_attachment(part: dict) -> bool:
+    return bool(part.get("filename")) or "attachmentId" in part.get("body", {})
+
+def _find_text_part(part: dict, html_parts: list):
+    """
+    Walk the MIME tree depth first and return the first text/plain part,
+    collecting text/html parts on the way. Nothing is decoded here.
+    """
+    if "parts" in part:
+        for child in part["parts"]:
+            found = _find_text_part(child, html_parts)
+            if found:
+                return found
+        return None
+
+    if _is_attachment(part) or not part.get("body", {}).get("data"):
+        return None
+
+    mime = part.get("mimeType", "")
+    if mime == "text/plain":
+        return part
+    if mime == "text/html":
+        html_parts.append(part)
+    return None
 
-def extract_body(full_msg):
-    """Extract email body from message payload"""
+def _html_to_text(html: str) -> str:
+    converter = html2text.HTML2Text()
+    converter.ignore_links = True
+    converter.ignore_images = True
+    converter.body_width = 0  # Don't re-wrap lines
+    return converter.handle(html)
+
+def extract_body(full_msg, max_chars: int = MAX_BODY_CHARS):
+    """Extract email body from message payload, capped at max_chars"""
     payload = full_msg["payload"]
-    html_fallback = None
-
-    if "parts" in payload:
-        for part in payload["parts"]:
-            mime = part["mimeType"]
-            data = part["body"].get("data")
-
-            if data:
-                decoded = urlsafe_b64decode(data).decode("utf-8")
-                if mime == "text/plain":
-                    return decoded
-                elif mime == "text/html":
-                    html_fallback = decoded
-
-    if html_fallback:
-        soup = BeautifulSoup(html_fallback, "html.parser")
-        return soup.get_text(separator="\n")
-    
-    data = payload["body"].get("data")
-    if data:
-        return urlsafe_b64decode(data).decode("utf-8")
-    
+    html_parts = []
+
+    # A non-multipart payload is treated like a single part
+    text_part = _find_text_part(payload, html_parts)
+    if text_part:
+        # UTF-8 uses at most 4 bytes per character
+        return _decode_data(text_part["body"]["data"], max_chars * 4)[:max_chars]
+
+    if html_parts:
+        html = _decode_data(html_parts[0]["body"]["data"], max_chars * HTML_BYTES_PER_TEXT_CHAR)
+        return _html_to_text(html)[:max_chars]
+
+    # Fall back to the top-level body for payloads with an unusual MIME type
+    data = payload.get("body", {}).get("data")
+    if data and "parts" not in payload:
+        return _decode_data(data, max_chars * 4)[:max_chars]
+
     return None
 
-def mark_email_as_processed(db: Client, msg_id: str) -> None:
+def _is_retryable(exception) -> bool:
+    """Check if a Gmail error is a rate limit or transient server error"""
+    if not isinstance(exception, HttpError):
+        return False
+    status = exception.resp.status
+    if status in (429, 500, 502, 503):
+        return True
+    content = exception.content.decode("utf-8", "ignore") if isinstance(exception.content, bytes) else str(exception.content)
+    return status == 403 and ("rateLimitExceeded" in content or "userRateLimitExceeded" in content)
+
+def _new_http(service):
+    """Create a separate connection per batch, httplib2 is not thread-safe"""
+    credentials = getattr(getattr(service, "_http", None), "credentials", None)
+    if credentials is None:
+        return None
+
+    import httplib2
+    from google_auth_httplib2 import AuthorizedHttp
+    return AuthorizedHttp(credentials, http=httplib2.Http())
+
+def _execute_batch(service, msg_ids: list, format: str, metadata_headers: list = None):
+    """Run one Gmail batch request, returning fetched messages and IDs to retry"""
+    messages = {}
+    retry_ids = []
+
+    def callback(request_id, response, exception):
+        # Each message succeeds or fails on its own within the batch
+        if exception is None:
+            messages[request_id] = response
+        elif _is_retryable(exception):
+            retry_ids.append(request_id)
+        else:
+            metrics.inc("api_errors", service="gmail", call="messages.get")
+            print(f"Error fetching message {request_id}: {str(exception)}")
+
+    params = {"userId": "me", "format": format}
+    if metadata_headers:
+        params["metadataHeaders"] = metadata_headers
+
+    batch = service.new_batch_http_request(callback=callback)
+    for msg_id in msg_ids:
+        batch.add(service.users().messages().get(id=msg_id, **params), request_id=msg_id)
+    metrics.inc("api_calls", service="gmail", call="batch")
+    with metrics.span("gmail_fetch"):
+        batch.execute(http=_new_http(service))
+
+    return messages, retry_ids
+
+async def fetch_messages(service, msg_ids: list, format: str = "full", metadata_headers: list = None,
+                         concurrency: int = GMAIL_BATCH_CONCURRENCY, quota=None) -> dict:
+    """
+    Fetch messages with concurrent Gmail batch requests, keyed by message ID.
+    quota is anything with an async acquire(units), such as a TokenBucket.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    results = {}
+
+    async def fetch_chunk(chunk: list):
+        pending = chunk
+        for attempt in range(GMAIL_MAX_RETRIES + 1):
+            async with semaphore:
+                if quota:
+                    await quota.acquire(GMAIL_QUOTA_UNITS["messages.get"] * len(pending))
+                try:
+                    messages, pending = await asyncio.to_thread(
+                        _execute_batch, service, pending, format, metadata_headers
+                    )
+                    results.update(messages)
+                except HttpError as e:
+                    # The whole batch was rejected, retry all of it if rate limited
+                    if not _is_retryable(e):
+                        print(f"Error executing batch of {len(pending)} messages: {str(e)}")
+                        return
+                except Exception as e:
+                    print(f"Error executing batch of {len(pending)} messages: {str(e)}")
+                    return
+
+            if not pending or attempt == GMAIL_MAX_RETRIES:
+                break
+
+            delay = min(GMAIL_BACKOFF_BASE * 2 ** attempt, GMAIL_BACKOFF_MAX) + random.uniform(0, 1)
+            metrics.inc("retries", len(pending), service="gmail")
+            print(f"Rate limited on {len(pending)} messages, retrying in {delay:.1f}s")
+            await asyncio.sleep(delay)
+
+        if pending:
+            print(f"Giving up on {len(pending)} messages after {GMAIL_MAX_RETRIES} retries")
+
+    chunks = [msg_ids[i:i + GMAIL_BATCH_SIZE] for i in range(0, len(msg_ids), GMAIL_BATCH_SIZE)]
+    await asyncio.gather(*(fetch_chunk(chunk) for chunk in chunks))
+    return results
+
+def mark_email_as_processed(storage: "Storage", msg_id: str) -> None:
     """Track processed emails in the database"""
     try:
         # Check if already processed
-        response = db.table("processed_emails").select("*").eq("id", msg_id).execute()
-        if response.data:
+        if storage.get_processed_ids([msg_id]):
             print(f"Email {msg_id} already processed")
             return
 
-        # Insert new record
-        result = db.table("processed_emails").insert({
-            "id": msg_id,
-            "processed_at": datetime.now().isoformat()
-        }).execute()
-        
-        if not result.data:
-            raise Exception("Failed to insert record")
-            
+        storage.mark_processed([msg_id])
         print(f"Successfully marked email {msg_id} as processed")
         
     except Exception as e:
         print(f"Error marking email as processed: {str(e)}")
         raise e
 
-def is_email_processed(db: Client, msg_id: str) -> bool:
+def is_email_processed(storage: "Storage", msg_id: str) -> bool:
     """Check if an email has been processed"""
     try:
-        response = db.table("processed_emails").select("id").eq("id", msg_id).execute()
-        return len(response.data) > 0
+        return bool(storage.get_processed_ids([msg_id]))
     except Exception as e:
         print(f"Error checking processed email: {str(e)}")
         return False
 
-def is_possibly_job_related(email_subject: str, email_text: str) -> bool:
-    """Detect job-related emails with pattern matching"""
-    text = (email_subject + " " + email_text).lower()
-    
-    # Exclude patterns for non-job emails
-    exclude_patterns = [
-        r"github\.com/.*/issues/\d+",  # GitHub issues
-        r"lease\s+agreement",  # Housing
-        r"rental\s+application",
-        r"apartment\s+lease",
-        r"password\s+reset",  # Security
-        r"payment\s+confirmation",  # Financial
-        r"job\s+alert\s+digest",  # Job alerts
-        r"similar\s+jobs\s+for\s+you",
-        r"weekly\s+job\s+matches",
-        r"new\s+jobs\s+in\s+your\s+area"
-    ]
-    
-    if any(re.search(pattern, text, re.IGNORECASE) for pattern in exclude_patterns):
-        print(f"Excluded email - matched exclusion pattern")
-        return False
+class ProcessedIdCache:
+    """LRU set of message IDs known to be processed, shared by every scan"""
+
+    def __init__(self, max_entries: int = PROCESSED_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.ids = OrderedDict()
+        self.lock = threading.Lock()
 
-    # Job application patterns
-    application_patterns = [
-        (r"thank.*for.*apply(ing|ication)", "application confirmation"),
-        (r"application.*received|received.*application", "application received"),
-        (r"interview.*schedule|schedule.*interview", "interview invitation"),
-        (r"next.*steps.*application|application.*next.*steps", "next steps"),
-        (r"offer.*letter|job\s+offer", "offer"),
-        (r"unfortunately.*not.*moving.*forward|regret.*inform", "rejection"),
-        (r"coding.*assessment|technical.*challenge", "assessment"),
-        (r"background.*check|employment.*verification", "background check"),
-        (r"application.*status|status.*update", "status update"),
-        (r"moved.*forward|advance.*next.*round", "advancing"),
-        (r"welcome.*team", "offer acceptance"),  
-        (r"internship", "internship"),       
-    ]
-    
-    for pattern, category in application_patterns:
-        if re.search(pattern, text, re.IGNORECASE):
-            print(f"Matched job pattern: {category}")
+    def __contains__(self, msg_id: str) -> bool:
+        with self.lock:
+            if msg_id not in self.ids:
+                return False
+            self.ids.move_to_end(msg_id)
             return True
 
+    def update(self, msg_ids) -> None:
+        with self.lock:
+            for msg_id in msg_ids:
+                self.ids[msg_id] = None
+                self.ids.move_to_end(msg_id)
+            while len(self.ids) > self.max_entries:
+                self.ids.popitem(last=False)
+
+    def invalidate(self) -> None:
+        """Forget every ID, after processed state was cleared or jobs deleted"""
+        with self.lock:
+            self.ids.clear()
+
+_processed_cache = ProcessedIdCache()
+
+def get_processed_cache():
+    """Return the shared processed ID cache, or None when it is disabled"""
+    return _processed_cache if PROCESSED_CACHE_ENABLED else None
+
+def invalidate_processed_cache() -> None:
+    _processed_cache.invalidate()
+
+def filter_unprocessed(storage: "Storage", msg_ids: list, cache: ProcessedIdCache = None) -> list:
+    """Return the IDs that have not been processed yet, checked with a single query"""
+    unknown_ids = [msg_id for msg_id in msg_ids if not (cache is not None and msg_id in cache)]
+    if not unknown_ids:
+        return []
+
+    try:
+        metrics.inc("api_calls", service=storage.name, call="processed_emails.select")
+        with metrics.span("db_read"):
+            processed_ids = storage.get_processed_ids(unknown_ids)
+    except Exception as e:
+        metrics.inc("api_errors", service=storage.name, call="processed_emails.select")
+        print(f"Error checking processed emails: {str(e)}")
+        return unknown_ids
+
+    if cache is not None:
+        cache.update(processed_ids)
+
+    return [msg_id for msg_id in unknown_ids if msg_id not in processed_ids]
+
+class ProcessedEmailBuffer:
+    """Buffer processed email IDs and write them in one upsert"""
+
+    def __init__(self, storage: "Storage", cache: ProcessedIdCache = None):
+        self.storage = storage
+        self.cache = cache
+        self.pending = []
+
+    def add(self, msg_id: str) -> None:
+        self.pending.append(msg_id)
+
+    def flush(self) -> None:
+        """Write all buffered IDs, keeping them buffered if the write fails"""
+        if not self.pending:
+            return
+
+        count = len(self.pending)
+        try:
+            metrics.inc("api_calls", service=self.storage.name, call="processed_emails.upsert")
+            with metrics.span("db_write"):
+                self.storage.mark_processed(self.pending)
+        except Exception as e:
+            metrics.inc("api_errors", service=self.storage.name, call="processed_emails.upsert")
+            print(f"Error marking {count} emails as processed: {str(e)}")
+            return
+
+        metrics.inc("rows_written", count, table="processed_emails")
+        if self.cache is not None:
+            self.cache.update(self.pending)
+
+        print(f"Successfully marked {count} emails as processed")
+        self.pending = []
+
+# Exclude patterns for non-job emails
+EXCLUDE_PATTERNS = [
+    r"github\.com/.*/issues/\d+",  # GitHub issues
+    r"lease\s+agreement",  # Housing
+    r"rental\s+application",
+    r"apartment\s+lease",
+    r"password\s+reset",  # Security
+    r"payment\s+confirmation",  # Financial
+    r"job\s+alert\s+digest",  # Job alerts
+    r"similar\s+jobs\s+for\s+you",
+    r"weekly\s+job\s+matches",
+    r"new\s+jobs\s+in\s+your\s+area"
+]
+
+# Job application patterns. Lazy quantifiers find the same matches as greedy
+# ones but don't run to the end of every line and backtrack on long bodies.
+APPLICATION_PATTERNS = [
+    (r"thank.*?for.*?apply(?:ing|ication)", "application confirmation"),
+    (r"application.*?received|received.*?application", "application received"),
+    (r"interview.*?schedule|schedule.*?interview", "interview invitation"),
+    (r"next.*?steps.*?application|application.*?next.*?steps", "next steps"),
+    (r"offer.*?letter|job\s+offer", "offer"),
+    (r"unfortunately.*?not.*?moving.*?forward|regret.*?inform", "rejection"),
+    (r"coding.*?assessment|technical.*?challenge", "assessment"),
+    (r"background.*?check|employment.*?verification", "background check"),
+    (r"application.*?status|status.*?update", "status update"),
+    (r"moved.*?forward|advance.*?next.*?round", "advancing"),
+    (r"welcome.*?team", "offer acceptance"),
+    (r"internship", "internship"),
+]
+
+EXCLUDED = "excluded"
+APPLICATION_CONTEXT = "application context"
+
+# Each pattern list is compiled into one alternation so the text is scanned once per list
+_exclude_regex = re.compile("|".join(f"(?:{pattern})" for pattern in EXCLUDE_PATTERNS), re.IGNORECASE)
+_application_regex = re.compile(
+    "|".join(f"(?P<p{index}>{pattern})" for index, (pattern, _) in enumerate(APPLICATION_PATTERNS)),
+    re.IGNORECASE
+)
+_application_categories = {f"p{index}": category for index, (_, category) in enumerate(APPLICATION_PATTERNS)}
+
+def classify_job_relevance(email_subject: str, email_text: str):
+    """
+    Return the matched job category, EXCLUDED for known non-job emails, or
+    None if nothing matched. When several patterns match, the category of
+    the earliest match in the text is returned.
+    """
+    text = (email_subject + " " + email_text).lower()
+
+    if _exclude_regex.search(text):
+        return EXCLUDED
+
+    match = _application_regex.search(text)
+    if match:
+        return _application_categories[match.lastgroup]
+
     # Check ambiguous cases
     if ("application" in text or "applied" in text) and \
        not any(word in text for word in ["lease", "rental", "credit", "loan"]) and \
        any(word in text for word in ["position", "role", "opportunity", "candidacy", "hiring"]):
+        return APPLICATION_CONTEXT
+
+    return None
+
+def is_possibly_job_related(email_subject: str, email_text: str) -> bool:
+    """Detect job-related emails with pattern matching"""
+    category = classify_job_relevance(email_subject, email_text)
+
+    if category == EXCLUDED:
+        print(f"Excluded email - matched exclusion pattern")
+        return False
+
+    if category == APPLICATION_CONTEXT:
         print("Matched job application context")
         return True
 
+    if category:
+        print(f"Matched job pattern: {category}")
+        return True
+
     return False
 
-async def get_emails(service, start_date: str, end_date: str, request=None):
-    """Fetch emails one by one within date range"""
+def get_sync_state(storage: "Storage", account: str):
+    """Get the Gmail history ID saved after the last completed scan of an account"""
+    try:
+        return storage.get_sync_state(account)
+    except Exception as e:
+        print(f"Error reading sync state: {str(e)}")
+        return None
+
+def save_sync_state(storage: "Storage", account: str, history_id: str) -> None:
+    """Remember where the next incremental scan of an account should start"""
+    try:
+        storage.save_sync_state(account, history_id)
+        print(f"Saved history ID {history_id} for {account}")
+    except Exception as e:
+        print(f"Error saving sync state: {str(e)}")
+
+async def _list_query_pages(service, query: str, page_token: str = None, quota=None):
+    """Yield (message IDs, next page token) for each page matching a search query"""
+    while True:
+        if quota:
+            await quota.acquire(GMAIL_QUOTA_UNITS["messages.list"])
+        metrics.inc("api_calls", service="gmail", call="messages.list")
+        with metrics.span("gmail_list"):
+            response = await asyncio.to_thread(
+                service.users().messages().list(
+                    userId="me",
+                    q=query,
+                    maxResults=500,
+                    pageToken=page_token,
+                ).execute
+            )
+        page_token = response.get("nextPageToken")
+        yield [msg["id"] for msg in response.get("messages", [])], page_token
+
+        if not page_token:
+            break
+
+async def _list_history_pages(service, start_history_id: str, quota=None):
+    """
+    Yield (message IDs, None) for each page of messages added since a history
+    ID. History pages aren't checkpointed, listing them again is cheap.
+    """
+    page_token = None
+    while True:
+        if quota:
+            await quota.acquire(GMAIL_QUOTA_UNITS["history.list"])
+        metrics.inc("api_calls", service="gmail", call="history.list")
+        with metrics.span("gmail_list"):
+            response = await asyncio.to_thread(
+                service.users().history().list(
+                    userId="me",
+                    startHistoryId=start_history_id,
+                    historyTypes=["messageAdded"],
+                    maxResults=500,
+                    pageToken=page_token,
+                ).execute
+            )
+        msg_ids = [
+            added["message"]["id"]
+            for record in response.get("history", [])
+            for added in record.get("messagesAdded", [])
+        ]
+        # A message can show up in several history records
+        yield list(dict.fromkeys(msg_ids)), None
+
+        page_token = response.get("nextPageToken")
+        if not page_token:
+            break
+
+async def _list_message_pages(service, query: str, start_history_id: str = None, page_token: str = None,
+                              quota=None):
+    """Yield pages of message IDs from history when possible, otherwise from the query"""
+    if start_history_id:
+        try:
+            print(f"\nListing emails added since history ID {start_history_id}")
+            async for page in _list_history_pages(service, start_history_id, quota):
+                yield page
+            return
+        except HttpError as e:
+            # Gmail only keeps history for about a week
+            if e.resp.status != 404:
+                raise
+            print("History ID expired, falling back to a full range scan")
+
+    print(f"\nSearching emails with query: {query}")
+    async for page in _list_query_pages(service, query, page_token, quota):
+        yield page
+
+async def get_emails(service, start_date: str, end_date: str, request=None, stats: dict = None,
+                     incremental: bool = False, page_token: str = None, on_page=None, quota=None,
+                     on_synced=None):
+    """
+    Fetch emails within date range, one batched page at a time.
+    With incremental set, only emails added since the last completed scan of
+    the account are fetched, ignoring the date range.
+    A range scan starts from page_token if given, and awaits on_page with the
+    next page token once each page's emails have been yielded.
+    Only dropped emails are marked processed here. Yielded ones carry their
+    Gmail ID as gmail_id for the caller to mark once it has handled them.
+    An incremental scan that lists every page saves the account's history ID,
+    or awaits on_synced with the account and history ID to save instead.
+    Gmail calls are charged to quota when given.
+    """
+    if stats is None:
+        stats = new_fetch_stats()
+    storage = get_storage()
+    processed_cache = get_processed_cache()
+    processed = ProcessedEmailBuffer(storage, processed_cache)
+    pages = None
+
     try:
         start_date_formatted = start_date.replace('-', '/')
         end_date_formatted = end_date.replace('-', '/')
         query = f"after:{start_date_formatted} before:{end_date_formatted}"
-        
-        print(f"\nSearching emails with query: {query}")
-        next_page_token = None
+
+        account = None
+        start_history_id = None
+        if incremental:
+            # Taken before listing so emails arriving during the scan are picked up next time
+            if quota:
+                await quota.acquire(GMAIL_QUOTA_UNITS["getProfile"])
+            profile = await asyncio.to_thread(service.users().getProfile(userId="me").execute)
+            account = profile["emailAddress"]
+            latest_history_id = profile["historyId"]
+            start_history_id = await asyncio.to_thread(get_sync_state, storage, account)
+
+        pages = _list_message_pages(service, query, start_history_id, page_token, quota)
         
         while True:
             # Check for disconnection before fetching batch
@@ -142,41 +562,67 @@ async def get_emails(service, start_date: str, end_date: str, request=None):
                 await request.close()  # Force close the request
                 return
 
-            response = service.users().messages().list(
-                userId="me", 
-                q=query,
-                maxResults=500,
-                pageToken=next_page_token,
-            ).execute()
-            
-            messages = response.get("messages", [])
+            page = await anext(pages, None)
+            if page is None:
+                break
+            messages, next_page_token = page
+
+            stats["listed"] += len(messages)
+
+            # Step 2: Skip already processed emails before fetching anything
+            msg_ids = await asyncio.to_thread(filter_unprocessed, storage, messages, processed_cache)
+            stats["already_processed"] += len(messages) - len(msg_ids)
+            if len(messages) > len(msg_ids):
+                print(f"Skipping {len(messages) - len(msg_ids)} already processed emails")
+
+            # Phase 1: Fetch headers only and run the subject prefilter on them
+            metadata_msgs = await fetch_messages(
+                service, msg_ids, format="metadata", metadata_headers=METADATA_HEADERS, quota=quota
+            )
+            _record_fetch(stats, "metadata", metadata_msgs)
+
+            candidate_ids = []
+            for msg_id in msg_ids:
+                # Failed fetches are left unprocessed so the next scan retries them
+                metadata_msg = metadata_msgs.get(msg_id)
+                if metadata_msg is None:
+                    continue
+
+                with metrics.span("prefilter"):
+                    possibly_job_related = is_possibly_job_related(_get_header(metadata_msg, "subject") or "", "")
+                if possibly_job_related:
+                    candidate_ids.append(msg_id)
+                    continue
+
+                stats["metadata_dropped"] += 1
+                if request and await request.is_disconnected():
+                    print("\nSearch stopped by user during email filtering")
+                    await request.close()  # Force close the request
+                    return
+
+                processed.add(msg_id)
+
+            # Phase 2: Download full bodies for the survivors only
+            full_msgs = await fetch_messages(service, candidate_ids, quota=quota)
+            _record_fetch(stats, "full", full_msgs)
             
-            for msg in messages:
+            for msg_id in candidate_ids:
                 # Check for disconnection before processing each email
                 if request and await request.is_disconnected():
                     print("\nSearch stopped by user during email processing")
                     await request.close()  # Force close the request
                     return
 
-                msg_id = msg["id"]
-                
-                # Step 2: Check if already processed
-                if is_email_processed(supabase, msg_id):
-                    print(f"Skipping already processed email: {msg_id}")
+                full_msg = full_msgs.get(msg_id)
+                if full_msg is None:
                     continue
                 
                 try:
-                    # Step 1: Get full email content
-                    full_msg = service.users().messages().get(
-                        userId="me", 
-                        id=msg_id, 
-                        format="full"
-                    ).execute()
-                    
-                    # Get headers
-                    headers = full_msg.get("payload", {}).get("headers", [])
-                    subject = next((h["value"] for h in headers if h["name"].lower() == "subject"), "")
-                    message_id = next((h["value"] for h in headers if h["name"].lower() == "message-id"), None)
+                    # Get headers from the metadata fetch
+                    metadata_msg = metadata_msgs[msg_id]
+                    subject = _get_header(metadata_msg, "subject") or ""
+                    sender = _get_header(metadata_msg, "from") or ""
+                    message_id = _get_header(metadata_msg, "message-id")
                     
                     # Clean message ID
                     if message_id:
@@ -184,40 +630,67 @@ async def get_emails(service, start_date: str, end_date: str, request=None):
                     else:
                         message_id = msg_id
                     
-                    # Step 3: Quick filter check
-                    if is_possibly_job_related(subject, ""):
+                    # Step 3: Full filter check on subject and body
+                    with metrics.span("body_extract"):
                         body = extract_body(full_msg)
-                        if body and is_possibly_job_related(subject, body):
-                            timestamp_ms = int(full_msg.get("internalDate", 0))
-                            date = datetime.fromtimestamp(timestamp_ms / 1000.0).strftime("%Y-%m-%d")
-                            
-                            # Yield each email immediately
-                            yield {
-                                "body": body,
-                                "date": date,
-                                "subject": subject,
-                                "msg_id": message_id
-                            }
+                    with metrics.span("prefilter"):
+                        possibly_job_related = bool(body) and is_possibly_job_related(subject, body)
+                    if possibly_job_related:
+                        timestamp_ms = int(full_msg.get("internalDate", 0))
+                        date = datetime.fromtimestamp(timestamp_ms / 1000.0).strftime("%Y-%m-%d")
+                        stats["yielded"] += 1
+                        
+                        # Yield each email immediately
+                        yield {
+                            "body": body,
+                            "date": date,
+                            "subject": subject,
+                            "sender": sender,
+                            "msg_id": message_id,
+                            "gmail_id": msg_id,
+                            "thread_id": full_msg.get("threadId")
+                        }
+                    else:
+                        stats["body_dropped"] += 1
                     
                     # Check for disconnection after processing each email
                     if request and await request.is_disconnected():
                         print("\nSearch stopped by user after email processing")
                         await request.close()  # Force close the request
                         return
-                        
-                    # Mark as processed only if not disconnected
-                    mark_email_as_processed(supabase, msg_id)
+
+                    # Yielded emails are marked by the caller once it has stored their jobs
+                    if not possibly_job_related:
+                        processed.add(msg_id)
                     
                 except Exception as e:
                     print(f"Error processing message {msg_id}: {str(e)}")
                     if request and await request.is_disconnected():
                         return
                     continue
-            
-            next_page_token = response.get("nextPageToken")
-            if not next_page_token:
-                break
+
+            # Write the whole page's dropped IDs at once
+            await asyncio.to_thread(processed.flush)
+            if on_page:
+                await on_page(next_page_token)
+
+        # Only a completed scan moves the incremental starting point forward
+        if account:
+            if on_synced:
+                await on_synced(account, latest_history_id)
+            else:
+                await asyncio.to_thread(save_sync_state, storage, account, latest_history_id)
 
     except Exception as e:
         print(f"Error fetching emails: {str(e)}")
         return
+
+    finally:
+        # Keep progress made before a disconnect or error
+        processed.flush()
+        if pages is not None:
+            await pages.aclose()
+        for name, value in stats.items():
+            if not name.endswith("_bytes"):
+                metrics.inc("emails", value, step=name)
+        print(f"Fetch stats: {stats}")
@@ -0,0 +1,129 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+
+LLM_CACHE_PATH = os.getenv(
+    "LLM_CACHE_PATH",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".llm_cache.sqlite3")
+)
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "50000"))
+LLM_CACHE_TTL_DAYS = float(os.getenv("LLM_CACHE_TTL_DAYS", "30"))
+LLM_CACHE_DISABLED = os.getenv("LLM_CACHE_DISABLED", "false").lower() == "true"
+EVICTION_INTERVAL = 100  # Check the size limit every N writes
+
+def make_cache_key(email_text: str, received_date: str, model: str, prompt_version: str) -> str:
+    """Hash everything that can change the model's answer for an email"""
+    normalized = " ".join(email_text.split())
+    content = "\x1f".join([prompt_version, model, received_date, normalized])
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+class LLMCache:
+    """Persistent SQLite cache of parse results with LRU and TTL eviction"""
+
+    def __init__(self, path: str = LLM_CACHE_PATH, max_entries: int = LLM_CACHE_MAX_ENTRIES,
+                 ttl_seconds: float = LLM_CACHE_TTL_DAYS * 86400):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.writes = 0
+
+        # Parse workers run in threads, all access goes through the lock
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS llm_results (
+                key TEXT PRIMARY KEY,
+                result TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_llm_results_accessed_at ON llm_results (accessed_at)")
+        self.conn.commit()
+
+    def get(self, key: str):
+        """Return the cached result for a key, or None if missing or expired"""
+        now = time.time()
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT result, created_at FROM llm_results WHERE key = ?", (key,)
+            ).fetchone()
+
+            if row is None:
+                self.misses += 1
+                return None
+
+            if self.ttl_seconds and now - row[1] > self.ttl_seconds:
+                self.conn.execute("DELETE FROM llm_results WHERE key = ?", (key,))
+                self.conn.commit()
+                self.misses += 1
+                self.evictions += 1
+                return None
+
+            self.conn.execute("UPDATE llm_results SET accessed_at = ? WHERE key = ?", (now, key))
+            self.conn.commit()
+            self.hits += 1
+            return json.loads(row[0])
+
+    def put(self, key: str, result: dict) -> None:
+        now = time.time()
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO llm_results (key, result, created_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(result), now, now)
+            )
+            self.writes += 1
+            if self.writes % EVICTION_INTERVAL == 0:
+                self._evict(now)
+            self.conn.commit()
+
+    def _evict(self, now: float) -> None:
+        """Drop expired entries, then the least recently used ones over the size limit"""
+        if self.ttl_seconds:
+            cursor = self.conn.execute("DELETE FROM llm_results WHERE created_at < ?", (now - self.ttl_seconds,))
+            self.evictions += cursor.rowcount
+
+        count = self.conn.execute("SELECT COUNT(*) FROM llm_results").fetchone()[0]
+        if count > self.max_entries:
+            cursor = self.conn.execute("""
+                DELETE FROM llm_results WHERE key IN (
+                    SELECT key FROM llm_results ORDER BY accessed_at LIMIT ?
+                )
+            """, (count - self.max_entries,))
+            self.evictions += cursor.rowcount
+
+    def clear(self) -> None:
+        with self.lock:
+            self.conn.execute("DELETE FROM llm_results")
+            self.conn.commit()
+
+    def stats(self) -> dict:
+        with self.lock:
+            entries = self.conn.execute("SELECT COUNT(*) FROM llm_results").fetchone()[0]
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "evictions": self.evictions,
+            "entries": entries,
+        }
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_llm_cache():
+    """Return the shared cache, or None when caching is disabled"""
+    global _cache
+    if LLM_CACHE_DISABLED:
+        return None
+    with _cache_lock:
+        if _cache is None:
+            _cache = LLMCache()
+        return _cache
@@ -0,0 +1,309 @@
+import os
+import re
+import math
+import json
+from email.utils import parseaddr
+
+# Local results below this confidence are sent to the LLM instead
+LOCAL_CLASSIFIER_ENABLED = os.getenv("LOCAL_CLASSIFIER_DISABLED", "").lower() not in ("1", "true", "yes")
+LOCAL_CLASSIFIER_THRESHOLD = float(os.getenv("LOCAL_CLASSIFIER_THRESHOLD", "0.85"))
+# Optional JSON file of {"domain": "Company"} entries added to SENDER_DOMAIN_COMPANIES
+SENDER_DOMAINS_PATH = os.getenv("LOCAL_CLASSIFIER_DOMAINS_PATH")
+
+STAGES = [
+    "Application Received", "Screen", "Interview Scheduled", "Technical Interview",
+    "Assessment", "Offer", "Rejection", "Follow-up",
+]
+
+# Domains whose emails are always from the same company
+SENDER_DOMAIN_COMPANIES = {
+    "amazon.jobs": "Amazon",
+    "metacareers.com": "Meta",
+    "careers.google.com": "Google",
+    "apple.com": "Apple",
+    "microsoft.com": "Microsoft",
+}
+
+# Domains that send mail on behalf of many companies or people, so they
+# don't name the company
+SHARED_DOMAINS = {
+    "gmail.com", "googlemail.com", "outlook.com", "hotmail.com", "yahoo.com", "icloud.com",
+    "linkedin.com", "indeed.com", "indeedemail.com", "glassdoor.com", "handshake.com",
+    "joinhandshake.com", "ziprecruiter.com", "wellfound.com", "angel.co",
+}
+
+# Applicant tracking systems and the sender domains their notifications come from
+ATS_SENDER_DOMAINS = {
+    "greenhouse.io": "Greenhouse",
+    "greenhouse-mail.io": "Greenhouse",
+    "lever.co": "Lever",
+    "hire.lever.co": "Lever",
+    "myworkday.com": "Workday",
+    "myworkdayjobs.com": "Workday",
+    "workday.com": "Workday",
+    "ashbyhq.com": "Ashby",
+    "smartrecruiters.com": "SmartRecruiters",
+    "icims.com": "iCIMS",
+    "successfactors.com": "SuccessFactors",
+}
+
+# Template sentences that name the company. Each has one "company" group.
+# Company names are runs of capitalized words even though the templates
+# ignore case, so "at Acme is scheduled" stops at "Acme".
+_company = r"(?P<company>(?-i:[A-Z0-9][\w&'\-]*(?:\.\w+)*(?: (?:[A-Z0-9&][\w&'\-]*(?:\.\w+)*))*))"
+COMPANY_TEMPLATES = [
+    rf"thank(?:s| you) for (?:your )?(?:applying|application|interest) (?:to|in|with|at) (?:the [^.\n]{{0,80}}? (?:position|role) at )?{_company}",
+    rf"your application (?:to|with|at|for [^.\n]{{0,80}}? at) {_company}",
+    rf"(?:position|role|opportunity) at {_company}",
+    rf"(?:interest in|applying to|applied to) {_company}",
+    rf"(?:the|from the) {_company} (?:recruiting|talent acquisition|hiring|people|careers) team",
+]
+
+# Subject lines some ATS templates use
+SUBJECT_TEMPLATES = [
+    rf"^(?:re: |fwd?: )?thank you for (?:applying|your application|your interest) (?:to|at|in) {_company}$",
+    rf"^(?:re: |fwd?: )?your application (?:to|with|at) {_company}$",
+    rf"^(?:re: |fwd?: )?{_company} (?:-|\||:) (?:application|candidate|thank you)",
+]
+
+POSITION_TEMPLATES = [
+    r"(?:for|to) (?:the|our) (?P<position>[A-Z][\w/&,()\- ]{2,80}?) (?:position|role|opening|job)",
+    r"(?:position|role) of (?P<position>[A-Z][\w/&,()\- ]{2,80}?)(?:[.!,\n]| at )",
+]
+
+# Suffixes display names add to the company, e.g. "Acme Recruiting"
+DISPLAY_NAME_SUFFIXES = re.compile(
+    r"\s*(?:[-|@]\s*)?(?:recruiting|recruitment|careers?|talent(?: acquisition)?|hiring(?: team)?|"
+    r"jobs|people(?: team)?|hr|team|notifications?|no-?reply|via \w+)\s*$",
+    re.IGNORECASE
+)
+
+# Phrase weights for each stage. Scores are turned into probabilities with a
+# softmax, so the weights act as log-odds and no model file is needed.
+STAGE_FEATURES = {
+    "Application Received": [
+        (r"thank(?:s| you) for (?:your )?(?:applying|application|interest)", 3.0),
+        (r"(?:we(?:'ve| have)? )?received your application", 3.0),
+        (r"application (?:has been |was )?(?:received|submitted)", 2.5),
+        (r"will (?:carefully )?review your (?:application|resume|qualifications)", 1.5),
+        (r"if (?:your|there is a) (?:qualifications|background|fit|match)", 1.0),
+    ],
+    "Rejection": [
+        (r"unfortunately", 2.0),
+        (r"not (?:be )?(?:moving|move) forward", 3.5),
+        (r"decided to (?:pursue|proceed with|move forward with) other candidates", 4.0),
+        (r"regret to inform", 3.5),
+        (r"(?:position|role) has been filled", 3.0),
+        (r"will not be (?:proceeding|progressing)", 3.5),
+        (r"no longer (?:being )?consider", 3.0),
+        (r"(?:wish|best of luck|encourage you to apply).{0,40}(?:future|search|other)", 1.5),
+    ],
+    "Interview Scheduled": [
+        (r"(?:schedule|book|set up) (?:an? |your )?(?:interview|call|time|chat)", 2.5),
+        (r"interview (?:is )?(?:confirmed|scheduled|invitation)", 3.0),
+        (r"invite you to (?:an? )?interview", 3.0),
+        (r"calendly\.com|goodtime\.io|your availability", 1.5),
+        (r"onsite|on-site|final round", 1.5),
+    ],
+    "Screen": [
+        (r"phone screen|recruiter (?:call|screen)|initial (?:call|conversation|chat)", 3.0),
+        (r"(?:quick|brief|15|20|30)[- ]minute (?:call|chat|conversation)", 2.0),
+    ],
+    "Technical Interview": [
+        (r"technical (?:interview|screen|round)", 3.0),
+        (r"coding (?:interview|session)|pair programming|system design", 2.5),
+    ],
+    "Assessment": [
+        (r"(?:coding|online|technical) (?:assessment|challenge|test)", 3.0),
+        (r"hackerrank|codility|codesignal|take-home", 3.0),
+        (r"complete (?:the|this|an?) (?:assessment|assignment|challenge)", 2.5),
+    ],
+    "Offer": [
+        (r"pleased to (?:offer|extend)", 4.0),
+        (r"offer letter", 3.0),
+        (r"(?:job|employment) offer", 3.0),
+        (r"congratulations", 1.5),
+    ],
+    "Follow-up": [
+        (r"(?:following|follow) up", 2.0),
+        (r"checking in", 1.5),
+        (r"update on your application", 1.5),
+    ],
+}
+
+# Score of the implicit "none of these" option, so weak matches stay uncertain
+NO_MATCH_SCORE = 2.0
+
+_company_regexes = [re.compile(pattern, re.IGNORECASE | re.MULTILINE) for pattern in COMPANY_TEMPLATES]
+_subject_regexes = [re.compile(pattern, re.IGNORECASE) for pattern in SUBJECT_TEMPLATES]
+_position_regexes = [re.compile(pattern) for pattern in POSITION_TEMPLATES]
+_stage_regexes = {
+    stage: [(re.compile(pattern, re.IGNORECASE), weight) for pattern, weight in features]
+    for stage, features in STAGE_FEATURES.items()
+}
+
+def _load_sender_domains() -> dict:
+    domains = dict(SENDER_DOMAIN_COMPANIES)
+    if SENDER_DOMAINS_PATH:
+        try:
+            with open(SENDER_DOMAINS_PATH) as f:
+                domains.update({domain.lower(): company for domain, company in json.load(f).items()})
+        except Exception as e:
+            print(f"Error loading sender domains from {SENDER_DOMAINS_PATH}: {str(e)}")
+    return domains
+
+_sender_domains = _load_sender_domains()
+
+def _match_domain(domain: str, domains: dict):
+    """Look up a domain or any parent domain, so mail.acme.com matches acme.com"""
+    parts = domain.split(".")
+    for index in range(len(parts) - 1):
+        value = domains.get(".".join(parts[index:]))
+        if value:
+            return value
+    return None
+
+def _clean_company(name: str):
+    if not name:
+        return None
+    name = DISPLAY_NAME_SUFFIXES.sub("", name.strip(" .,-|\"'"))
+    name = DISPLAY_NAME_SUFFIXES.sub("", name).strip(" .,-|\"'")
+    if len(name) < 2 or name.lower() in ("the", "our", "us", "you"):
+        return None
+    return name
+
+def detect_ats(sender: str, body: str):
+    """Name of the applicant tracking system that sent the email, if any"""
+    _, address = parseaddr(sender or "")
+    domain = address.rpartition("@")[2].lower()
+    ats = _match_domain(domain, ATS_SENDER_DOMAINS) if domain else None
+    if ats:
+        return ats
+
+    # Forwarded or white-labelled mail still links back to the ATS
+    for ats_domain, name in ATS_SENDER_DOMAINS.items():
+        if ats_domain in body:
+            return name
+    return None
+
+def extract_company(subject: str, sender: str, body: str, ats: str = None):
+    """
+    Return (company, confidence). Template sentences are the strongest
+    signal, then known sender domains, then the sender's display name.
+    """
+    candidates = []
+
+    for regex in _subject_regexes:
+        match = regex.search(subject.strip())
+        if match:
+            candidates.append((_clean_company(match.group("company")), 0.9))
+            break
+
+    for regex in _company_regexes:
+        match = regex.search(body)
+        if match:
+            candidates.append((_clean_company(match.group("company")), 0.9))
+            break
+
+    display_name, address = parseaddr(sender or "")
+    domain = address.rpartition("@")[2].lower()
+    if domain:
+        known = _match_domain(domain, _sender_domains)
+        if known:
+            candidates.append((known, 0.95))
+        elif ats is None and domain not in SHARED_DOMAINS:
+            # jobs@acme.com -> Acme
+            labels = [label for label in domain.split(".")[:-1] if label not in ("mail", "email", "careers", "jobs", "hr")]
+            if labels:
+                candidates.append((labels[-1].capitalize(), 0.6))
+
+    if display_name and domain not in SHARED_DOMAINS:
+        candidates.append((_clean_company(display_name), 0.7 if ats else 0.5))
+
+    candidates = [(company, confidence) for company, confidence in candidates if company]
+    if not candidates:
+        return None, 0.0
+
+    company, confidence = max(candidates, key=lambda candidate: candidate[1])
+    # Independent sources agreeing on the name make it more likely
+    agreeing = sum(1 for other, _ in candidates if other.lower() == company.lower())
+    if agreeing > 1:
+        confidence = min(1.0, confidence + 0.05 * (agreeing - 1))
+    return company, confidence
+
+def extract_position(body: str):
+    for regex in _position_regexes:
+        match = regex.search(body)
+        if match:
+            return match.group("position").strip()
+    return None
+
+def score_stages(text: str) -> dict:
+    """Weighted phrase matches per stage"""
+    return {
+        stage: sum(weight for regex, weight in features if regex.search(text))
+        for stage, features in _stage_regexes.items()
+    }
+
+def classify_stage(subject: str, body: str):
+    """Return (stage, confidence) from a softmax over the stage scores"""
+    scores = score_stages(subject + "\n" + body)
+    best = max(scores, key=scores.get)
+    if scores[best] == 0:
+        return None, 0.0
+
+    total = math.exp(NO_MATCH_SCORE) + sum(math.exp(score) for score in scores.values())
+    return best, math.exp(scores[best]) / total
+
+def local_parse_email(email: dict):
+    """
+    Extract company and stage from a templated job email without the LLM.
+    Returns (result, confidence), where result has the same shape as
+    ai_parse_email's, or (None, 0.0) if the email doesn't look templated.
+    """
+    subject = email.get("subject") or ""
+    sender = email.get("sender") or ""
+    body = email.get("body") or ""
+
+    ats = detect_ats(sender, body)
+    stage, stage_confidence = classify_stage(subject, body)
+    if stage is None:
+        return None, 0.0
+
+    company, company_confidence = extract_company(subject, sender, body, ats)
+    if company is None:
+        return None, 0.0
+
+    confidence = min(stage_confidence, company_confidence)
+    if ats:
+        # ATS templates are consistent, so a match is more trustworthy
+        confidence = min(1.0, confidence + 0.05)
+
+    position = extract_position(body)
+    result = {
+        "job_related": True,
+        "company": company,
+        "position": position,
+        "application_date": email.get("date"),
+        "stage": stage,
+        "description": f"{stage} from {company}" + (f" for {position}" if position else ""),
+        "source": "local",
+    }
+    return result, confidence
+
+def try_local_parse(email: dict, threshold: float = LOCAL_CLASSIFIER_THRESHOLD):
+    """Return the local result if it is confident enough, otherwise None"""
+    if not LOCAL_CLASSIFIER_ENABLED:
+        return None
+
+    try:
+        result, confidence = local_parse_email(email)
+    except Exception as e:
+        print(f"Error in local classifier: {str(e)}")
+        return None
+
+    if result is None or confidence < threshold:
+        return None
+
+    print(f"Local classifier result ({confidence:.2f}): {result['company']} - {result['stage']}")
+    return result
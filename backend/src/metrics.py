@@ -0,0 +1,117 @@
+import os
+import time
+import threading
+from contextlib import contextmanager
+
+# Set METRICS_ENABLED=false to skip all timing and counting
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+METRICS_PREFIX = "autotrack"
+
+# Histogram buckets for stage durations, in seconds
+DURATION_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Help text for the counters the pipeline records
+COUNTER_HELP = {
+    "api_calls": "Calls to Gmail, Groq and Supabase",
+    "api_errors": "Failed calls to Gmail, Groq and Supabase",
+    "retries": "Calls retried after a rate limit or transient error",
+    "cache_lookups": "Cache lookups by cache and result",
+    "bytes": "Payload bytes fetched",
+    "tokens": "LLM tokens used",
+    "emails": "Emails by the step that handled them",
+    "rows_written": "Database rows written",
+}
+
+_lock = threading.Lock()
+_counters = {}  # (name, labels) -> value
+_histograms = {}  # stage -> [bucket counts..., count, sum]
+
+def _labels_key(labels: dict) -> tuple:
+    return tuple(sorted(labels.items()))
+
+def inc(name: str, amount: float = 1, **labels) -> None:
+    """Add to a counter"""
+    if not METRICS_ENABLED or not amount:
+        return
+    key = (name, _labels_key(labels))
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + amount
+
+def observe(stage: str, seconds: float) -> None:
+    """Record one duration for a stage"""
+    if not METRICS_ENABLED:
+        return
+    with _lock:
+        histogram = _histograms.get(stage)
+        if histogram is None:
+            histogram = _histograms[stage] = [0] * (len(DURATION_BUCKETS) + 2)
+        for index, bound in enumerate(DURATION_BUCKETS):
+            if seconds <= bound:
+                histogram[index] += 1
+        histogram[-2] += 1
+        histogram[-1] += seconds
+
+@contextmanager
+def span(stage: str):
+    """Time a block of code as one run of a pipeline stage"""
+    if not METRICS_ENABLED:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(stage, time.perf_counter() - started)
+
+def reset() -> None:
+    with _lock:
+        _counters.clear()
+        _histograms.clear()
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _format_labels(labels) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels) + "}"
+
+def render(gauges: dict = None) -> str:
+    """
+    Everything recorded so far in the Prometheus text format. gauges adds
+    point-in-time values, as {name: (help, {labels tuple: value})}.
+    """
+    with _lock:
+        counters = dict(_counters)
+        histograms = {stage: list(values) for stage, values in _histograms.items()}
+
+    lines = []
+
+    names = sorted({name for name, _ in counters})
+    for name in names:
+        metric = f"{METRICS_PREFIX}_{name}_total"
+        lines.append(f"# HELP {metric} {COUNTER_HELP.get(name, name)}")
+        lines.append(f"# TYPE {metric} counter")
+        for (counter_name, labels), value in sorted(counters.items()):
+            if counter_name == name:
+                lines.append(f"{metric}{_format_labels(labels)} {value}")
+
+    if histograms:
+        metric = f"{METRICS_PREFIX}_stage_duration_seconds"
+        lines.append(f"# HELP {metric} Time spent in each pipeline stage")
+        lines.append(f"# TYPE {metric} histogram")
+        for stage, values in sorted(histograms.items()):
+            for bound, count in zip(DURATION_BUCKETS, values):
+                lines.append(f'{metric}_bucket{{stage="{stage}",le="{bound}"}} {count}')
+            lines.append(f'{metric}_bucket{{stage="{stage}",le="+Inf"}} {values[-2]}')
+            lines.append(f'{metric}_count{{stage="{stage}"}} {values[-2]}')
+            lines.append(f'{metric}_sum{{stage="{stage}"}} {values[-1]}')
+
+    for name, (help_text, samples) in sorted((gauges or {}).items()):
+        metric = f"{METRICS_PREFIX}_{name}"
+        lines.append(f"# HELP {metric} {help_text}")
+        lines.append(f"# TYPE {metric} gauge")
+        for labels, value in sorted(samples.items()):
+            lines.append(f"{metric}{_format_labels(labels)} {value}")
+
+    return "\n".join(lines) + "\n"
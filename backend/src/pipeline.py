@@ -0,0 +1,431 @@
+import os
+import time
+import random
+import asyncio
+from collections import deque
+from contextlib import aclosing
+from typing import TYPE_CHECKING
+
+from .ai_parser import (
+    ai_parse_email,
+    ai_parse_emails_batch,
+    estimate_email_tokens,
+    estimate_batch_request_tokens,
+    estimate_request_tokens,
+    get_cached_parse,
+    is_rate_limit_error,
+    BATCH_MAX_EMAILS,
+    BATCH_TOKEN_BUDGET,
+)
+from .llm_cache import get_llm_cache
+from .local_classifier import try_local_parse
+from .dedup import NearDuplicateIndex, reuse_result, NEAR_DUP_DISABLED
+from .db import insert_jobs
+from .clients import get_storage
+from .gmail_client import get_emails, save_sync_state, ProcessedEmailBuffer, get_processed_cache
+from . import metrics
+
+if TYPE_CHECKING:
+    from .storage import Storage
+
+# Groq limits are per API key, so one limiter is shared by every scan in the process
+GROQ_REQUESTS_PER_MINUTE = int(os.getenv("GROQ_REQUESTS_PER_MINUTE", "30"))
+GROQ_TOKENS_PER_MINUTE = int(os.getenv("GROQ_TOKENS_PER_MINUTE", "12000"))
+
+PARSE_WORKERS = int(os.getenv("PARSE_WORKERS", "4"))
+PARSE_QUEUE_SIZE = int(os.getenv("PARSE_QUEUE_SIZE", "50"))
+PARSE_MAX_RETRIES = 5
+PARSE_BACKOFF_BASE = 2.0  # Seconds, doubled on every retry
+PARSE_BACKOFF_MAX = 60.0
+
+# Parsed job emails are written to the database in batches of this size
+JOB_WRITE_BATCH_SIZE = 25
+# Handled emails that found no job are marked processed in batches of this size
+PROCESSED_WRITE_BATCH_SIZE = 100
+
+class TokenBucket:
+    """Token bucket that refills continuously up to its capacity"""
+
+    def __init__(self, capacity: float, refill_per_second: float):
+        self.capacity = capacity
+        self.refill_per_second = refill_per_second
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.refill_per_second)
+        self.updated_at = now
+
+    async def acquire(self, amount: float = 1) -> None:
+        """Wait until the bucket holds enough tokens, then take them"""
+        amount = min(amount, self.capacity)
+        # Waiters are served one at a time so large requests are not starved
+        async with self.lock:
+            self._refill()
+            while self.tokens < amount:
+                await asyncio.sleep((amount - self.tokens) / self.refill_per_second)
+                self._refill()
+            self.tokens -= amount
+
+class RateLimiter:
+    """Requests-per-minute and tokens-per-minute limits for the Groq API"""
+
+    def __init__(self, requests_per_minute: int = GROQ_REQUESTS_PER_MINUTE,
+                 tokens_per_minute: int = GROQ_TOKENS_PER_MINUTE):
+        self.requests = TokenBucket(requests_per_minute, requests_per_minute / 60.0)
+        self.tokens = TokenBucket(tokens_per_minute, tokens_per_minute / 60.0)
+
+    async def acquire(self, tokens: int) -> None:
+        await self.requests.acquire(1)
+        await self.tokens.acquire(tokens)
+
+groq_limiter = RateLimiter()
+
+def _retry_delay(error: Exception, attempt: int) -> float:
+    """Use Groq's retry-after header when present, otherwise exponential backoff with jitter"""
+    retry_after = None
+    response = getattr(error, "response", None)
+    if response is not None:
+        retry_after = response.headers.get("retry-after")
+
+    try:
+        delay = float(retry_after)
+    except (TypeError, ValueError):
+        delay = min(PARSE_BACKOFF_BASE * 2 ** attempt, PARSE_BACKOFF_MAX)
+
+    return delay + random.uniform(0, 1)
+
+async def parse_with_retry(email: dict, limiter: RateLimiter = groq_limiter) -> dict:
+    """Parse one email in a worker thread, backing off when Groq rate limits us"""
+    # Cache hits don't count against the rate limit
+    cached = await asyncio.to_thread(get_cached_parse, email["body"], email["date"])
+    if cached is not None:
+        return cached
+
+    tokens = estimate_request_tokens(email["body"])
+
+    for attempt in range(PARSE_MAX_RETRIES + 1):
+        with metrics.span("rate_limit_wait"):
+            await limiter.acquire(tokens)
+        try:
+            return await asyncio.to_thread(
+                ai_parse_email, email["body"], email["date"], lookup_cache=False
+            )
+        except Exception as e:
+            if not is_rate_limit_error(e):
+                raise
+            if attempt == PARSE_MAX_RETRIES:
+                print(f"Giving up on email {email['msg_id']} after {PARSE_MAX_RETRIES} rate limited retries")
+                break
+            delay = _retry_delay(e, attempt)
+            metrics.inc("retries", service="groq")
+            print(f"Rate limited by Groq, retrying in {delay:.1f}s")
+            await asyncio.sleep(delay)
+
+    return {"job_related": False}
+
+async def parse_batch_with_retry(emails: list, email_tokens: list, limiter: RateLimiter = groq_limiter) -> list:
+    """
+    Parse a batch of emails with one prompt, backing off when rate limited.
+    Cached emails are skipped and malformed results are parsed one at a time.
+    """
+    results = await asyncio.gather(*(
+        asyncio.to_thread(get_cached_parse, email["body"], email["date"]) for email in emails
+    ))
+    pending = [index for index, result in enumerate(results) if result is None]
+
+    if len(pending) > 1:
+        batch = [(emails[index]["body"], emails[index]["date"]) for index in pending]
+        tokens = estimate_batch_request_tokens([email_tokens[index] for index in pending])
+
+        for attempt in range(PARSE_MAX_RETRIES + 1):
+            with metrics.span("rate_limit_wait"):
+                await limiter.acquire(tokens)
+            try:
+                batch_results = await asyncio.to_thread(ai_parse_emails_batch, batch)
+                break
+            except Exception as e:
+                if not is_rate_limit_error(e):
+                    raise
+                if attempt == PARSE_MAX_RETRIES:
+                    print(f"Giving up on batch of {len(batch)} emails after {PARSE_MAX_RETRIES} rate limited retries")
+                    batch_results = [{"job_related": False}] * len(batch)
+                    break
+                delay = _retry_delay(e, attempt)
+                metrics.inc("retries", service="groq")
+                print(f"Rate limited by Groq, retrying in {delay:.1f}s")
+                await asyncio.sleep(delay)
+
+        for index, result in zip(pending, batch_results):
+            results[index] = result
+
+    # Fall back to single-email parsing for anything still missing
+    for index, result in enumerate(results):
+        if result is None:
+            results[index] = await parse_with_retry(emails[index], limiter)
+
+    return results
+
+async def parse_emails(emails, workers: int = PARSE_WORKERS, queue_size: int = PARSE_QUEUE_SIZE,
+                       limiter: RateLimiter = groq_limiter, batch_max_emails: int = BATCH_MAX_EMAILS,
+                       batch_token_budget: int = BATCH_TOKEN_BUDGET, dedup: bool = not NEAR_DUP_DISABLED):
+    """
+    Parse emails from an async iterator with a pool of concurrent workers.
+    Each worker packs whatever is already queued into one prompt, up to
+    batch_max_emails and batch_token_budget. Templated emails the local
+    classifier is confident about skip the LLM, and with dedup set,
+    near-duplicates of an email already sent to the LLM reuse its result.
+    Yields (email, ai_data) pairs in completion order.
+    """
+    queue = asyncio.Queue(maxsize=queue_size)
+    results = asyncio.Queue(maxsize=workers)
+    done = object()
+    counts = {"local": 0, "llm": 0, "duplicate": 0}
+
+    duplicates = NearDuplicateIndex() if dedup else None
+    resolved = {}   # Representative msg_id -> its parse result
+    followers = {}  # Representative msg_id -> duplicates waiting for that result
+
+    def settle(email: dict, ai_data: dict) -> list:
+        """Record a representative's result and return the duplicates waiting on it"""
+        resolved[email["msg_id"]] = ai_data
+        return followers.pop(email["msg_id"], [])
+
+    async def produce():
+        try:
+            async for email in emails:
+                # Both take milliseconds per email, so keep them off the event loop
+                local_result = await asyncio.to_thread(try_local_parse, email)
+                if local_result is not None:
+                    counts["local"] += 1
+                    metrics.inc("emails", step="parsed_locally")
+                    await results.put((email, local_result))
+                    continue
+
+                if duplicates is not None:
+                    representative = await asyncio.to_thread(duplicates.representative, email)
+                    if representative is not None:
+                        counts["duplicate"] += 1
+                        metrics.inc("emails", step="near_duplicate")
+                        if representative in resolved:
+                            await results.put((email, reuse_result(resolved[representative], email)))
+                        else:
+                            followers.setdefault(representative, []).append(email)
+                        continue
+
+                counts["llm"] += 1
+                metrics.inc("emails", step="sent_to_llm")
+                await queue.put(email)
+        except asyncio.CancelledError:
+            # The workers are being cancelled too and nothing drains the queue,
+            # so waiting to put the sentinels would block the cancel forever
+            raise
+        except Exception as e:
+            print(f"Error reading emails to parse: {str(e)}")
+        for _ in range(workers):
+            await queue.put(done)
+
+    async def work():
+        carry = None
+        finished = False
+        while not finished:
+            email = carry if carry is not None else await queue.get()
+            carry = None
+            if email is done:
+                break
+
+            # Take queued emails without waiting until the batch is full
+            batch = [email]
+            batch_tokens = [await asyncio.to_thread(estimate_email_tokens, email["body"])]
+            while len(batch) < batch_max_emails and not queue.empty():
+                next_email = queue.get_nowait()
+                if next_email is done:
+                    finished = True
+                    break
+                tokens = await asyncio.to_thread(estimate_email_tokens, next_email["body"])
+                if sum(batch_tokens) + tokens > batch_token_budget:
+                    carry = next_email
+                    break
+                batch.append(next_email)
+                batch_tokens.append(tokens)
+
+            try:
+                if len(batch) == 1:
+                    batch_results = [await parse_with_retry(email, limiter)]
+                else:
+                    batch_results = await parse_batch_with_retry(batch, batch_tokens, limiter)
+            except Exception as e:
+                print(f"Error parsing batch of {len(batch)} emails: {str(e)}")
+                batch_results = [{"job_related": False}] * len(batch)
+
+            for parsed_email, ai_data in zip(batch, batch_results):
+                await results.put((parsed_email, ai_data))
+                for duplicate in settle(parsed_email, ai_data):
+                    await results.put((duplicate, reuse_result(ai_data, duplicate)))
+        await results.put(done)
+
+    tasks = [asyncio.create_task(produce())]
+    tasks += [asyncio.create_task(work()) for _ in range(workers)]
+
+    try:
+        finished = 0
+        while finished < workers:
+            result = await results.get()
+            if result is done:
+                finished += 1
+                continue
+            yield result
+    finally:
+        # Stop fetching and parsing when the consumer stops early
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        if hasattr(emails, "aclose"):
+            await emails.aclose()
+
+        print(f"Parsed {counts['local']} emails locally, sent {counts['llm']} to the LLM, "
+              f"reused results for {counts['duplicate']} near-duplicates")
+
+        cache = get_llm_cache()
+        if cache is not None:
+            print(f"LLM cache stats: {cache.stats()}")
+
+class ScanProgress:
+    """
+    Track which listed pages a scan has finished. An email is marked processed
+    once the job write covering it succeeds, and a page is checkpointed with
+    on_page once all its emails are, so a stopped scan loses nothing queued.
+    """
+
+    def __init__(self, storage: "Storage", on_page=None):
+        self.storage = storage
+        self.on_page = on_page
+        self.processed = ProcessedEmailBuffer(storage, get_processed_cache())
+        self.pending = []         # Handled emails waiting for the next write
+        self.page_of = {}         # Gmail ID -> page it was listed on
+        self.current = {"token": None, "outstanding": 0, "sync": None}
+        self.listed = deque()     # Fully listed pages, oldest first
+        self.lock = asyncio.Lock()
+
+    async def track(self, emails):
+        """Pass emails through, noting which page each was listed on"""
+        async for email in emails:
+            if email.get("gmail_id"):
+                self.current["outstanding"] += 1
+                self.page_of[email["gmail_id"]] = self.current
+            yield email
+
+    async def page_listed(self, next_page_token: str) -> None:
+        self.current["token"] = next_page_token
+        self.listed.append(self.current)
+        self.current = {"token": None, "outstanding": 0, "sync": None}
+        await self.advance()
+
+    async def synced(self, account: str, history_id: str) -> None:
+        """Save the incremental starting point once every listed page is finished"""
+        self.listed.append({"token": None, "outstanding": 0, "sync": (account, history_id)})
+        await self.advance()
+
+    def handled(self, email: dict) -> None:
+        if email.get("gmail_id"):
+            self.pending.append(email["gmail_id"])
+
+    async def flush(self) -> None:
+        """Mark emails processed after their jobs were written"""
+        for msg_id in self.pending:
+            self.processed.add(msg_id)
+        self.pending = []
+        written = list(self.processed.pending)
+        await asyncio.to_thread(self.processed.flush)
+        if self.processed.pending:
+            return  # Still buffered and retried on the next flush
+
+        for msg_id in written:
+            page = self.page_of.pop(msg_id, None)
+            if page:
+                page["outstanding"] -= 1
+        await self.advance()
+
+    async def advance(self) -> None:
+        async with self.lock:
+            while self.listed and self.listed[0]["outstanding"] == 0:
+                page = self.listed.popleft()
+                if page["sync"]:
+                    await asyncio.to_thread(save_sync_state, self.storage, *page["sync"])
+                elif self.on_page:
+                    await self.on_page(page["token"])
+
+async def scan_mailbox(service, start_date: str, end_date: str, request=None, stats: dict = None,
+                       incremental: bool = False, page_token: str = None, on_page=None, on_email=None,
+                       limiter: RateLimiter = groq_limiter, quota=None) -> dict:
+    """
+    Fetch, parse and store job emails for one mailbox. request can be
+    anything with async is_disconnected() and close() methods, and stops the
+    scan when it reports a disconnect. on_email is awaited with each parsed
+    email and its result, and on_page with the next page token once every
+    email listed before it has been stored. limiter and
+    quota let a scheduler share the Groq limit and Gmail quota between scans.
+    """
+    processed_count = 0
+    job_related_count = 0
+    pending_jobs = []
+    progress = ScanProgress(get_storage(), on_page)
+
+    async def write_pending_jobs():
+        if pending_jobs:
+            await asyncio.to_thread(insert_jobs, list(pending_jobs))
+            pending_jobs.clear()
+        await progress.flush()
+
+    def result(stopped: bool) -> dict:
+        return {
+            "stopped": stopped,
+            "processed": processed_count,
+            "job_related": job_related_count
+        }
+
+    # Process emails as they come in, parsing several at a time
+    emails = progress.track(get_emails(
+        service, start_date, end_date, request, stats, incremental, page_token,
+        progress.page_listed, quota, progress.synced
+    ))
+    async with aclosing(parse_emails(emails, limiter=limiter)) as parsed_emails:
+        async for email, ai_data in parsed_emails:
+            try:
+                # Check for disconnection after each email
+                if request and await request.is_disconnected():
+                    print("\nSearch stopped by user - stopping email processing")
+                    await write_pending_jobs()
+                    await request.close()  # Force close the request
+                    return result(stopped=True)
+
+                # Step 4: AI Parse (done by the pipeline workers)
+                processed_count += 1
+
+                # Step 5: Add to database if job related
+                if ai_data.get("job_related"):
+                    if all(key in ai_data for key in ["company", "stage"]):
+                        ai_data["msg_id"] = email["msg_id"]
+                        pending_jobs.append(ai_data)
+                        job_related_count += 1
+                        print(f"Added job application for {ai_data['company']}")
+
+                progress.handled(email)
+
+                if len(pending_jobs) >= JOB_WRITE_BATCH_SIZE or len(progress.pending) >= PROCESSED_WRITE_BATCH_SIZE:
+                    await write_pending_jobs()
+
+                if on_email:
+                    await on_email(email, ai_data)
+
+            except Exception as e:
+                print(f"Error processing email: {str(e)}")
+                continue
+
+    await write_pending_jobs()
+
+    # get_emails also returns early on a disconnect
+    stopped = bool(request and await request.is_disconnected())
+    return result(stopped)
@@ -0,0 +1,161 @@
+import re
+import tiktoken
+
+_encoding = None
+
+# Everything after one of these lines is an older message being quoted.
+# Forwarded message markers are left out: a forwarded job email is the content.
+QUOTE_HEADER_PATTERNS = [
+    r"^On .{0,200}wrote:\s*$",
+    r"^-{2,}\s*Original Message\s*-{2,}\s*$",
+    r"^From:\s.+\n(?:.*\n){0,2}?Sent:\s",
+]
+# Outlook forwards use the same headers as replies. Text above the header is
+# only cut off when it is a message of its own: long enough and job related.
+# A short note ("FYI") or a one-line reply is about the quoted email instead.
+NEW_MESSAGE_MIN_WORDS = 20
+
+# Everything after one of these lines is a signature
+SIGNATURE_PATTERNS = [
+    r"^--\s*$",
+    r"^Sent from my \w+",
+    r"^Get Outlook for \w+",
+]
+
+# Lines with these phrases are unsubscribe footers and legal boilerplate
+FOOTER_PATTERNS = [
+    r"unsubscribe",
+    r"privacy\s+policy",
+    r"all\s+rights\s+reserved",
+    r"manage\s+(?:your\s+)?(?:email\s+)?preferences",
+    r"view\s+(?:this\s+email\s+)?in\s+(?:your\s+)?browser",
+    r"this\s+(?:email|message)\s+was\s+sent\s+to",
+    r"confidentiality\s+notice",
+    r"intended\s+(?:only\s+)?for\s+the\s+(?:use\s+of\s+the\s+)?(?:named\s+)?(?:individual|recipient|addressee)",
+    r"do\s+not\s+reply\s+to\s+this\s+(?:email|message)",
+]
+
+# Words that make a sentence worth keeping when the email is over budget
+RELEVANT_WORDS = [
+    "apply", "applied", "application", "applying", "interview", "position", "role",
+    "offer", "candidate", "candidacy", "assessment", "recruiter", "recruiting",
+    "hiring", "schedule", "unfortunately", "regret", "next steps", "moving forward",
+    "team", "status", "internship", "challenge", "congratulations", "thank you",
+]
+
+_quote_header_regex = re.compile("|".join(QUOTE_HEADER_PATTERNS), re.IGNORECASE | re.MULTILINE)
+_signature_regex = re.compile("|".join(SIGNATURE_PATTERNS), re.IGNORECASE | re.MULTILINE)
+_footer_regex = re.compile("|".join(FOOTER_PATTERNS), re.IGNORECASE)
+_relevant_regex = re.compile("|".join(re.escape(word) for word in RELEVANT_WORDS), re.IGNORECASE)
+_url_regex = re.compile(r"https?://([^/\s?#>\)\]]+)[^\s>\)\]]*", re.IGNORECASE)
+_sentence_regex = re.compile(r"[^\n.!?]*(?:[.!?]+|\n|$)")
+
+def count_tokens(text: str) -> int:
+    """
+    Count tokens with tiktoken. Llama uses its own tokenizer, but cl100k_base
+    is close enough for budgeting. Falls back to 4 characters per token if
+    the encoding can't be loaded.
+    """
+    global _encoding
+    if _encoding is None:
+        try:
+            _encoding = tiktoken.get_encoding("cl100k_base")
+        except Exception as e:
+            print(f"Error loading tiktoken encoding: {str(e)}")
+            _encoding = False
+
+    if _encoding is False:
+        return len(text) // 4
+    return len(_encoding.encode(text, disallowed_special=()))
+
+def _is_new_message(text: str) -> bool:
+    return len(text.split()) >= NEW_MESSAGE_MIN_WORDS and bool(_relevant_regex.search(text))
+
+def strip_quoted_replies(text: str) -> str:
+    match = _quote_header_regex.search(text)
+    if match and not _is_new_message(text[:match.start()]):
+        # Keep the forwarded or quoted email, without its quote markers
+        return "\n".join(re.sub(r"^\s*(?:>\s?)+", "", line) for line in text.split("\n"))
+    if match:
+        text = text[:match.start()]
+    return "\n".join(line for line in text.split("\n") if not line.lstrip().startswith(">"))
+
+def strip_signature(text: str) -> str:
+    match = _signature_regex.search(text)
+    return text[:match.start()] if match else text
+
+def strip_footers(text: str) -> str:
+    return "\n".join(line for line in text.split("\n") if not _footer_regex.search(line))
+
+def strip_tracking_urls(text: str) -> str:
+    """Replace links with their host, which is all the model needs from them"""
+    return _url_regex.sub(lambda match: match.group(1), text)
+
+def _collapse_whitespace(text: str) -> str:
+    text = re.sub(r"[ \t]+", " ", text)
+    return re.sub(r"\n\s*\n+", "\n\n", text).strip()
+
+def select_relevant_sentences(text: str, max_tokens: int) -> str:
+    """
+    Keep the most job-relevant sentences that fit in max_tokens, in their
+    original order. The opening sentences usually name the company and role,
+    so they get a bonus.
+    """
+    sentences = [sentence for sentence in _sentence_regex.findall(text) if sentence.strip()]
+
+    scored = []
+    for index, sentence in enumerate(sentences):
+        score = len(_relevant_regex.findall(sentence)) * 2 + (3 if index < 3 else 0)
+        scored.append((-score, index, sentence))
+
+    kept = []
+    budget = max_tokens
+    for _, index, sentence in sorted(scored):
+        tokens = count_tokens(sentence)
+        if tokens <= budget:
+            kept.append((index, sentence))
+            budget -= tokens
+
+    return "".join(sentence for _, sentence in sorted(kept)).strip()
+
+def prepare_email_text(text: str, max_tokens: int):
+    """
+    Strip quoted replies, signatures, footers and tracking URLs, then keep
+    the most relevant sentences if the email is still over max_tokens.
+    Returns the text and the tokens each stage saved.
+    """
+    report = {"original_tokens": count_tokens(text)}
+    tokens = report["original_tokens"]
+
+    stages = [
+        ("quoted_replies", strip_quoted_replies),
+        ("signature", strip_signature),
+        ("footers", strip_footers),
+        ("tracking_urls", strip_tracking_urls),
+        ("whitespace", _collapse_whitespace),
+    ]
+    for name, stage in stages:
+        stripped = stage(text)
+        # Don't let stripping empty out an email that is all "boilerplate"
+        if not stripped.strip():
+            report[f"{name}_saved"] = 0
+            continue
+        text = stripped
+        stage_tokens = count_tokens(text)
+        report[f"{name}_saved"] = tokens - stage_tokens
+        tokens = stage_tokens
+
+    if tokens > max_tokens:
+        text = select_relevant_sentences(text, max_tokens)
+        stage_tokens = count_tokens(text)
+        # Sentence counts don't always add up exactly once joined
+        while stage_tokens > max_tokens and text:
+            text = text[:len(text) * max_tokens // (stage_tokens + 1)]
+            stage_tokens = count_tokens(text)
+        report["selection_saved"] = tokens - stage_tokens
+        tokens = stage_tokens
+    else:
+        report["selection_saved"] = 0
+
+    report["final_tokens"] = tokens
+    return text, report
@@ -0,0 +1,58 @@
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+
+from . import metrics
+
+READ_CACHE_MAX_ENTRIES = 256
+
+class CachedRead:
+    def __init__(self, data, etag: str, next_cursor: str = None):
+        self.data = data
+        self.etag = etag
+        self.next_cursor = next_cursor
+
+class ReadCache:
+    """
+    In-process LRU cache of read responses. Every database write clears it,
+    so a cached entry is always what the database would return.
+    """
+
+    def __init__(self, max_entries: int = READ_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.version = 0
+        self.lock = threading.Lock()
+
+    def get(self, key: tuple):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+        metrics.inc("cache_lookups", cache="read", result="miss" if entry is None else "hit")
+        return entry
+
+    def put(self, key: tuple, data, next_cursor: str = None, version: int = None) -> CachedRead:
+        """
+        Cache a response. Pass the version read before loading the data, so a
+        load that raced with a write isn't cached.
+        """
+        body = json.dumps([data, next_cursor], sort_keys=True, default=str)
+        entry = CachedRead(data, f'"{hashlib.sha1(body.encode("utf-8")).hexdigest()}"', next_cursor)
+
+        with self.lock:
+            if version is not None and version != self.version:
+                return entry
+            self.entries[key] = entry
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        return entry
+
+    def invalidate(self) -> None:
+        with self.lock:
+            self.entries.clear()
+            self.version += 1
+
+read_cache = ReadCache()
@@ -1,32 +1,162 @@
-from fastapi import APIRouter, HTTPException, Request, status
-from fastapi.responses import JSONResponse
+import json
+import base64
+from functools import partial
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from typing import Optional
 
-from .db import supabase, insert_job
-from .gmail_client import (
-    get_service, 
-    get_emails, 
-    is_possibly_job_related, 
-    mark_email_as_processed,  
-    is_email_processed 
-)
-from .ai_parser import ai_parse_email
+from .clients import get_storage
+from .storage import read_all
+from .gmail_client import get_service, new_fetch_stats, invalidate_processed_cache
+from .pipeline import scan_mailbox
+from .scan_jobs import scan_worker, FINISHED_STATUSES
+from .scheduler import scan_scheduler, get_account
+from .read_cache import read_cache
+from .dashboard_stats import dashboard_stats
+from .llm_cache import get_llm_cache
+from . import metrics
 
 router = APIRouter()
 
+# Columns that can be requested with ?fields=
+JOB_COLUMNS = ["id", "company", "position", "first_applied", "latest_update_at", "current_status", "email_id"]
+JOB_UPDATE_COLUMNS = ["id", "job_id", "company", "stage", "description", "received_at"]
+MAX_PAGE_SIZE = 500
+
+def _select_columns(fields: Optional[str], allowed: list, required: list) -> str:
+    """Build a select clause from a comma separated field list"""
+    if not fields:
+        return "*"
+
+    columns = [field.strip() for field in fields.split(",") if field.strip()]
+    unknown = [column for column in columns if column not in allowed]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+
+    # Keyset pagination needs the sort columns in every row
+    return ",".join(dict.fromkeys(columns + required))
+
+def _encode_cursor(row: dict, sort_column: str) -> str:
+    value = json.dumps([row[sort_column], row["id"]])
+    return base64.urlsafe_b64encode(value.encode("utf-8")).decode("ascii")
+
+def _decode_cursor(cursor: str) -> list:
+    """The [sort value, id] pair of a cursor made by _encode_cursor"""
+    try:
+        after = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+    # Anything else would reach the storage query, e.g. "ab" unpacks to a and b
+    if not isinstance(after, list) or len(after) != 2:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    sort_value, row_id = after
+    if not isinstance(sort_value, str) or isinstance(row_id, bool) or not isinstance(row_id, (int, str)):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return after
+
+def _fetch_page(list_rows, sort_column: str, limit: Optional[int], cursor: Optional[str]):
+    """
+    Call a storage list method, which returns rows newest first. Returns one
+    keyset page when limit is given, otherwise every row after the cursor.
+    """
+    after = _decode_cursor(cursor) if cursor else None
+
+    if limit is None:
+        return read_all(list_rows, sort_column, after), None
+
+    # One extra row tells us whether there is another page
+    rows = list_rows(limit=limit + 1, after=after)
+    if len(rows) > limit:
+        return rows[:limit], _encode_cursor(rows[limit - 1], sort_column)
+    return rows, None
+
+def _cached_read(request: Request, key: tuple, load) -> Response:
+    """
+    Serve a read from the cache when possible, answering 304 if the client
+    already has the current version. The next page cursor goes in X-Next-Cursor.
+    """
+    entry = read_cache.get(key)
+    if entry is None:
+        version = read_cache.version
+        data, next_cursor = load()
+        entry = read_cache.put(key, data, next_cursor, version)
+
+    headers = {"ETag": entry.etag}
+    if entry.next_cursor:
+        headers["X-Next-Cursor"] = entry.next_cursor
+
+    if request.headers.get("if-none-match") == entry.etag:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return JSONResponse(content=entry.data, headers=headers)
+
+def _check_limit(limit: Optional[int]) -> None:
+    if limit is not None and not 1 <= limit <= MAX_PAGE_SIZE:
+        raise HTTPException(status_code=400, detail=f"limit must be between 1 and {MAX_PAGE_SIZE}")
+
 @router.get("/jobs")
-def get_jobs():
-    response = supabase.table("job_applications").select("*").order("first_applied", desc=True).execute()
-    return response.data
+def get_jobs(request: Request, limit: Optional[int] = None, cursor: Optional[str] = None,
+             fields: Optional[str] = None, storage=Depends(get_storage)):
+    _check_limit(limit)
+    columns = _select_columns(fields, JOB_COLUMNS, ["id", "first_applied"])
+
+    def load():
+        return _fetch_page(partial(storage.list_jobs, columns), "first_applied", limit, cursor)
+
+    return _cached_read(request, ("jobs", columns, limit, cursor), load)
 
 @router.get("/job-updates/{job_id}")
-def get_job_updates(job_id: str):
-    response = supabase.table("job_updates") \
-        .select("*") \
-        .eq("job_id", job_id) \
-        .order("received_at", desc=True) \
-        .execute()
-    return response.data
+def get_job_updates(job_id: str, request: Request, limit: Optional[int] = None,
+                    cursor: Optional[str] = None, fields: Optional[str] = None, storage=Depends(get_storage)):
+    _check_limit(limit)
+    columns = _select_columns(fields, JOB_UPDATE_COLUMNS, ["id", "received_at"])
+
+    def load():
+        return _fetch_page(partial(storage.list_updates, job_id, columns), "received_at", limit, cursor)
+
+    return _cached_read(request, ("job-updates", job_id, columns, limit, cursor), load)
+
+@router.get("/dashboard")
+def get_dashboard(request: Request, updates: int = 0, storage=Depends(get_storage)):
+    """
+    Everything the dashboard needs in one request: aggregate stats and all
+    jobs, each with its latest `updates` updates embedded when asked for.
+    """
+    if not 0 <= updates <= 50:
+        raise HTTPException(status_code=400, detail="updates must be between 0 and 50")
+
+    def load():
+        dashboard_stats.ensure_loaded(storage)
+        list_rows = partial(storage.list_jobs_with_updates, updates) if updates else storage.list_jobs
+        jobs = read_all(list_rows, "first_applied")
+
+        return {"stats": dashboard_stats.snapshot(), "jobs": jobs}, None
+
+    return _cached_read(request, ("dashboard", updates), load)
+
+@router.get("/metrics")
+def get_metrics():
+    """Pipeline stage timings and counters in the Prometheus text format"""
+    gauges = {
+        "read_cache_entries": ("Responses in the read cache", {(): len(read_cache.entries)}),
+        "scans_running": ("Scans holding a scheduler slot", {(): len(scan_scheduler.running)}),
+    }
+
+    cache = get_llm_cache()
+    if cache is not None:
+        cache_stats = cache.stats()
+        gauges["llm_cache"] = ("LLM result cache counts since startup, and its size", {
+            (("stat", name),): cache_stats[name] for name in ("hits", "misses", "evictions", "entries")
+        })
+
+    scan_statuses = {}
+    for job in list(scan_worker.jobs.values()):
+        scan_statuses[job.status] = scan_statuses.get(job.status, 0) + 1
+    gauges["scan_jobs"] = ("Scan jobs known to this process by status", {
+        (("status", job_status),): count for job_status, count in scan_statuses.items()
+    })
+
+    return PlainTextResponse(metrics.render(gauges), media_type="text/plain; version=0.0.4")
 
 @router.post("/extract-emails")
 async def extract_emails(request: Request):
@@ -34,14 +164,14 @@ async def extract_emails(request: Request):
         data = await request.json()
         start_date = data.get("startDate")
         end_date = data.get("endDate")
+        incremental = bool(data.get("incremental", False))
         token = request.headers.get("Authorization", "").replace("Bearer ", "")
         
         if not all([start_date, end_date, token]):
             raise HTTPException(status_code=400, detail="Missing required fields")
 
         service = get_service(token)
-        processed_count = 0
-        job_related_count = 0
+        fetch_stats = new_fetch_stats()
         
         # Check for disconnection before starting
         if await request.is_disconnected():
@@ -50,64 +180,123 @@ async def extract_emails(request: Request):
                 content={
                     "success": True,
                     "stopped": True,
-                    "processed": processed_count,
-                    "job_related": job_related_count
+                    "processed": 0,
+                    "job_related": 0
                 }
             )
-            
-        # Process emails as they come in
-        async for email in get_emails(service, start_date, end_date, request):
-            try:
-                # Check for disconnection after each email
-                if await request.is_disconnected():
-                    print("\nSearch stopped by user - stopping email processing")
-                    await request.close()  # Force close the request
-                    return JSONResponse(
-                        status_code=status.HTTP_200_OK,
-                        content={
-                            "success": True,
-                            "stopped": True,
-                            "processed": processed_count,
-                            "job_related": job_related_count
-                        }
-                    )
-
-                # Step 4: AI Parse
-                ai_data = ai_parse_email(email["body"], email["date"])
-                processed_count += 1
-                
-                # Step 5: Add to database if job related
-                if ai_data.get("job_related"):
-                    if all(key in ai_data for key in ["company", "stage"]):
-                        ai_data["msg_id"] = email["msg_id"]
-                        insert_job(ai_data)
-                        job_related_count += 1
-                        print(f"Added job application for {ai_data['company']}")
-                
-            except Exception as e:
-                print(f"Error processing email: {str(e)}")
-                continue
+
+        # Shares the scan slots, Groq limit and Gmail quota with background scan jobs
+        account = await get_account(service)
+        async with scan_scheduler.slot(account):
+            result = await scan_mailbox(
+                service, start_date, end_date, request, fetch_stats, incremental,
+                limiter=scan_scheduler.limiter_for(account),
+                quota=scan_scheduler.quota_for(account)
+            )
+
+        if result["stopped"]:
+            return JSONResponse(
+                status_code=status.HTTP_200_OK,
+                content={"success": True, **result}
+            )
 
         return {
             "success": True,
-            "stopped": False,
-            "processed": processed_count,
-            "job_related": job_related_count
+            **result,
+            "fetch_stats": fetch_stats
         }
         
     except Exception as e:
         print(f"Error in extract_emails: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.post("/scan-jobs", status_code=status.HTTP_202_ACCEPTED)
+async def create_scan_job(request: Request):
+    """Queue a mailbox scan to run in the background"""
+    data = await request.json()
+    start_date = data.get("startDate")
+    end_date = data.get("endDate")
+    incremental = bool(data.get("incremental", False))
+    token = request.headers.get("Authorization", "").replace("Bearer ", "")
+
+    if not all([start_date, end_date, token]):
+        raise HTTPException(status_code=400, detail="Missing required fields")
+
+    job = await scan_worker.submit(token, start_date, end_date, incremental)
+    return job.to_dict()
+
+@router.get("/scan-jobs/{scan_id}")
+def get_scan_job(scan_id: str):
+    job = scan_worker.get(scan_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Scan job not found")
+    return job.to_dict()
+
+@router.get("/scan-jobs/{scan_id}/events")
+async def stream_scan_job(scan_id: str):
+    """Stream a scan job's progress as Server-Sent Events until it finishes"""
+    job = scan_worker.jobs.get(scan_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Scan job not found")
+
+    async def events():
+        queue = job.subscribe()
+        try:
+            yield f"data: {json.dumps(job.status_event())}\n\n"
+            if job.status in FINISHED_STATUSES:
+                return
+            while True:
+                event = await queue.get()
+                yield f"data: {json.dumps(event)}\n\n"
+                if event["type"] == "status" and event["status"] in FINISHED_STATUSES:
+                    return
+        finally:
+            job.unsubscribe(queue)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache"}
+    )
+
+@router.post("/scan-jobs/{scan_id}/cancel")
+async def cancel_scan_job(scan_id: str):
+    job = await scan_worker.cancel(scan_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Scan job not found")
+    return job.to_dict()
+
+@router.post("/scan-jobs/{scan_id}/resume", status_code=status.HTTP_202_ACCEPTED)
+async def resume_scan_job(scan_id: str, request: Request):
+    """Continue an interrupted or failed scan from its last checkpoint"""
+    token = request.headers.get("Authorization", "").replace("Bearer ", "")
+    if not token:
+        raise HTTPException(status_code=400, detail="Missing required fields")
+
+    job = await scan_worker.resume(scan_id, token)
+    if job is None:
+        raise HTTPException(status_code=409, detail="Scan job can't be resumed")
+    return job.to_dict()
+
 @router.delete("/jobs/{job_id}")
-def delete_job(job_id: str):
+def delete_job(job_id: str, storage=Depends(get_storage)):
     try:
-        # Delete job updates first (foreign key constraint)
-        supabase.table("job_updates").delete().eq("job_id", job_id).execute()
-        
-        # Then delete the job
-        supabase.table("job_applications").delete().eq("id", job_id).execute()
+        storage.delete_job(job_id)
+        read_cache.invalidate()
+        invalidate_processed_cache()
+        dashboard_stats.remove_job(job_id)
         
         return {"success": True, "message": "Job deleted successfully"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+
+@router.delete("/processed-emails")
+def clear_processed_emails(storage=Depends(get_storage)):
+    """Forget which emails were processed, so the next range scan parses them again"""
+    try:
+        storage.clear_processed()
+        invalidate_processed_cache()
+
+        return {"success": True, "message": "Processed emails cleared"}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
@@ -0,0 +1,282 @@
+import uuid
+import asyncio
+from datetime import datetime
+
+from .clients import get_storage
+from .gmail_client import get_service, new_fetch_stats
+from .pipeline import scan_mailbox
+from .scheduler import scan_scheduler, get_account
+
+# Statuses a job can't leave, except interrupted jobs which can be resumed
+FINISHED_STATUSES = {"completed", "failed", "cancelled", "interrupted"}
+SUBSCRIBER_QUEUE_SIZE = 1000
+
+class ScanJob:
+    """
+    A mailbox scan running in the background. The Gmail token is only kept
+    in memory, so a job interrupted by a restart needs a fresh token to resume.
+    """
+
+    def __init__(self, id: str, start_date: str, end_date: str, incremental: bool = False,
+                 token: str = None, status: str = "queued", page_token: str = None,
+                 processed: int = 0, job_related: int = 0, errors: int = 0,
+                 last_error: str = None, created_at: str = None):
+        self.id = id
+        self.start_date = start_date
+        self.end_date = end_date
+        self.incremental = incremental
+        self.token = token
+        self.status = status
+        self.page_token = page_token
+        self.processed = processed
+        self.job_related = job_related
+        self.errors = errors
+        self.last_error = last_error
+        self.created_at = created_at or datetime.now().isoformat()
+        self.account = None  # Known once the job starts, not persisted
+        self.cancel_requested = False
+        self.subscribers = []
+
+    @classmethod
+    def from_row(cls, row: dict) -> "ScanJob":
+        return cls(
+            id=row["id"],
+            start_date=row["start_date"],
+            end_date=row["end_date"],
+            incremental=row.get("incremental", False),
+            status=row["status"],
+            page_token=row.get("page_token"),
+            processed=row.get("processed", 0),
+            job_related=row.get("job_related", 0),
+            errors=row.get("errors", 0),
+            last_error=row.get("last_error"),
+            created_at=row.get("created_at"),
+        )
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "status": self.status,
+            "start_date": self.start_date,
+            "end_date": self.end_date,
+            "incremental": self.incremental,
+            "page_token": self.page_token,
+            "processed": self.processed,
+            "job_related": self.job_related,
+            "errors": self.errors,
+            "last_error": self.last_error,
+            "created_at": self.created_at,
+        }
+
+    # get_emails and scan_mailbox treat a cancelled job like a disconnected request
+    async def is_disconnected(self) -> bool:
+        return self.cancel_requested
+
+    async def close(self) -> None:
+        pass
+
+    def subscribe(self) -> asyncio.Queue:
+        queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        self.subscribers.append(queue)
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue) -> None:
+        if queue in self.subscribers:
+            self.subscribers.remove(queue)
+
+    def publish(self, event: dict) -> None:
+        """Send an event to every progress stream, dropping it for streams that fall behind"""
+        for queue in self.subscribers:
+            try:
+                queue.put_nowait(event)
+            except asyncio.QueueFull:
+                continue
+
+    def status_event(self) -> dict:
+        return {"type": "status", **self.to_dict()}
+
+def save_scan_job(job: ScanJob) -> None:
+    """Checkpoint a job's state to the database"""
+    try:
+        get_storage().save_scan_job({
+            **job.to_dict(),
+            "updated_at": datetime.now().isoformat()
+        })
+    except Exception as e:
+        print(f"Error saving scan job {job.id}: {str(e)}")
+
+def load_scan_job(job_id: str):
+    try:
+        row = get_storage().get_scan_job(job_id)
+        return ScanJob.from_row(row) if row else None
+    except Exception as e:
+        print(f"Error loading scan job {job_id}: {str(e)}")
+        return None
+
+def load_unfinished_scan_jobs() -> list:
+    try:
+        rows = get_storage().list_scan_jobs(["queued", "running"])
+        return [ScanJob.from_row(row) for row in rows]
+    except Exception as e:
+        print(f"Error loading unfinished scan jobs: {str(e)}")
+        return []
+
+class ScanWorker:
+    """
+    Runs queued scan jobs in the background, as many at once as the
+    scheduler allows, with one scan per account at a time.
+    """
+
+    def __init__(self, scheduler=scan_scheduler):
+        self.jobs = {}
+        self.queue = None
+        self.task = None
+        self.scheduler = scheduler
+        self.running = set()
+
+    async def start(self) -> None:
+        self.queue = asyncio.Queue()
+        self.task = asyncio.create_task(self._run_forever())
+
+        # Jobs that were queued or running when the process stopped lost their token
+        for job in await asyncio.to_thread(load_unfinished_scan_jobs):
+            job.status = "interrupted"
+            self.jobs[job.id] = job
+            await asyncio.to_thread(save_scan_job, job)
+            print(f"Scan job {job.id} was interrupted, resume it from page {job.page_token}")
+
+    async def stop(self) -> None:
+        tasks = [task for task in [self.task, *self.running] if task]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def get(self, job_id: str):
+        return self.jobs.get(job_id) or load_scan_job(job_id)
+
+    async def submit(self, token: str, start_date: str, end_date: str, incremental: bool = False) -> ScanJob:
+        job = ScanJob(str(uuid.uuid4()), start_date, end_date, incremental, token)
+        self.jobs[job.id] = job
+        await asyncio.to_thread(save_scan_job, job)
+        await self.queue.put(job.id)
+        return job
+
+    async def resume(self, job_id: str, token: str):
+        """Queue an interrupted or failed job again, continuing from its checkpoint"""
+        job = self.get(job_id)
+        if job is None or job.status not in ("interrupted", "failed"):
+            return None
+
+        self.jobs[job.id] = job
+        job.token = token
+        job.status = "queued"
+        job.cancel_requested = False
+        await asyncio.to_thread(save_scan_job, job)
+        job.publish(job.status_event())
+        await self.queue.put(job.id)
+        return job
+
+    async def cancel(self, job_id: str):
+        job = self.jobs.get(job_id)
+        if job is None or job.status in FINISHED_STATUSES:
+            return job
+
+        job.cancel_requested = True
+        if job.status == "queued":
+            await self._finish(job, "cancelled")
+        return job
+
+    async def _finish(self, job: ScanJob, status: str) -> None:
+        job.status = status
+        job.token = None
+        await asyncio.to_thread(save_scan_job, job)
+        job.publish(job.status_event())
+
+    async def _run_forever(self) -> None:
+        while True:
+            job = self.jobs.get(await self.queue.get())
+            if job is None or job.status != "queued":
+                continue
+            # Each job waits for its own slot, so a busy account doesn't hold up the queue
+            task = asyncio.create_task(self._run_scheduled(job))
+            self.running.add(task)
+            task.add_done_callback(self.running.discard)
+
+    async def _run_scheduled(self, job: ScanJob) -> None:
+        try:
+            service = get_service(job.token)
+            job.account = await get_account(service)
+        except Exception as e:
+            print(f"Error starting scan job {job.id}: {str(e)}")
+            if job.status != "queued":
+                return
+            job.errors += 1
+            job.last_error = str(e)
+            await self._finish(job, "failed")
+            return
+
+        try:
+            async with self.scheduler.slot(job.account):
+                # Cancelled while waiting for a slot
+                if job.status != "queued":
+                    return
+                await self._run(job, service)
+        except asyncio.CancelledError:
+            # The app is shutting down, the checkpoint lets the job resume later
+            if job.status in ("queued", "running"):
+                job.status = "interrupted"
+                save_scan_job(job)
+            raise
+
+    async def _run(self, job: ScanJob, service) -> None:
+        job.status = "running"
+        await asyncio.to_thread(save_scan_job, job)
+        job.publish(job.status_event())
+
+        # Counts carry over from earlier runs of a resumed job
+        base_processed = job.processed
+        base_job_related = job.job_related
+        progress = {"processed": 0, "job_related": 0}
+
+        async def on_email(email: dict, ai_data: dict) -> None:
+            progress["processed"] += 1
+            if ai_data.get("job_related") and ai_data.get("company") and ai_data.get("stage"):
+                progress["job_related"] += 1
+            job.processed = base_processed + progress["processed"]
+            job.job_related = base_job_related + progress["job_related"]
+            job.publish({
+                "type": "email",
+                "msg_id": email["msg_id"],
+                "subject": email["subject"],
+                "date": email["date"],
+                "job_related": bool(ai_data.get("job_related")),
+                "company": ai_data.get("company"),
+                "stage": ai_data.get("stage"),
+                "processed": job.processed,
+                "job_related_count": job.job_related,
+            })
+
+        async def on_page(next_page_token: str) -> None:
+            job.page_token = next_page_token
+            await asyncio.to_thread(save_scan_job, job)
+            job.publish({"type": "checkpoint", "page_token": next_page_token, "processed": job.processed})
+
+        try:
+            result = await scan_mailbox(
+                service, job.start_date, job.end_date, job, new_fetch_stats(), job.incremental,
+                job.page_token, on_page, on_email,
+                limiter=self.scheduler.limiter_for(job.account),
+                quota=self.scheduler.quota_for(job.account)
+            )
+        except Exception as e:
+            print(f"Error in scan job {job.id}: {str(e)}")
+            job.errors += 1
+            job.last_error = str(e)
+            await self._finish(job, "failed")
+            return
+
+        job.processed = base_processed + result["processed"]
+        job.job_related = base_job_related + result["job_related"]
+        await self._finish(job, "cancelled" if result["stopped"] else "completed")
+
+scan_worker = ScanWorker()
@@ -0,0 +1,108 @@
+import os
+import asyncio
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+
+from .pipeline import TokenBucket, RateLimiter, groq_limiter
+
+# Scans running at once across all accounts, which bounds memory and connections
+SCAN_MAX_CONCURRENT = int(os.getenv("SCAN_MAX_CONCURRENT", "8"))
+# Gmail allows 250 quota units per second per user
+GMAIL_QUOTA_UNITS_PER_SECOND = int(os.getenv("GMAIL_QUOTA_UNITS_PER_SECOND", "250"))
+
+class FairRateLimiter:
+    """
+    Shares one rate limiter between accounts in round-robin order, so an
+    account with a large mailbox can't queue ahead of everyone else. Each
+    account's requests are still served in the order they were made.
+    """
+
+    def __init__(self, limiter: RateLimiter):
+        self.limiter = limiter
+        self.waiters = OrderedDict()  # account -> deque of (tokens, future)
+        self.dispatcher = None
+
+    async def acquire(self, tokens: int, account: str = "default") -> None:
+        future = asyncio.get_running_loop().create_future()
+        self.waiters.setdefault(account, deque()).append((tokens, future))
+        if self.dispatcher is None or self.dispatcher.done():
+            self.dispatcher = asyncio.create_task(self._dispatch())
+        await future
+
+    def for_account(self, account: str) -> "AccountRateLimiter":
+        return AccountRateLimiter(self, account)
+
+    async def _dispatch(self) -> None:
+        while self.waiters:
+            # Serve the account at the front, then move it to the back
+            account, queue = self.waiters.popitem(last=False)
+            tokens, future = queue.popleft()
+            if queue:
+                self.waiters[account] = queue
+
+            # The caller stopped waiting, e.g. its scan was cancelled
+            if future.done():
+                continue
+
+            await self.limiter.acquire(tokens)
+            if not future.done():
+                future.set_result(None)
+
+class AccountRateLimiter:
+    """One account's view of a FairRateLimiter, usable wherever a RateLimiter is"""
+
+    def __init__(self, fair_limiter: FairRateLimiter, account: str):
+        self.fair_limiter = fair_limiter
+        self.account = account
+
+    async def acquire(self, tokens: int) -> None:
+        await self.fair_limiter.acquire(tokens, self.account)
+
+class ScanScheduler:
+    """
+    Runs scans for many accounts at once. Each account gets its own Gmail
+    quota bucket and one scan at a time, all accounts take turns at the
+    shared Groq limit, and at most max_concurrent scans run in total.
+    """
+
+    def __init__(self, max_concurrent: int = SCAN_MAX_CONCURRENT, limiter: RateLimiter = groq_limiter,
+                 gmail_quota_per_second: int = GMAIL_QUOTA_UNITS_PER_SECOND):
+        self.max_concurrent = max_concurrent
+        self.fair_limiter = FairRateLimiter(limiter)
+        self.gmail_quota_per_second = gmail_quota_per_second
+        self.slots = None
+        self.account_locks = {}
+        self.quotas = {}
+        self.running = set()
+
+    @asynccontextmanager
+    async def slot(self, account: str):
+        """Wait for this account's previous scan to finish and for a free slot"""
+        # Created lazily so the semaphore belongs to the running event loop
+        if self.slots is None:
+            self.slots = asyncio.Semaphore(self.max_concurrent)
+
+        lock = self.account_locks.setdefault(account, asyncio.Lock())
+        async with lock:
+            async with self.slots:
+                self.running.add(account)
+                try:
+                    yield
+                finally:
+                    self.running.discard(account)
+
+    def limiter_for(self, account: str) -> AccountRateLimiter:
+        return self.fair_limiter.for_account(account)
+
+    def quota_for(self, account: str) -> TokenBucket:
+        quota = self.quotas.get(account)
+        if quota is None:
+            quota = self.quotas[account] = TokenBucket(self.gmail_quota_per_second, self.gmail_quota_per_second)
+        return quota
+
+async def get_account(service) -> str:
+    """The email address a Gmail service belongs to"""
+    profile = await asyncio.to_thread(service.users().getProfile(userId="me").execute)
+    return profile["emailAddress"]
+
+scan_scheduler = ScanScheduler()
@@ -0,0 +1,521 @@
+import os
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from datetime import datetime
+from contextlib import contextmanager
+
+from .clients import get_supabase
+
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "supabase")
+SQLITE_PATH = os.getenv(
+    "SQLITE_PATH",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "jobtracker.sqlite3")
+)
+# Rows per request when reading a whole table. PostgREST caps responses at its
+# max-rows setting, 1000 on Supabase, so this must not be larger than that.
+READ_PAGE_SIZE = int(os.getenv("STORAGE_READ_PAGE_SIZE", "1000"))
+
+class Storage(ABC):
+    """
+    Everything the backend reads and writes. Rows are plain dicts shaped
+    like the Supabase tables. List methods return rows newest first and
+    take an optional (sort value, id) keyset cursor to start after.
+    """
+
+    name = "storage"
+
+    @contextmanager
+    def transaction(self):
+        """Group writes so they are committed together where the backend allows it"""
+        yield
+
+    # Job applications and their updates
+    @abstractmethod
+    def get_applications(self, companies: list) -> list:
+        ...
+
+    @abstractmethod
+    def get_updates_between(self, job_ids: list, stages: list, start: str, end: str) -> list:
+        """Updates of these jobs received between start and end, at one of stages unless it is None"""
+
+    @abstractmethod
+    def insert_applications(self, rows: list) -> list:
+        """Insert new applications, returning them with their ids"""
+
+    @abstractmethod
+    def update_applications(self, rows: list) -> None:
+        ...
+
+    @abstractmethod
+    def insert_updates(self, rows: list) -> list:
+        """Insert job updates, returning them with their ids"""
+
+    @abstractmethod
+    def list_jobs(self, columns: str = "*", limit: int = None, after: list = None) -> list:
+        """Applications by first_applied"""
+
+    @abstractmethod
+    def list_updates(self, job_id: str = None, columns: str = "*", limit: int = None, after: list = None) -> list:
+        """Updates by received_at, for one job or all of them"""
+
+    @abstractmethod
+    def list_jobs_with_updates(self, updates: int, limit: int = None, after: list = None) -> list:
+        """Applications by first_applied, each with its latest updates under "job_updates" """
+
+    @abstractmethod
+    def delete_job(self, job_id: str) -> None:
+        ...
+
+    # Processed emails and incremental sync
+    @abstractmethod
+    def get_processed_ids(self, msg_ids: list) -> set:
+        """The subset of msg_ids already marked processed"""
+
+    @abstractmethod
+    def mark_processed(self, msg_ids: list) -> None:
+        """Mark emails processed, ignoring ones that already are"""
+
+    @abstractmethod
+    def clear_processed(self) -> None:
+        """Forget every processed email, so the next range scan parses them again"""
+
+    @abstractmethod
+    def get_sync_state(self, account: str):
+        """The Gmail history ID saved for an account, or None"""
+
+    @abstractmethod
+    def save_sync_state(self, account: str, history_id: str) -> None:
+        ...
+
+    # Background scan jobs
+    @abstractmethod
+    def save_scan_job(self, row: dict) -> None:
+        ...
+
+    @abstractmethod
+    def get_scan_job(self, job_id: str):
+        ...
+
+    @abstractmethod
+    def list_scan_jobs(self, statuses: list) -> list:
+        ...
+
+    def close(self) -> None:
+        pass
+
+class SupabaseStorage(Storage):
+    """Tables in Supabase, reached through PostgREST"""
+
+    name = "supabase"
+
+    def __init__(self):
+        self.lock = threading.RLock()
+
+    @property
+    def db(self):
+        return get_supabase()
+
+    @contextmanager
+    def transaction(self):
+        """
+        PostgREST can't group requests into a transaction, so this only keeps
+        other transactions in this process out until the block ends
+        """
+        with self.lock:
+            yield
+
+    @staticmethod
+    def _filter_value(value) -> str:
+        """A value for a PostgREST filter, quoted so commas, dots and brackets stay part of it"""
+        if isinstance(value, bool) or not isinstance(value, (int, str)):
+            raise ValueError(f"Can't filter on {value!r}")
+        if isinstance(value, int):
+            return str(value)
+        escaped = value.replace("\\", "\\\\").replace('"', '\\"')
+        return f'"{escaped}"'
+
+    @staticmethod
+    def _page_query(query, sort_column: str, limit: int, after: list):
+        # postgrest-py 0.13 adds a separate order= for every .order() call and
+        # has no or_(), so the ordering and cursor go on the query string directly
+        query.params = query.params.add("order", f"{sort_column}.desc,id.desc")
+        if after:
+            sort_value, row_id = after
+            if not isinstance(sort_value, str):
+                raise ValueError(f"Can't page after {sort_value!r}")
+            sort_value, row_id = SupabaseStorage._filter_value(sort_value), SupabaseStorage._filter_value(row_id)
+            query.params = query.params.add(
+                "or", f"({sort_column}.lt.{sort_value},and({sort_column}.eq.{sort_value},id.lt.{row_id}))"
+            )
+        if limit is not None:
+            query = query.limit(limit)
+        return query
+
+    def _page(self, query, sort_column: str, limit: int, after: list):
+        return self._page_query(query, sort_column, limit, after).execute().data
+
+    def get_applications(self, companies: list) -> list:
+        return self.db.table("job_applications").select("*").in_("company", companies).execute().data
+
+    def get_updates_between(self, job_ids: list, stages: list, start: str, end: str) -> list:
+        query = self.db.table("job_updates") \
+            .select("job_id, stage, description, received_at") \
+            .in_("job_id", job_ids) \
+            .gte("received_at", start) \
+            .lte("received_at", end)
+        if stages is not None:
+            query = query.in_("stage", stages)
+        return query.execute().data
+
+    def insert_applications(self, rows: list) -> list:
+        return self.db.table("job_applications").insert(rows).execute().data
+
+    def update_applications(self, rows: list) -> None:
+        self.db.table("job_applications").upsert(rows).execute()
+
+    def insert_updates(self, rows: list) -> list:
+        return self.db.table("job_updates").insert(rows).execute().data
+
+    def list_jobs(self, columns: str = "*", limit: int = None, after: list = None) -> list:
+        query = self.db.table("job_applications").select(columns)
+        return self._page(query, "first_applied", limit, after)
+
+    def list_updates(self, job_id: str = None, columns: str = "*", limit: int = None, after: list = None) -> list:
+        query = self.db.table("job_updates").select(columns)
+        if job_id is not None:
+            query = query.eq("job_id", job_id)
+        return self._page(query, "received_at", limit, after)
+
+    def list_jobs_with_updates(self, updates: int, limit: int = None, after: list = None) -> list:
+        query = self.db.table("job_applications") \
+            .select("*, job_updates(*)") \
+            .order("received_at", desc=True, foreign_table="job_updates") \
+            .limit(updates, foreign_table="job_updates")
+        return self._page(query, "first_applied", limit, after)
+
+    def delete_job(self, job_id: str) -> None:
+        # Under the insert_jobs lock, so a batch can't add an update between the deletes
+        with self.transaction():
+            # Delete job updates first (foreign key constraint)
+            self.db.table("job_updates").delete().eq("job_id", job_id).execute()
+            self.db.table("job_applications").delete().eq("id", job_id).execute()
+
+    def get_processed_ids(self, msg_ids: list) -> set:
+        response = self.db.table("processed_emails").select("id").in_("id", msg_ids).execute()
+        return {row["id"] for row in response.data}
+
+    def mark_processed(self, msg_ids: list) -> None:
+        processed_at = datetime.now().isoformat()
+        rows = [{"id": msg_id, "processed_at": processed_at} for msg_id in msg_ids]
+        self.db.table("processed_emails").upsert(rows, ignore_duplicates=True).execute()
+
+    def clear_processed(self) -> None:
+        # PostgREST refuses a delete without a filter
+        self.db.table("processed_emails").delete().neq("id", "").execute()
+
+    def get_sync_state(self, account: str):
+        response = self.db.table("gmail_sync_state").select("history_id").eq("account", account).execute()
+        return response.data[0]["history_id"] if response.data else None
+
+    def save_sync_state(self, account: str, history_id: str) -> None:
+        self.db.table("gmail_sync_state").upsert({
+            "account": account,
+            "history_id": history_id,
+            "updated_at": datetime.now().isoformat()
+        }).execute()
+
+    def save_scan_job(self, row: dict) -> None:
+        self.db.table("scan_jobs").upsert(row).execute()
+
+    def get_scan_job(self, job_id: str):
+        response = self.db.table("scan_jobs").select("*").eq("id", job_id).execute()
+        return response.data[0] if response.data else None
+
+    def list_scan_jobs(self, statuses: list) -> list:
+        return self.db.table("scan_jobs").select("*").in_("status", statuses).execute().data
+
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS job_applications (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    company TEXT NOT NULL,
+    position TEXT,
+    first_applied TEXT NOT NULL,
+    latest_update_at TEXT NOT NULL,
+    current_status TEXT,
+    email_id TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_job_applications_company ON job_applications (company);
+CREATE INDEX IF NOT EXISTS idx_job_applications_first_applied ON job_applications (first_applied, id);
+
+CREATE TABLE IF NOT EXISTS job_updates (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    job_id INTEGER NOT NULL REFERENCES job_applications (id) ON DELETE CASCADE,
+    company TEXT,
+    stage TEXT,
+    description TEXT,
+    received_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_job_updates_job_stage_received_at ON job_updates (job_id, stage, received_at);
+CREATE INDEX IF NOT EXISTS idx_job_updates_job_received_at ON job_updates (job_id, received_at, id);
+CREATE INDEX IF NOT EXISTS idx_job_updates_received_at ON job_updates (received_at, id);
+
+CREATE TABLE IF NOT EXISTS processed_emails (
+    id TEXT PRIMARY KEY,
+    processed_at TEXT NOT NULL
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS gmail_sync_state (
+    account TEXT PRIMARY KEY,
+    history_id TEXT NOT NULL,
+    updated_at TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS scan_jobs (
+    id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    start_date TEXT,
+    end_date TEXT,
+    incremental INTEGER NOT NULL DEFAULT 0,
+    page_token TEXT,
+    processed INTEGER NOT NULL DEFAULT 0,
+    job_related INTEGER NOT NULL DEFAULT 0,
+    errors INTEGER NOT NULL DEFAULT 0,
+    last_error TEXT,
+    created_at TEXT,
+    updated_at TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_scan_jobs_status ON scan_jobs (status);
+"""
+
+APPLICATION_COLUMNS = ["company", "position", "first_applied", "latest_update_at", "current_status", "email_id"]
+UPDATE_COLUMNS = ["job_id", "company", "stage", "description", "received_at"]
+SCAN_JOB_COLUMNS = [
+    "id", "status", "start_date", "end_date", "incremental", "page_token", "processed",
+    "job_related", "errors", "last_error", "created_at", "updated_at",
+]
+
+# SQLite limits the number of bound parameters per statement
+SQLITE_MAX_PARAMS = 900
+
+def _chunks(values: list, size: int = SQLITE_MAX_PARAMS):
+    for i in range(0, len(values), size):
+        yield values[i:i + size]
+
+def _placeholders(values: list) -> str:
+    return ", ".join("?" * len(values))
+
+class SQLiteStorage(Storage):
+    """
+    Tables in a local SQLite file in WAL mode, for single-user and on-prem
+    deployments where a round trip to Supabase costs more than the query.
+    Scans run in threads, so all access goes through one connection and lock.
+    """
+
+    name = "sqlite"
+
+    def __init__(self, path: str = SQLITE_PATH):
+        self.path = path
+        self.lock = threading.RLock()
+        self.depth = 0  # Nesting of open transaction() blocks
+
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        # WAL keeps the database consistent without syncing on every commit
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("PRAGMA foreign_keys=ON")
+        self.conn.executescript(SQLITE_SCHEMA)
+        self.conn.commit()
+
+    @contextmanager
+    def transaction(self):
+        """Commit every write made inside the outermost block at once, or none of them"""
+        with self.lock:
+            self.depth += 1
+            try:
+                yield
+                if self.depth == 1:
+                    self.conn.commit()
+            except BaseException:
+                if self.depth == 1:
+                    self.conn.rollback()
+                raise
+            finally:
+                self.depth -= 1
+
+    def _query(self, sql: str, params: list = ()) -> list:
+        with self.lock:
+            return [dict(row) for row in self.conn.execute(sql, params).fetchall()]
+
+    def _page(self, sql: str, params: list, sort_column: str, limit: int, after: list) -> list:
+        """Finish a select with keyset pagination, newest first"""
+        params = list(params)
+        if after:
+            sort_value, row_id = after
+            sql += f" AND ({sort_column} < ? OR ({sort_column} = ? AND id < ?))"
+            params += [sort_value, sort_value, row_id]
+        sql += f" ORDER BY {sort_column} DESC, id DESC"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+        return self._query(sql, params)
+
+    def get_applications(self, companies: list) -> list:
+        rows = []
+        for chunk in _chunks(companies):
+            rows += self._query(
+                f"SELECT * FROM job_applications WHERE company IN ({_placeholders(chunk)}) ORDER BY id", chunk
+            )
+        return rows
+
+    def get_updates_between(self, job_ids: list, stages: list, start: str, end: str) -> list:
+        stage_filter = f" AND stage IN ({_placeholders(stages)})" if stages is not None else ""
+        rows = []
+        for chunk in _chunks(job_ids, SQLITE_MAX_PARAMS - len(stages or []) - 2):
+            rows += self._query(
+                "SELECT job_id, stage, description, received_at FROM job_updates"
+                f" WHERE job_id IN ({_placeholders(chunk)}){stage_filter} AND received_at BETWEEN ? AND ?",
+                [*chunk, *(stages or []), start, end]
+            )
+        return rows
+
+    def insert_applications(self, rows: list) -> list:
+        inserted = []
+        with self.transaction():
+            for row in rows:
+                cursor = self.conn.execute(
+                    f"INSERT INTO job_applications ({', '.join(APPLICATION_COLUMNS)})"
+                    f" VALUES ({_placeholders(APPLICATION_COLUMNS)})",
+                    [row.get(column) for column in APPLICATION_COLUMNS]
+                )
+                inserted.append({"id": cursor.lastrowid, **{column: row.get(column) for column in APPLICATION_COLUMNS}})
+        return inserted
+
+    def update_applications(self, rows: list) -> None:
+        columns = [column for column in APPLICATION_COLUMNS if column != "company"]
+        with self.transaction():
+            self.conn.executemany(
+                f"UPDATE job_applications SET {', '.join(f'{column} = ?' for column in columns)} WHERE id = ?",
+                [[row.get(column) for column in columns] + [row["id"]] for row in rows]
+            )
+
+    def insert_updates(self, rows: list) -> list:
+        inserted = []
+        with self.transaction():
+            for row in rows:
+                cursor = self.conn.execute(
+                    f"INSERT INTO job_updates ({', '.join(UPDATE_COLUMNS)}) VALUES ({_placeholders(UPDATE_COLUMNS)})",
+                    [row.get(column) for column in UPDATE_COLUMNS]
+                )
+                inserted.append({"id": cursor.lastrowid, **{column: row.get(column) for column in UPDATE_COLUMNS}})
+        return inserted
+
+    def list_jobs(self, columns: str = "*", limit: int = None, after: list = None) -> list:
+        return self._page(f"SELECT {columns} FROM job_applications WHERE 1 = 1", [], "first_applied", limit, after)
+
+    def list_updates(self, job_id: str = None, columns: str = "*", limit: int = None, after: list = None) -> list:
+        if job_id is None:
+            return self._page(f"SELECT {columns} FROM job_updates WHERE 1 = 1", [], "received_at", limit, after)
+        return self._page(f"SELECT {columns} FROM job_updates WHERE job_id = ?", [job_id], "received_at", limit, after)
+
+    def list_jobs_with_updates(self, updates: int, limit: int = None, after: list = None) -> list:
+        jobs = self.list_jobs(limit=limit, after=after)
+        job_filter = ""
+        params = [updates]
+        if limit is not None:
+            # Only this page's jobs, which fit in one statement at any sensible page size
+            job_filter = f"WHERE job_id IN ({_placeholders(jobs)})"
+            params = [job["id"] for job in jobs] + params
+        latest = self._query(f"""
+            SELECT * FROM (
+                SELECT *, ROW_NUMBER() OVER (PARTITION BY job_id ORDER BY received_at DESC, id DESC) AS position_in_job
+                FROM job_updates {job_filter}
+            ) WHERE position_in_job <= ? ORDER BY job_id, position_in_job
+        """, params)
+
+        by_job = {}
+        for update in latest:
+            del update["position_in_job"]
+            by_job.setdefault(update["job_id"], []).append(update)
+        for job in jobs:
+            job["job_updates"] = by_job.get(job["id"], [])
+        return jobs
+
+    def delete_job(self, job_id: str) -> None:
+        with self.transaction():
+            self.conn.execute("DELETE FROM job_updates WHERE job_id = ?", [job_id])
+            self.conn.execute("DELETE FROM job_applications WHERE id = ?", [job_id])
+
+    def get_processed_ids(self, msg_ids: list) -> set:
+        processed = set()
+        for chunk in _chunks(msg_ids):
+            rows = self._query(f"SELECT id FROM processed_emails WHERE id IN ({_placeholders(chunk)})", chunk)
+            processed.update(row["id"] for row in rows)
+        return processed
+
+    def mark_processed(self, msg_ids: list) -> None:
+        processed_at = datetime.now().isoformat()
+        with self.transaction():
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO processed_emails (id, processed_at) VALUES (?, ?)",
+                [(msg_id, processed_at) for msg_id in msg_ids]
+            )
+
+    def clear_processed(self) -> None:
+        with self.transaction():
+            self.conn.execute("DELETE FROM processed_emails")
+
+    def get_sync_state(self, account: str):
+        rows = self._query("SELECT history_id FROM gmail_sync_state WHERE account = ?", [account])
+        return rows[0]["history_id"] if rows else None
+
+    def save_sync_state(self, account: str, history_id: str) -> None:
+        with self.transaction():
+            self.conn.execute(
+                "INSERT OR REPLACE INTO gmail_sync_state (account, history_id, updated_at) VALUES (?, ?, ?)",
+                [account, history_id, datetime.now().isoformat()]
+            )
+
+    def save_scan_job(self, row: dict) -> None:
+        with self.transaction():
+            self.conn.execute(
+                f"INSERT OR REPLACE INTO scan_jobs ({', '.join(SCAN_JOB_COLUMNS)})"
+                f" VALUES ({_placeholders(SCAN_JOB_COLUMNS)})",
+                [row.get(column) for column in SCAN_JOB_COLUMNS]
+            )
+
+    def get_scan_job(self, job_id: str):
+        rows = self._query("SELECT * FROM scan_jobs WHERE id = ?", [job_id])
+        return self._scan_job_row(rows[0]) if rows else None
+
+    def list_scan_jobs(self, statuses: list) -> list:
+        rows = self._query(f"SELECT * FROM scan_jobs WHERE status IN ({_placeholders(statuses)})", statuses)
+        return [self._scan_job_row(row) for row in rows]
+
+    def _scan_job_row(self, row: dict) -> dict:
+        return {**row, "incremental": bool(row["incremental"])}
+
+    def close(self) -> None:
+        with self.lock:
+            self.conn.close()
+
+def read_all(list_rows, sort_column: str, after: list = None, page_size: int = READ_PAGE_SIZE) -> list:
+    """
+    Every row a list method returns after the cursor, fetched one keyset
+    page at a time so no single response is cut off at the server's row limit
+    """
+    rows = []
+    while True:
+        page = list_rows(limit=page_size, after=after)
+        rows += page
+        if len(page) < page_size:
+            return rows
+        after = [page[-1][sort_column], page[-1]["id"]]
+
+def create_storage(backend: str = STORAGE_BACKEND) -> Storage:
+    if backend == "sqlite":
+        return SQLiteStorage()
+    if backend == "supabase":
+        return SupabaseStorage()
+    raise ValueError(f"Unknown storage backend: {backend}")
@@ -0,0 +1,11 @@
+import os
+import sys
+
+# Run from backend/ or the repo root: python -m pytest
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench.common import use_fake_environment
+
+# Read at import time by the backend modules, so set before any test imports them
+use_fake_environment()
+os.environ.setdefault("LLM_CACHE_DISABLED", "true")
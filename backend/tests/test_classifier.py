@@ -0,0 +1,18 @@
+from bench.bench_classifier import BODIES, SUBJECTS, build_corpus, legacy_is_possibly_job_related
+from src.gmail_client import EXCLUDED, classify_job_relevance, is_possibly_job_related
+
+# Every golden subject and body together, plus some long generated bodies.
+# The legacy patterns backtrack a lot on long text, so keep those few.
+CORPUS = build_corpus(len(SUBJECTS) * len(BODIES) + 30)
+
+def test_classifier_matches_the_legacy_patterns():
+    mismatches = []
+    for subject, body in CORPUS:
+        # get_emails checks the subject alone, then with the body
+        for text in ("", body):
+            expected = legacy_is_possibly_job_related(subject, text)
+            category = classify_job_relevance(subject, text)
+            if (category not in (None, EXCLUDED)) != expected or is_possibly_job_related(subject, text) != expected:
+                mismatches.append((subject, text[:80], category))
+
+    assert mismatches == []
@@ -0,0 +1,33 @@
+import pytest
+
+from bench.fakes import Recorder, FakeSupabase
+from src import clients
+from src.dashboard_stats import DashboardStats
+from src.storage import SupabaseStorage
+
+@pytest.fixture
+def storage(monkeypatch):
+    monkeypatch.setattr(clients, "_supabase", FakeSupabase(Recorder()))
+    return SupabaseStorage()
+
+def test_stats_load_every_row_past_the_response_cap(storage):
+    # More rows than the 1000 PostgREST returns in one response
+    jobs = storage.insert_applications([
+        {"company": f"Company {index}", "first_applied": f"2024-01-{index % 28 + 1:02d}",
+         "latest_update_at": "2024-02-01T00:00:00", "current_status": "interview" if index % 3 else "applied"}
+        for index in range(1500)
+    ])
+    storage.insert_updates([
+        {"job_id": job["id"], "company": job["company"], "stage": stage, "received_at": f"2024-01-{day:02d}T00:00:00"}
+        for job in jobs
+        for stage, day in (("applied", 1), ("interview", 15))
+    ])
+
+    stats = DashboardStats()
+    stats.ensure_loaded(storage)
+
+    snapshot = stats.snapshot()
+    assert snapshot["total_applications"] == 1500
+    assert snapshot["status_counts"] == {"applied": 500, "interview": 1000}
+    assert snapshot["stage_reach"] == {"applied": 1500, "interview": 1500}
+    assert snapshot["transitions"] == {"applied -> interview": 1500}
@@ -0,0 +1,36 @@
+from src.dedup import NearDuplicateIndex
+
+TEMPLATE = (
+    "Hi Sam,\n\nThank you for applying to the Software Engineer position at {company}. "
+    "Our team will review your application and get back to you if your experience is a match "
+    "for the role. We appreciate your interest and the time you took to apply.\n\n"
+    "Best regards,\nThe {company} Recruiting Team\n\nReference {reference}"
+)
+
+def email(msg_id: str, company: str, sender: str, reference: int = 1, thread_id: str = None) -> dict:
+    return {
+        "msg_id": msg_id,
+        "subject": "Thank you for your application",
+        "sender": sender,
+        "body": TEMPLATE.format(company=company, reference=reference),
+        "thread_id": thread_id,
+    }
+
+def test_resent_email_from_the_same_company_is_a_duplicate():
+    index = NearDuplicateIndex()
+    assert index.representative(email("m1", "Acme", "Acme <jobs@acme.com>", reference=1)) is None
+    assert index.representative(email("m2", "Acme", "Acme <jobs@acme.com>", reference=2)) == "m1"
+
+def test_same_ats_template_for_different_companies_is_kept():
+    index = NearDuplicateIndex()
+    sender = "no-reply@greenhouse.io"
+    assert index.representative(email("m1", "Acme", sender)) is None
+    assert index.representative(email("m2", "Globex", sender)) is None
+    assert index.representative(email("m3", "Initech", sender, thread_id="t1")) is None
+    assert index.representative(email("m4", "Umbrella", sender, thread_id="t1")) is None
+
+def test_emails_without_a_sender_are_not_clustered():
+    index = NearDuplicateIndex()
+    first, second = email("m1", "Acme", ""), email("m2", "Acme", "")
+    assert index.representative(first) is None
+    assert index.representative(second) is None
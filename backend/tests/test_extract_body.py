@@ -0,0 +1,70 @@
+from base64 import urlsafe_b64encode
+
+from src.gmail_client import MAX_BODY_CHARS, extract_body, _find_text_part
+
+def part(mime: str, text: str = None, **extra) -> dict:
+    body = {"data": urlsafe_b64encode(text.encode("utf-8")).decode("ascii")} if text is not None else {}
+    return {"mimeType": mime, "body": body, **extra}
+
+def multipart(mime: str, *parts) -> dict:
+    return {"mimeType": mime, "body": {"size": 0}, "parts": list(parts)}
+
+def message(payload: dict) -> dict:
+    return {"id": "m1", "payload": payload}
+
+def test_plain_text_is_found_inside_nested_multiparts():
+    payload = multipart(
+        "multipart/mixed",
+        multipart("multipart/alternative",
+                  part("text/plain", "Thank you for applying to Acme"),
+                  part("text/html", "<p>Thank you for applying to <b>Acme</b></p>")),
+        part("application/pdf", filename="offer.pdf", body={"attachmentId": "a1", "size": 1024}),
+    )
+
+    assert extract_body(message(payload)) == "Thank you for applying to Acme"
+
+def test_html_only_email_is_converted_to_text():
+    payload = multipart(
+        "multipart/alternative",
+        part("text/html", "<html><body><p>Your interview with <b>Globex</b> is on Monday</p></body></html>"),
+    )
+
+    body = extract_body(message(payload))
+
+    assert "Your interview with" in body and "Globex" in body
+    assert "<p>" not in body
+
+def test_attachments_are_skipped():
+    html_parts = []
+    payload = multipart(
+        "multipart/mixed",
+        part("text/plain", "Resume attached", filename="resume.txt"),
+        part("text/html", "<p>Cover letter</p>", filename="cover.html"),
+        part("text/plain", "We received your application"),
+    )
+
+    found = _find_text_part(payload, html_parts)
+
+    assert found is payload["parts"][2]
+    assert html_parts == []
+    assert extract_body(message(payload)) == "We received your application"
+
+def test_attachment_only_email_has_no_body():
+    payload = multipart(
+        "multipart/mixed",
+        part("application/pdf", filename="offer.pdf", body={"attachmentId": "a1", "size": 1024}),
+    )
+
+    assert extract_body(message(payload)) is None
+
+def test_body_is_capped():
+    text = "word " * (MAX_BODY_CHARS // 2)
+
+    assert extract_body(message(part("text/plain", text))) == text[:MAX_BODY_CHARS]
+    html = multipart("multipart/alternative", part("text/html", f"<p>{text}</p>"))
+    assert len(extract_body(message(html))) <= MAX_BODY_CHARS
+
+def test_multibyte_text_is_cut_on_a_character():
+    text = "é" * 100
+
+    assert extract_body(message(part("text/plain", text)), max_chars=10) == "é" * 10
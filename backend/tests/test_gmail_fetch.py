@@ -0,0 +1,54 @@
+import asyncio
+from datetime import datetime
+
+import pytest
+
+from bench.fakes import Recorder, FakeGmailService, make_message
+from src import gmail_client
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(gmail_client, "GMAIL_BACKOFF_BASE", 0.0)
+    monkeypatch.setattr(gmail_client.random, "uniform", lambda low, high: 0.0)
+
+def make_service(count: int, failures: dict = None) -> FakeGmailService:
+    messages = [
+        make_message(f"m{index}", f"Subject {index}", "sender@example.com", f"Body {index}", datetime(2024, 1, 1))
+        for index in range(count)
+    ]
+    return FakeGmailService(messages, Recorder(), failures=failures)
+
+def fetch(service: FakeGmailService, msg_ids: list) -> dict:
+    return asyncio.run(gmail_client.fetch_messages(service, msg_ids))
+
+@pytest.mark.parametrize("count", [1, 50, 51, 120])
+def test_one_batch_per_batch_size_messages(count):
+    service = make_service(count)
+    msg_ids = [f"m{index}" for index in range(count)]
+
+    results = fetch(service, msg_ids)
+
+    assert sorted(results) == sorted(msg_ids)
+    batches = -(-count // gmail_client.GMAIL_BATCH_SIZE)
+    assert service.recorder.calls["gmail.batch"] == batches
+    assert service.recorder.calls["gmail.messages.get"] == count
+
+def test_rate_limited_message_is_retried_alone():
+    service = make_service(60, failures={"m7": [429, 429]})
+
+    results = fetch(service, [f"m{index}" for index in range(60)])
+
+    assert len(results) == 60
+    # Two batches, then two retries holding only the rate limited message
+    assert service.recorder.calls["gmail.batch"] == 4
+    assert service.recorder.calls["gmail.messages.get"] == 62
+
+def test_failed_message_only_drops_its_own_entry():
+    service = make_service(60, failures={"m3": [404]})
+
+    results = fetch(service, [f"m{index}" for index in range(60)])
+
+    assert "m3" not in results
+    assert len(results) == 59
+    assert results["m4"]["id"] == "m4"
+    assert service.recorder.calls["gmail.batch"] == 2
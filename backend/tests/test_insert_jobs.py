@@ -0,0 +1,137 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from bench.fakes import Recorder, FakeSupabase
+from src import clients
+from src.db import insert_jobs
+from src.storage import SupabaseStorage, SQLiteStorage
+
+@pytest.fixture
+def db(monkeypatch):
+    db = FakeSupabase(Recorder())
+    monkeypatch.setattr(clients, "_supabase", db)
+    monkeypatch.setattr(clients, "_storage", SupabaseStorage())
+    return db
+
+def job(company: str, stage: str, date: str, description: str = None, msg_id: str = None) -> dict:
+    return {
+        "company": company,
+        "position": "Engineer",
+        "stage": stage,
+        "description": description or f"{company} {stage}",
+        "application_date": date,
+        "msg_id": msg_id or f"{company}-{stage}-{date}",
+    }
+
+def applications(db) -> dict:
+    return {row["company"]: row for row in db.tables.get("job_applications", {}).values()}
+
+def updates(db) -> list:
+    return list(db.tables.get("job_updates", {}).values())
+
+def round_trips(db) -> int:
+    return sum(count for name, count in db.recorder.calls.items() if name.startswith("supabase."))
+
+def test_batch_is_grouped_by_company(db):
+    written = insert_jobs([
+        job("Acme", "applied", "2024-01-02"),
+        job("Globex", "applied", "2024-01-03"),
+        job("Acme", "interview", "2024-01-10"),
+    ])
+
+    assert written == 3
+    rows = applications(db)
+    assert sorted(rows) == ["Acme", "Globex"]
+    assert rows["Acme"]["current_status"] == "interview"
+    assert sorted(update["company"] for update in updates(db)) == ["Acme", "Acme", "Globex"]
+    assert {update["job_id"] for update in updates(db) if update["company"] == "Acme"} == {rows["Acme"]["id"]}
+
+def test_first_and_latest_dates_are_merged(db):
+    insert_jobs([job("Acme", "applied", "2024-02-01")])
+
+    insert_jobs([
+        job("Acme", "interview", "2024-03-01"),
+        job("Acme", "applied", "2024-01-15", description="Earlier confirmation"),
+    ])
+
+    row = applications(db)["Acme"]
+    assert row["first_applied"] == "2024-01-15"
+    assert row["latest_update_at"].startswith("2024-03-01")
+    # Entries apply in order, so the last one sets the status even if it is older
+    assert row["current_status"] == "applied"
+
+def test_duplicate_updates_are_skipped(db):
+    insert_jobs([job("Acme", "applied", "2024-01-02")])
+
+    written = insert_jobs([
+        job("Acme", "applied", "2024-01-02", msg_id="resent"),     # Same as the stored update
+        job("Acme", "interview", "2024-01-05"),
+        job("Acme", "interview", "2024-01-05", msg_id="repeat"),   # Same as an earlier entry in the batch
+        job("Acme", "applied", "2024-01-20", msg_id="later"),      # Outside the window
+    ])
+
+    assert written == 2
+    assert len(updates(db)) == 3
+
+@pytest.mark.parametrize("count", [3, 60])
+def test_round_trips_do_not_grow_with_the_batch(db, count):
+    companies = [f"Company {index}" for index in range(count)]
+    insert_jobs([job(company, "applied", "2024-01-02") for company in companies[:count // 2]])
+    db.recorder.calls.clear()
+
+    # Half the companies exist already, half are new
+    insert_jobs([job(company, "interview", "2024-01-09") for company in companies])
+
+    # Select applications and updates, insert new applications, update existing ones, insert updates
+    assert round_trips(db) == 5
+
+@pytest.mark.parametrize("backend", ["supabase", "sqlite"])
+def test_concurrent_batches_share_a_new_company(monkeypatch, backend):
+    if backend == "sqlite":
+        storage = SQLiteStorage(":memory:")
+    else:
+        # Latency leaves room for the other batch between reads and writes
+        monkeypatch.setattr(clients, "_supabase", FakeSupabase(Recorder(), latency=0.01))
+        storage = SupabaseStorage()
+    monkeypatch.setattr(clients, "_storage", storage)
+
+    batches = [[job("Acme", "applied", "2024-01-02")], [job("Acme", "interview", "2024-01-09")]]
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        assert sum(pool.map(insert_jobs, batches)) == 2
+
+    rows = storage.list_jobs()
+    assert [row["company"] for row in rows] == ["Acme"]
+    assert len(storage.list_updates(rows[0]["id"])) == 2
+
+@pytest.mark.parametrize("backend", ["supabase", "sqlite"])
+def test_a_job_deleted_during_a_batch_stays_deleted(monkeypatch, backend):
+    if backend == "sqlite":
+        storage = SQLiteStorage(":memory:")
+    else:
+        monkeypatch.setattr(clients, "_supabase", FakeSupabase(Recorder(), latency=0.01))
+        storage = SupabaseStorage()
+    monkeypatch.setattr(clients, "_storage", storage)
+    insert_jobs([job("Acme", "applied", "2024-01-02")])
+    job_id = storage.list_jobs()[0]["id"]
+
+    # Delete once the batch has read the application it is about to update
+    read = threading.Event()
+    get_applications = storage.get_applications
+    def get_applications_then_signal(companies):
+        rows = get_applications(companies)
+        read.set()
+        return rows
+    monkeypatch.setattr(storage, "get_applications", get_applications_then_signal)
+
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        batch = pool.submit(insert_jobs, [job("Acme", "interview", "2024-01-09")])
+        read.wait(timeout=5)
+        pool.submit(storage.delete_job, job_id).result()
+        batch.result()
+
+    # The deleted job must not come back through the batch's write
+    job_ids = {row["id"] for row in storage.list_jobs()}
+    assert job_id not in job_ids
+    assert all(update["job_id"] in job_ids for update in storage.list_updates())
@@ -0,0 +1,61 @@
+from src.preprocess import prepare_email_text
+
+FORWARDED = """FYI, see below.
+
+---------- Forwarded message ---------
+From: Acme Careers <careers@acme.com>
+Date: Mon, Jan 8, 2024 at 9:12 AM
+Subject: Your application to Acme
+To: <me@example.com>
+
+Thank you for applying to the Software Engineer position at Acme.
+We would like to invite you to an interview next week.
+"""
+
+def test_forwarded_job_email_is_kept():
+    text, report = prepare_email_text(FORWARDED, max_tokens=1000)
+
+    assert "Software Engineer position at Acme" in text
+    assert "invite you to an interview" in text
+    assert report["quoted_replies_saved"] == 0
+
+OUTLOOK_FORWARD = """FYI
+
+From: Acme Careers <careers@acme.com>
+Sent: Monday, January 8, 2024 9:12 AM
+To: Sam <sam@example.com>
+Subject: Your application to Acme
+
+Thank you for applying to the Software Engineer position at Acme.
+We would like to invite you to an interview next week.
+"""
+
+def test_outlook_forward_is_kept():
+    text, _ = prepare_email_text(OUTLOOK_FORWARD, max_tokens=1000)
+
+    assert "Software Engineer position at Acme" in text
+    assert "invite you to an interview" in text
+
+def test_quoted_reply_is_stripped():
+    reply = (
+        "Hi Dana, thank you for the update on my application. Tuesday afternoon works well for the "
+        "interview, and I can also do Wednesday morning if that is easier for the team.\n\n"
+        "On Mon, Jan 8, 2024 at 9:12 AM Acme Careers <careers@acme.com> wrote:\n"
+        "> Thank you for applying to the Software Engineer position at Acme.\n"
+    )
+
+    text, _ = prepare_email_text(reply, max_tokens=1000)
+
+    assert text.startswith("Hi Dana")
+    assert "Software Engineer position" not in text
+
+def test_short_reply_keeps_the_email_it_quotes():
+    reply = (
+        "Thanks, Tuesday works for me.\n\n"
+        "On Mon, Jan 8, 2024 at 9:12 AM Acme Careers <careers@acme.com> wrote:\n"
+        "> We would like to invite you to an interview for the Software Engineer position.\n"
+    )
+
+    text, _ = prepare_email_text(reply, max_tokens=1000)
+
+    assert "invite you to an interview for the Software Engineer position" in text
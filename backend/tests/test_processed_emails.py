@@ -0,0 +1,44 @@
+from src import gmail_client
+from src.gmail_client import (
+    ProcessedIdCache, ProcessedEmailBuffer, filter_unprocessed, get_processed_cache, invalidate_processed_cache
+)
+from src.storage import SQLiteStorage
+
+def test_cache_keeps_the_most_recently_used_ids():
+    cache = ProcessedIdCache(max_entries=3)
+    cache.update(["a", "b", "c"])
+    assert "a" in cache  # Now the most recently used
+
+    cache.update(["d"])
+
+    assert "b" not in cache
+    assert all(msg_id in cache for msg_id in ("a", "c", "d"))
+    assert len(cache.ids) == 3
+
+def test_cached_ids_skip_the_database():
+    storage = SQLiteStorage(":memory:")
+    cache = ProcessedIdCache()
+    buffer = ProcessedEmailBuffer(storage, cache)
+    buffer.add("m1")
+    buffer.flush()
+
+    storage.get_processed_ids = lambda msg_ids: set()  # The database would say unprocessed
+    assert filter_unprocessed(storage, ["m1", "m2"], cache) == ["m2"]
+
+def test_scans_share_the_cache_until_processed_state_is_cleared(monkeypatch):
+    monkeypatch.setattr(gmail_client, "PROCESSED_CACHE_ENABLED", True)
+    monkeypatch.setattr(gmail_client, "_processed_cache", ProcessedIdCache())
+    storage = SQLiteStorage(":memory:")
+    buffer = ProcessedEmailBuffer(storage, get_processed_cache())
+    buffer.add("m1")
+    buffer.flush()
+
+    # A later scan gets the same cache, so it doesn't ask the database
+    storage.get_processed_ids = lambda msg_ids: set()
+    assert filter_unprocessed(storage, ["m1"], get_processed_cache()) == []
+
+    invalidate_processed_cache()
+    assert filter_unprocessed(storage, ["m1"], get_processed_cache()) == ["m1"]
+
+def test_cache_is_off_by_default():
+    assert get_processed_cache() is None
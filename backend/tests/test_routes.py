@@ -0,0 +1,128 @@
+import json
+import base64
+
+import pytest
+
+pytest.importorskip("fastapi")
+pytest.importorskip("httpx")
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from bench.fakes import Recorder, FakeSupabase
+from src import clients, gmail_client
+from src.gmail_client import ProcessedIdCache
+from src.read_cache import read_cache
+from src.routes import router
+from src.storage import SupabaseStorage, SQLiteStorage
+
+@pytest.fixture(params=["supabase", "sqlite"])
+def storage(request, monkeypatch):
+    if request.param == "supabase":
+        monkeypatch.setattr(clients, "_supabase", FakeSupabase(Recorder()))
+        storage = SupabaseStorage()
+    else:
+        storage = SQLiteStorage(":memory:")
+    monkeypatch.setattr(clients, "_storage", storage)
+    read_cache.invalidate()
+    yield storage
+    storage.close()
+
+@pytest.fixture
+def client(storage):
+    app = FastAPI()
+    app.include_router(router)
+    return TestClient(app)
+
+def add_jobs(storage, count: int) -> list:
+    """count jobs, two applied on each day so ids break the ties"""
+    return storage.insert_applications([
+        {"company": f"Company {index}", "position": "Engineer", "first_applied": f"2024-01-{index // 2 + 1:02d}",
+         "latest_update_at": "2024-02-01T00:00:00", "current_status": "applied", "email_id": f"m{index}"}
+        for index in range(count)
+    ])
+
+def cursor(value) -> str:
+    return base64.urlsafe_b64encode(json.dumps(value).encode("utf-8")).decode("ascii")
+
+def test_pages_follow_the_cursor_to_the_end(client, storage):
+    add_jobs(storage, 7)
+
+    companies, next_cursor = [], None
+    while True:
+        response = client.get("/jobs", params={"limit": 3, **({"cursor": next_cursor} if next_cursor else {})})
+        assert response.status_code == 200
+        companies += [row["company"] for row in response.json()]
+        next_cursor = response.headers.get("X-Next-Cursor")
+        if not next_cursor:
+            break
+
+    assert companies == [row["company"] for row in storage.list_jobs()]
+    assert len(set(companies)) == 7
+
+def test_unchanged_read_is_not_modified(client, storage):
+    add_jobs(storage, 2)
+    first = client.get("/jobs")
+    etag = first.headers["ETag"]
+
+    again = client.get("/jobs", headers={"If-None-Match": etag})
+    assert again.status_code == 304
+    assert again.headers["ETag"] == etag
+
+    # A write changes what the database returns, so the old ETag no longer matches
+    storage.insert_applications([{"company": "Initech", "position": "Engineer", "first_applied": "2024-03-01",
+                                  "latest_update_at": "2024-03-01T00:00:00", "current_status": "applied",
+                                  "email_id": "m9"}])
+    read_cache.invalidate()
+    changed = client.get("/jobs", headers={"If-None-Match": etag})
+    assert changed.status_code == 200
+    assert changed.headers["ETag"] != etag
+
+def test_fields_select_columns_and_keep_the_sort_columns(client, storage):
+    add_jobs(storage, 2)
+
+    response = client.get("/jobs", params={"fields": "company"})
+
+    assert response.status_code == 200
+    assert all(set(row) == {"company", "id", "first_applied"} for row in response.json())
+    assert client.get("/jobs", params={"fields": "company,password"}).status_code == 400
+
+@pytest.mark.parametrize("bad_cursor", [
+    "not base64!",
+    cursor("ab"),
+    cursor(["2024-01-01"]),
+    cursor(["2024-01-01", 1, 2]),
+    cursor({"first_applied": "2024-01-01", "id": 1}),
+    cursor([5, 1]),
+    cursor(["2024-01-01", True]),
+    cursor(["2024-01-01", [1]]),
+])
+def test_invalid_cursor_is_rejected(client, storage, bad_cursor):
+    add_jobs(storage, 2)
+
+    response = client.get("/jobs", params={"limit": 1, "cursor": bad_cursor})
+
+    assert response.status_code == 400
+
+def test_cursor_values_cannot_change_the_filter(client, storage):
+    add_jobs(storage, 4)
+
+    # Quotes, commas and brackets are compared as part of the value
+    response = client.get("/jobs", params={"limit": 10, "cursor": cursor(['2024-01-02",id.gt.0)', 1])})
+
+    assert response.status_code == 200
+    assert [row["first_applied"] for row in response.json()] == ["2024-01-02", "2024-01-02", "2024-01-01", "2024-01-01"]
+
+def test_deleting_a_job_or_processed_state_clears_the_processed_cache(client, storage, monkeypatch):
+    cache = ProcessedIdCache()
+    monkeypatch.setattr(gmail_client, "_processed_cache", cache)
+    jobs = add_jobs(storage, 2)
+    storage.mark_processed(["m0", "m1"])
+
+    cache.update(["m0", "m1"])
+    assert client.delete(f"/jobs/{jobs[0]['id']}").status_code == 200
+    assert "m0" not in cache
+
+    cache.update(["m0", "m1"])
+    assert client.delete("/processed-emails").status_code == 200
+    assert "m1" not in cache
+    assert storage.get_processed_ids(["m0", "m1"]) == set()
@@ -0,0 +1,162 @@
+import asyncio
+from datetime import datetime
+
+import pytest
+
+from bench.fakes import Recorder, FakeGmailService, make_message
+from src import clients, pipeline
+from src.storage import SQLiteStorage
+
+@pytest.fixture
+def storage(monkeypatch):
+    storage = SQLiteStorage(":memory:")
+    monkeypatch.setattr(clients, "_storage", storage)
+    # Every email parses locally as an application to its own company
+    monkeypatch.setattr(pipeline, "try_local_parse", lambda email: {
+        "job_related": True,
+        "company": email["subject"].removeprefix("Application received: "),
+        "position": "Engineer",
+        "stage": "applied",
+        "description": email["subject"],
+        "application_date": email["date"],
+    })
+    yield storage
+    storage.close()
+
+def make_service(count: int) -> FakeGmailService:
+    messages = [
+        make_message(f"m{index}", f"Application received: Company {index}", "jobs@example.com",
+                     f"Thank you for applying to Company {index}, reference {index}", datetime(2024, 1, 1))
+        for index in range(count)
+    ]
+    return FakeGmailService(messages, Recorder())
+
+class StopAfter:
+    """Reports a disconnect once the scan has handled count emails"""
+
+    def __init__(self, count: int):
+        self.count = count
+        self.handled = []
+
+    async def on_email(self, email, ai_data):
+        self.handled.append(email["gmail_id"])
+
+    async def is_disconnected(self) -> bool:
+        return len(self.handled) >= self.count
+
+    async def close(self):
+        pass
+
+def processed_ids(storage, count: int = 120) -> set:
+    return storage.get_processed_ids([f"m{index}" for index in range(count)])
+
+def test_stopped_scan_only_marks_handled_emails(storage):
+    request = StopAfter(30)
+
+    result = asyncio.run(pipeline.scan_mailbox(
+        make_service(120), "2023-12-01", "2024-02-01", request=request, on_email=request.on_email
+    ))
+
+    assert result["stopped"]
+    assert len(request.handled) == 30
+    # Emails fetched and queued for parsing but never handled are left for the next scan
+    assert processed_ids(storage) == set(request.handled)
+    assert len(storage.list_jobs("id")) == 30
+
+def test_completed_scan_marks_every_email(storage):
+    result = asyncio.run(pipeline.scan_mailbox(make_service(120), "2023-12-01", "2024-02-01"))
+
+    assert not result["stopped"]
+    assert processed_ids(storage) == {f"m{index}" for index in range(120)}
+
+def test_pages_are_checkpointed_once_their_emails_are_stored(storage):
+    # Listed 500 at a time, so pages end after m499 and m999
+    service = make_service(1100)
+    checkpoints = []
+
+    async def on_page(next_page_token):
+        checkpoints.append(next_page_token)
+        # Everything listed before the checkpoint is already stored
+        assert len(processed_ids(storage, 1100)) >= int(next_page_token or 1100)
+
+    request = StopAfter(600)
+    asyncio.run(pipeline.scan_mailbox(
+        service, "2023-12-01", "2024-02-01", request=request, on_page=on_page, on_email=request.on_email
+    ))
+    assert checkpoints == ["500"]
+
+    # Resuming from the checkpoint skips the emails stored after it
+    asyncio.run(pipeline.scan_mailbox(service, "2023-12-01", "2024-02-01", page_token="500", on_page=on_page))
+    assert checkpoints == ["500", "1000", None]
+    assert len(processed_ids(storage, 1100)) == 1100
+
+def test_incremental_scan_lists_only_new_emails_from_history(storage):
+    service = make_service(120)
+
+    # Nothing saved yet, so the first scan lists the range and saves the history ID
+    asyncio.run(pipeline.scan_mailbox(service, "2023-12-01", "2024-02-01", incremental=True))
+    assert storage.get_sync_state(service.email_address) == "120"
+    assert service.recorder.calls["gmail.history.list"] == 0
+
+    service.deliver([
+        make_message(f"new{index}", f"Application received: New {index}", "jobs@example.com",
+                     f"Thank you for applying to New {index}", datetime(2024, 1, 2))
+        for index in range(5)
+    ])
+    service.recorder.calls.clear()
+    result = asyncio.run(pipeline.scan_mailbox(service, "2023-12-01", "2024-02-01", incremental=True))
+
+    assert result["processed"] == 5
+    assert service.recorder.calls["gmail.history.list"] == 1
+    assert service.recorder.calls["gmail.messages.list"] == 0
+    # Headers first, then the full message
+    assert service.recorder.calls["gmail.messages.get"] == 10
+    assert storage.get_sync_state(service.email_address) == "125"
+
+def test_expired_history_falls_back_to_the_range(storage):
+    service = make_service(20)
+    storage.save_sync_state(service.email_address, "3")
+    service.history_kept_from = 10
+
+    result = asyncio.run(pipeline.scan_mailbox(service, "2023-12-01", "2024-02-01", incremental=True))
+
+    assert result["processed"] == 20
+    assert service.recorder.calls["gmail.messages.list"] == 1
+    assert storage.get_sync_state(service.email_address) == "20"
+
+def test_rate_limited_parse_is_retried(monkeypatch):
+    class RateLimitError(Exception):
+        status_code = 429
+
+    calls = []
+
+    def parse(body, date, lookup_cache=True):
+        calls.append(body)
+        if len(calls) < 3:
+            raise RateLimitError("Rate limit reached")
+        return {"job_related": False}
+
+    monkeypatch.setattr(pipeline, "ai_parse_email", parse)
+    monkeypatch.setattr(pipeline, "_retry_delay", lambda error, attempt: 0)
+    email = {"body": "Thanks for applying", "date": "2024-01-01", "msg_id": "m1"}
+
+    assert asyncio.run(pipeline.parse_with_retry(email, pipeline.RateLimiter())) == {"job_related": False}
+    assert len(calls) == 3
+
+def test_cancelling_a_scan_with_a_full_parse_queue_finishes(storage, monkeypatch):
+    async def slow_parse(*args, **kwargs):
+        await asyncio.sleep(60)
+
+    # Everything goes to the LLM workers, which never finish, so the queue fills up
+    monkeypatch.setattr(pipeline, "try_local_parse", lambda email: None)
+    monkeypatch.setattr(pipeline, "parse_with_retry", slow_parse)
+    monkeypatch.setattr(pipeline, "parse_batch_with_retry", slow_parse)
+
+    async def run():
+        task = asyncio.create_task(pipeline.scan_mailbox(make_service(200), "2023-12-01", "2024-02-01"))
+        await asyncio.sleep(0.5)
+        task.cancel()
+        done, _ = await asyncio.wait({task}, timeout=5)
+        return task in done and task.cancelled()
+
+    assert asyncio.run(run())
@@ -0,0 +1,177 @@
+from urllib.parse import parse_qsl
+
+import pytest
+
+from bench.fakes import Recorder, FakeSupabase
+from src import clients
+from src.dashboard_stats import DashboardStats
+from src.storage import Storage, SupabaseStorage, SQLiteStorage
+
+@pytest.fixture(params=["supabase", "sqlite"])
+def storage(request, monkeypatch):
+    if request.param == "supabase":
+        monkeypatch.setattr(clients, "_supabase", FakeSupabase(Recorder()))
+        storage = SupabaseStorage()
+    else:
+        storage = SQLiteStorage(":memory:")
+    yield storage
+    storage.close()
+
+def add_jobs(storage, count: int) -> list:
+    """count jobs, the first three with updates on the 1st, 2nd and 3rd of the month"""
+    jobs = storage.insert_applications([
+        {"company": f"Company {index}", "position": "Engineer", "first_applied": f"2024-01-{index % 5 + 1:02d}",
+         "latest_update_at": "2024-02-01T00:00:00", "current_status": "interview", "email_id": f"m{index}"}
+        for index in range(count)
+    ])
+    storage.insert_updates([
+        {"job_id": job["id"], "company": job["company"], "stage": stage,
+         "description": f"{job['company']} {stage}", "received_at": f"2024-02-{day:02d}T00:00:00"}
+        for job in jobs[:3]
+        for stage, day in (("applied", 1), ("screen", 2), ("interview", 3))
+    ])
+    return jobs
+
+def test_storage_methods_must_all_be_implemented():
+    class Partial(Storage):
+        def get_applications(self, companies):
+            return []
+
+    with pytest.raises(TypeError):
+        Partial()
+
+def test_inserted_rows_get_ids_and_can_be_read_back(storage):
+    jobs = add_jobs(storage, 3)
+
+    assert len({job["id"] for job in jobs}) == 3
+    found = storage.get_applications(["Company 1", "Company 9"])
+    assert [(row["company"], row["current_status"]) for row in found] == [("Company 1", "interview")]
+
+    updates = storage.list_updates(jobs[0]["id"])
+    assert [update["stage"] for update in updates] == ["interview", "screen", "applied"]
+
+def test_updates_between_filter_on_stage_and_dates(storage):
+    jobs = add_jobs(storage, 3)
+    job_ids = [job["id"] for job in jobs[:2]]
+
+    between = storage.get_updates_between(job_ids, ["applied", "screen"], "2024-02-01T00:00:00", "2024-02-01T12:00:00")
+    assert sorted(update["stage"] for update in between) == ["applied", "applied"]
+
+    any_stage = storage.get_updates_between(job_ids, None, "2024-02-02T00:00:00", "2024-02-03T00:00:00")
+    assert len(any_stage) == 4
+
+def test_update_applications_changes_only_the_given_rows(storage):
+    jobs = add_jobs(storage, 2)
+
+    storage.update_applications([{**jobs[0], "current_status": "offer"}])
+
+    statuses = {row["company"]: row["current_status"] for row in storage.list_jobs()}
+    assert statuses == {"Company 0": "offer", "Company 1": "interview"}
+
+def test_keyset_pages_cover_every_job_once(storage):
+    add_jobs(storage, 23)
+
+    seen, after = [], None
+    while True:
+        rows = storage.list_jobs(limit=5, after=after)
+        seen += rows
+        if len(rows) < 5:
+            break
+        after = [rows[-1]["first_applied"], rows[-1]["id"]]
+
+    assert len({row["id"] for row in seen}) == 23
+    assert seen == sorted(seen, key=lambda row: (row["first_applied"], row["id"]), reverse=True)
+
+def test_jobs_with_updates_embed_the_latest_updates(storage):
+    jobs = add_jobs(storage, 5)
+
+    rows = storage.list_jobs_with_updates(2)
+
+    assert [row["id"] for row in rows] == [row["id"] for row in storage.list_jobs()]
+    by_id = {row["id"]: row for row in rows}
+    assert [update["stage"] for update in by_id[jobs[0]["id"]]["job_updates"]] == ["interview", "screen"]
+    assert by_id[jobs[4]["id"]]["job_updates"] == []
+
+    first_page = storage.list_jobs_with_updates(2, limit=2)
+    rest = storage.list_jobs_with_updates(2, after=[first_page[-1]["first_applied"], first_page[-1]["id"]])
+    assert [row["id"] for row in first_page + rest] == [row["id"] for row in rows]
+
+def test_deleting_a_job_deletes_its_updates(storage):
+    jobs = add_jobs(storage, 2)
+
+    storage.delete_job(jobs[0]["id"])
+
+    assert [row["id"] for row in storage.list_jobs()] == [jobs[1]["id"]]
+    assert {update["job_id"] for update in storage.list_updates()} == {jobs[1]["id"]}
+
+def test_marking_processed_twice_is_harmless(storage):
+    storage.mark_processed(["m1", "m2"])
+    storage.mark_processed(["m2", "m3"])
+
+    assert storage.get_processed_ids(["m1", "m3", "m4"]) == {"m1", "m3"}
+
+def test_clearing_processed_forgets_every_email(storage):
+    storage.mark_processed(["m1", "m2"])
+
+    storage.clear_processed()
+
+    assert storage.get_processed_ids(["m1", "m2"]) == set()
+
+def test_sync_state_is_saved_per_account(storage):
+    assert storage.get_sync_state("me@example.com") is None
+
+    storage.save_sync_state("me@example.com", "100")
+    storage.save_sync_state("me@example.com", "250")
+    storage.save_sync_state("other@example.com", "7")
+
+    assert storage.get_sync_state("me@example.com") == "250"
+    assert storage.get_sync_state("other@example.com") == "7"
+
+def test_scan_jobs_are_saved_and_listed_by_status(storage):
+    job = {
+        "id": "scan-1", "status": "running", "start_date": "2024-01-01", "end_date": "2024-02-01",
+        "incremental": True, "page_token": None, "processed": 0, "job_related": 0, "errors": 0,
+        "last_error": None, "created_at": "2024-02-01T10:00:00", "updated_at": "2024-02-01T10:00:00",
+    }
+    storage.save_scan_job(job)
+    storage.save_scan_job({**job, "id": "scan-2", "status": "completed"})
+    storage.save_scan_job({**job, "page_token": "500", "processed": 120})
+
+    saved = storage.get_scan_job("scan-1")
+    assert (saved["page_token"], saved["processed"], saved["incremental"]) == ("500", 120, True)
+    assert storage.get_scan_job("missing") is None
+    assert [row["id"] for row in storage.list_scan_jobs(["queued", "running"])] == ["scan-1"]
+
+def test_dashboard_stats_load_from_either_backend(storage):
+    add_jobs(storage, 5)
+
+    stats = DashboardStats()
+    stats.ensure_loaded(storage)
+
+    snapshot = stats.snapshot()
+    assert snapshot["total_applications"] == 5
+    assert snapshot["status_counts"] == {"interview": 5}
+    assert snapshot["stage_reach"] == {"applied": 3, "screen": 3, "interview": 3}
+    assert snapshot["transitions"] == {"applied -> screen": 3, "screen -> interview": 3}
+
+def test_keyset_page_sends_one_order_parameter():
+    postgrest = pytest.importorskip("postgrest")
+    query = postgrest.SyncPostgrestClient("http://localhost:3000").table("job_applications").select("*")
+
+    query = SupabaseStorage._page_query(query, "first_applied", 50, ["2024-01-02", 7])
+
+    params = parse_qsl(str(query.params))
+    assert [value for key, value in params if key == "order"] == ["first_applied.desc,id.desc"]
+    assert ("or", '(first_applied.lt."2024-01-02",and(first_applied.eq."2024-01-02",id.lt.7))') in params
+    assert ("limit", "50") in params
+
+def test_keyset_cursor_values_are_quoted():
+    postgrest = pytest.importorskip("postgrest")
+    query = postgrest.SyncPostgrestClient("http://localhost:3000").table("job_applications").select("*")
+
+    query = SupabaseStorage._page_query(query, "first_applied", 50, ['2024",id.gt.0', "a\\b"])
+
+    params = parse_qsl(str(query.params))
+    assert ("or", r'(first_applied.lt."2024\",id.gt.0",and(first_applied.eq."2024\",id.gt.0",id.lt."a\\b"))') in params
+    with pytest.raises(ValueError):
+        SupabaseStorage._page_query(query, "first_applied", 50, ["2024-01-02", None])
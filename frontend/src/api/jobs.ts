@@ -1,4 +1,4 @@
-import type { Job } from '../types';
+import type { Dashboard, Job } from '../types';
 
 export async function fetchJobs(): Promise<Job[]> {
   const response = await fetch("http://localhost:8000/jobs");
@@ -8,6 +8,15 @@ export async function fetchJobs(): Promise<Job[]> {
   return response.json();
 }
 
+// Aggregate counts are computed by the backend, so they cover every job
+export async function fetchDashboard(): Promise<Dashboard> {
+  const response = await fetch("http://localhost:8000/dashboard");
+  if (!response.ok) {
+    throw new Error("Failed to fetch dashboard");
+  }
+  return response.json();
+}
+
 export async function deleteJob(jobId: string): Promise<void> {
   const response = await fetch(`http://localhost:8000/jobs/${jobId}`, {
     method: 'DELETE'
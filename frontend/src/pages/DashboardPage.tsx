@@ -1,8 +1,8 @@
 import { useEffect, useState } from "react";
 import { useLocation, useNavigate } from "react-router-dom";
 import { JobCard } from "../components/JobCard";
-import { fetchJobs } from "../api/jobs";
-import type { Job } from "../types";
+import { fetchDashboard } from "../api/jobs";
+import type { DashboardStats, Job } from "../types";
 
 type DashboardPageProps = {
   accessToken: string | null;
@@ -11,6 +11,7 @@ type DashboardPageProps = {
 
 export default function DashboardPage({ accessToken, onLogout }: DashboardPageProps) {
   const [jobs, setJobs] = useState<Job[]>([]);
+  const [stats, setStats] = useState<DashboardStats | null>(null);
   const [loading, setLoading] = useState(false);
   const [refreshing, setRefreshing] = useState(false);
   const [noUpdates, setNoUpdates] = useState(false);
@@ -36,10 +37,11 @@ export default function DashboardPage({ accessToken, onLogout }: DashboardPagePr
 
         try {
             setLoading(true);
-            const jobsData = await fetchJobs();
-            setJobs(jobsData);
+            const dashboard = await fetchDashboard();
+            setJobs(dashboard.jobs);
+            setStats(dashboard.stats);
             
-            if (jobsData.length === 0) {
+            if (dashboard.stats.total_applications === 0) {
                 setNoUpdates(true);
             }
         } catch (error) {
@@ -94,10 +96,11 @@ export default function DashboardPage({ accessToken, onLogout }: DashboardPagePr
 
         if (!controller.signal.aborted) {
           setLoadingMessage("Fetching your job applications...");
-          const jobsData = await fetchJobs();
-          setJobs(jobsData);
+          const dashboard = await fetchDashboard();
+          setJobs(dashboard.jobs);
+          setStats(dashboard.stats);
 
-          if (jobsData.length === 0) {
+          if (dashboard.stats.total_applications === 0) {
             setNoUpdates(true);
           }
         }
@@ -173,11 +176,12 @@ export default function DashboardPage({ accessToken, onLogout }: DashboardPagePr
 
     // Always try to fetch existing jobs, even if search was aborted
     try {
-        const prevCount = jobs.length;
-        const newJobs = await fetchJobs();
-        setJobs(newJobs);
+        const prevCount = stats?.total_applications ?? jobs.length;
+        const dashboard = await fetchDashboard();
+        setJobs(dashboard.jobs);
+        setStats(dashboard.stats);
 
-        if (newJobs.length === prevCount) {
+        if (dashboard.stats.total_applications === prevCount) {
             setNoUpdates(true);
         }
     } catch (error) {
@@ -189,8 +193,14 @@ export default function DashboardPage({ accessToken, onLogout }: DashboardPagePr
     }
   };
 
-  const handleJobDelete = (deletedJobId: string) => {
+  const handleJobDelete = async (deletedJobId: string) => {
     setJobs(jobs.filter(job => job.id !== deletedJobId));
+    try {
+      const dashboard = await fetchDashboard();
+      setStats(dashboard.stats);
+    } catch (error) {
+      console.error("Failed to refresh dashboard stats:", error);
+    }
   };
 
   return (
@@ -224,6 +234,20 @@ export default function DashboardPage({ accessToken, onLogout }: DashboardPagePr
       </header>
 
       <main className="max-w-7xl mx-auto px-4 py-8">
+        {stats && stats.total_applications > 0 && !loading && !refreshing && (
+          <div className="flex flex-wrap justify-center gap-4 mb-8">
+            <div className="px-5 py-3 bg-white rounded-xl shadow-sm text-center">
+              <p className="text-2xl font-bold text-gray-900">{stats.total_applications}</p>
+              <p className="text-sm text-gray-500">Applications</p>
+            </div>
+            {Object.entries(stats.status_counts).map(([status, count]) => (
+              <div key={status} className="px-5 py-3 bg-white rounded-xl shadow-sm text-center">
+                <p className="text-2xl font-bold text-gray-900">{count}</p>
+                <p className="text-sm text-gray-500 capitalize">{status}</p>
+              </div>
+            ))}
+          </div>
+        )}
         {loading || refreshing ? (
           <div className="text-center space-y-4">
             <div className="flex items-center justify-center gap-3">
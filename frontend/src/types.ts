@@ -16,3 +16,16 @@ export interface JobUpdate {
   received_at: string;
 }
 
+
+export interface DashboardStats {
+  total_applications: number;
+  status_counts: Record<string, number>;
+  weekly_applications: Record<string, number>;
+  stage_reach: Record<string, number>;
+  transitions: Record<string, number>;
+}
+
+export interface Dashboard {
+  stats: DashboardStats;
+  jobs: Job[];
+}